@@ -0,0 +1,57 @@
+#checkout of a large tree into an empty working tree, writing files in order and on a thread pool
+#usage: python -m py_git.benchmarks.bench_checkout --files 50000
+import os
+import time
+import argparse
+import tempfile
+import py_git.git as git
+
+def timed_checkout(branch: str, jobs: int) -> float:
+    git.object_cache.shared.clear()
+    start = time.perf_counter()
+    git.checkout(branch, "", jobs)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--size", type=int, default=4096, help="bytes per file")
+    parser.add_argument("--jobs", type=int, default=8, help="threads for the parallel checkout, 0 uses one per core")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            git.init()
+            names = [f"dir{i % 200}/sub{i % 11}/file{i}.txt" for i in range(args.files)]
+            for i, name in enumerate(names):
+                os.makedirs(os.path.dirname(name), exist_ok=True)
+                with open(name, "wb") as file:
+                    file.write(f"{i:08}".encode() * (args.size // 8))
+            git.update_cache_bulk(names, 0)
+
+            delimiter = '\x1F'
+            full = git.write_object("commit", f"tree {git.write_tree()}{delimiter}parent {delimiter}author a <a> 0 +0000{delimiter}commiter a <a> 0 +0000{delimiter}\nfull".encode())
+            empty = git.write_object("commit", f"tree {git.write_object('tree', b'')}{delimiter}parent {delimiter}author a <a> 0 +0000{delimiter}commiter a <a> 0 +0000{delimiter}\nempty".encode())
+            for branch, commit in [("full", full), ("empty", empty)]:
+                with open(f".git/refs/heads/{branch}", "w") as file:
+                    file.write(commit)
+            git.checkout("full")
+
+            results = []
+            for label in ["loose", "packed"]:
+                if label == "packed":
+                    git.repack(True, 0)
+                for jobs in [1, args.jobs]:
+                    git.checkout("empty")
+                    results.append((label, jobs, timed_checkout("full", jobs)))
+        finally:
+            os.chdir(cwd)
+
+    print(f"files: {args.files} of {args.size} bytes")
+    for label, jobs, seconds in results:
+        print(f"{label} objects, jobs={jobs or 'default'}: {seconds:.2f}s")
+
+if __name__ == "__main__":
+    main()
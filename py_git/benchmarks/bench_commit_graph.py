@@ -0,0 +1,90 @@
+#history walks over a long synthetic history, reading commit objects against the commit graph
+#usage: python -m py_git.benchmarks.bench_commit_graph --commits 100000
+import os
+import time
+import argparse
+import tempfile
+import py_git.git as git
+import py_git.utils as utils
+import py_git.commit_graph as commit_graph
+
+def make_history(count: int, merge_every: int) -> str:
+    #a first parent chain with a side commit merged back in every merge_every commits
+    delimiter = '\x1F'
+    tree_sha = git.write_object("tree", b"")
+    author = "Bench <bench@example.com>"
+    head = ""
+    for i in range(count):
+        parents = head
+        if merge_every and head and i % merge_every == 0:
+            side = git.write_object("commit", f"tree {tree_sha}{delimiter}parent {head}{delimiter}author {author} {i} +0000{delimiter}commiter {author} {i} +0000{delimiter}\nside {i}".encode())
+            parents = f"{head} {side}"
+        head = git.write_object("commit", f"tree {tree_sha}{delimiter}parent {parents}{delimiter}author {author} {i} +0000{delimiter}commiter {author} {i} +0000{delimiter}\ncommit {i}".encode())
+    with open(".git/refs/heads/master", "w") as file:
+        file.write(head)
+    return head
+
+def walk(head: str) -> int:
+    #every commit reachable from head, all parents followed
+    seen = {head}
+    stack = [head]
+    while stack:
+        for parent in utils.extract_parents_from_commit(stack.pop()):
+            if parent not in seen:
+                seen.add(parent)
+                stack.append(parent)
+    return len(seen)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=100000)
+    parser.add_argument("--merge-every", type=int, default=50)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            git.init()
+            start = time.perf_counter()
+            head = make_history(args.commits, args.merge_every)
+            create_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            count = walk(head)
+            loose_time = time.perf_counter() - start
+
+            git.repack(True, 0)
+            git.object_cache.shared.clear()
+            start = time.perf_counter()
+            walk(head)
+            packed_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            git.update_commit_graph()
+            build_time = time.perf_counter() - start
+            graph_size = os.path.getsize(git.COMMIT_GRAPH)
+
+            start = time.perf_counter()
+            walk(head)
+            graph_time = time.perf_counter() - start
+
+            #what commit_tree pays to append one commit to the existing graph
+            delimiter = '\x1F'
+            child = git.write_object("commit", f"tree {utils.extract_tree_from_commit(head)}{delimiter}parent {head}{delimiter}author a <a> 0 +0000{delimiter}commiter a <a> 0 +0000{delimiter}\nnext".encode())
+            start = time.perf_counter()
+            git.update_commit_graph([child], True)
+            append_time = time.perf_counter() - start
+            assert commit_graph.get_graph(git.COMMIT_GRAPH).count == count + 1
+        finally:
+            os.chdir(cwd)
+
+    print(f"commits: {count} (created in {create_time:.1f}s)")
+    print(f"walk, loose commits:  {loose_time:.2f}s")
+    print(f"walk, packed commits: {packed_time:.2f}s")
+    print(f"write commit graph:   {build_time:.2f}s ({graph_size / 1024 / 1024:.1f} MB)")
+    print(f"walk, commit graph:   {graph_time:.2f}s")
+    print(f"append one commit:    {append_time * 1e3:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#diffing many changed files in process against temp files and a diff -u subprocess per file
+#usage: python -m py_git.benchmarks.bench_diff --files 1000 --lines 200
+import os
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import py_git.xdiff as xdiff
+
+def subprocess_diff(a: bytes, b: bytes, filename1: str, filename2: str) -> str:
+    #the old path: both blobs written to temp files and compared by diff -u
+    with tempfile.NamedTemporaryFile(mode="w+b", dir=".") as tempA, tempfile.NamedTemporaryFile(mode="w+b", dir=".") as tempB:
+        tempA.write(a)
+        tempB.write(b)
+        tempA.flush()
+        tempB.flush()
+        output = subprocess.run(["diff", "-u", tempA.name, tempB.name], stdout=subprocess.PIPE, text=True).stdout
+    lines = output.splitlines()
+    header = f"diff --git a/{filename1} b/{filename2}\n-- a/{filename1}\n++ b/{filename2}\n"
+    return (header + "\n".join(lines[2:])).rstrip("\n")
+
+def make_pair(lines: int, edits: int, rng: random.Random):
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa"]
+    old = [" ".join(rng.choice(words) for __ in range(6)) + "\n" for __ in range(lines)]
+    new = old[:]
+    for __ in range(edits):
+        i = rng.randrange(len(new))
+        if rng.random() < 0.5:
+            new[i] = "changed " + new[i]
+        else:
+            new.insert(i, "inserted line\n")
+    return ("".join(old).encode(), "".join(new).encode())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pairs = [make_pair(args.lines, args.edits, rng) for __ in range(args.files)]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            start = time.perf_counter()
+            old_lines = sum(len(subprocess_diff(a, b, f"f{i}", f"f{i}").splitlines()) for i, (a, b) in enumerate(pairs))
+            subprocess_time = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    start = time.perf_counter()
+    new_lines = sum(len(xdiff.unified_diff(a, b, f"f{i}", f"f{i}").splitlines()) for i, (a, b) in enumerate(pairs))
+    xdiff_time = time.perf_counter() - start
+
+    print(f"files: {args.files} of {args.lines} lines, {args.edits} edits each")
+    print(f"diff -u subprocess: {subprocess_time:.2f}s ({old_lines} lines of output)")
+    print(f"xdiff in process:   {xdiff_time:.2f}s ({new_lines} lines of output)")
+
+if __name__ == "__main__":
+    main()
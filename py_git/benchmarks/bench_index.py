@@ -0,0 +1,75 @@
+#index operations at growing sizes, bisect lookups against the old linear scan
+#usage: python -m py_git.benchmarks.bench_index --sizes 10000 100000 1000000
+import os
+import time
+import random
+import argparse
+import tempfile
+import py_git.cache as cache
+
+def make_cache(n: int, rng: random.Random) -> cache.Cache:
+    entries = []
+    for i in range(n):
+        path = f"dir{i % 97}/sub{i % 13}/file{i:07}.txt"
+        entries.append(cache.CacheEntry("blob", 0o100644, f"{rng.getrandbits(160):040x}", path))
+    entries.sort(key=lambda entry: entry.file_path)
+    current_cache = cache.Cache()
+    current_cache.set_contents(entries)
+    return current_cache
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for __ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def linear_find(current_cache: cache.Cache, file_path: str):
+    for i, entry in enumerate(current_cache.contents):
+        if entry.file_path == file_path:
+            return i
+    return -1
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'entries':>9} {'linear find':>12} {'bisect find':>12} {'insert':>9} {'remove':>9} {'prefix':>9} {'bulk rm 1%':>11} {'save':>8} {'load':>8} {'lookup':>8}")
+    for n in args.sizes:
+        current_cache = make_cache(n, rng)
+        paths = current_cache.paths[:]
+
+        linear = timed(lambda: linear_find(current_cache, rng.choice(paths)), 5)
+        bisect_find = timed(lambda: current_cache.find(rng.choice(paths)), 10000)
+
+        counter = iter(range(10**9))
+        insert = timed(lambda: current_cache.insert(cache.CacheEntry("blob", 0, "0" * 40, f"dir{rng.randrange(97)}/new{next(counter)}.txt")), 1000)
+        remove = timed(lambda: current_cache.remove(current_cache.paths[rng.randrange(len(current_cache.paths))]), 1000)
+        prefix = timed(lambda: current_cache.entries_under(f"dir{rng.randrange(97)}/sub{rng.randrange(13)}"), 1000)
+
+        doomed = rng.sample(current_cache.paths, len(current_cache.paths) // 100)
+        start = time.perf_counter()
+        current_cache.remove_many(doomed)
+        bulk = (time.perf_counter() - start) * 1e3
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                os.makedirs(".git")
+                cache_handler = cache.CacheHandeler()
+                start = time.perf_counter()
+                cache_handler.save_cache(current_cache)
+                save = (time.perf_counter() - start) * 1e3
+                start = time.perf_counter()
+                cache_handler.load_cache()
+                load = (time.perf_counter() - start) * 1e3
+                lookup = timed(lambda: cache_handler.lookup(rng.choice(current_cache.paths)), 200)
+            finally:
+                os.chdir(cwd)
+
+        print(f"{n:>9} {linear:>10.0f}us {bisect_find:>10.2f}us {insert:>7.1f}us {remove:>7.1f}us {prefix:>7.1f}us {bulk:>9.1f}ms {save:>6.0f}ms {load:>6.0f}ms {lookup:>6.0f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#repo size and repack time for many revisions of one large file
+#usage: python -m py_git.benchmarks.bench_repack --revisions 1000 --size 10
+import os
+import time
+import random
+import argparse
+import tempfile
+import py_git.git as git
+import py_git.models as models
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def make_lines(count: int, rng: random.Random):
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa", "lambda", "sigma"]
+    return [(" ".join(rng.choice(words) for __ in range(8)) + f" {i}\n").encode() for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--revisions", type=int, default=1000)
+    parser.add_argument("--size", type=float, default=10, help="file size in MB")
+    parser.add_argument("--edits", type=int, default=5, help="lines changed per revision")
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    lines = make_lines(int(args.size * 1024 * 1024 / 60), rng)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            git.init()
+            shas = []
+            start = time.perf_counter()
+            for revision in range(args.revisions):
+                for __ in range(args.edits):
+                    lines[rng.randrange(len(lines))] = f"revision {revision} {rng.random()}\n".encode()
+                with open("asset.txt", "wb") as file:
+                    file.writelines(lines)
+                shas.append(git.hash_file("asset.txt")[1])
+            hash_time = time.perf_counter() - start
+            loose_size = directory_size(".git/objects")
+
+            start = time.perf_counter()
+            count, __ = git.repack(True, args.window, args.depth)
+            repack_time = time.perf_counter() - start
+            pack_size = directory_size(".git/objects")
+
+            start = time.perf_counter()
+            for sha1 in shas:
+                fileObject = models.ByteFile(None, None, None)
+                git.cat_file(sha1, fileObject)
+            read_time = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    mb = 1024 * 1024
+    print(f"revisions: {args.revisions} of {args.size} MB, {args.edits} lines changed each")
+    print(f"hash-object: {hash_time:.2f}s")
+    print(f"loose size:  {loose_size / mb:.1f} MB")
+    print(f"repack -a:   {repack_time:.2f}s ({count} objects, window {args.window}, depth {args.depth})")
+    print(f"pack size:   {pack_size / mb:.1f} MB")
+    print(f"read all:    {read_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#status over a large checkout, clean and with a few files touched or modified
+#usage: python -m py_git.benchmarks.bench_status --files 10000
+import io
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+import py_git.git as git
+
+def timed_status(jobs: int) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        git.status(jobs)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=2048, help="bytes per file")
+    parser.add_argument("--changed", type=float, default=1, help="percent of files touched or modified")
+    parser.add_argument("--jobs", type=int, default=0)
+    parser.add_argument("--untracked-dirs", type=int, default=2000, help="directories of untracked files added at the end")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            git.init()
+            names = [f"dir{i % 100}/sub{i % 7}/file{i}.txt" for i in range(args.files)]
+            for i, name in enumerate(names):
+                os.makedirs(os.path.dirname(name), exist_ok=True)
+                with open(name, "wb") as file:
+                    file.write(f"{i:08}".encode() * (args.size // 8))
+            #stat data older than the index, so nothing is racily clean
+            long_ago = time.time() - 3600
+            for name in names:
+                os.utime(name, (long_ago, long_ago))
+            git.update_cache_bulk(names)
+
+            delimiter = '\x1F'
+            commit = git.write_object("commit", f"tree {git.write_tree()}{delimiter}parent {delimiter}author a <a> 0 +0000{delimiter}commiter a <a> 0 +0000{delimiter}\nbench".encode())
+            with open(".git/refs/heads/master", "w") as file:
+                file.write(commit)
+
+            clean = timed_status(args.jobs)
+
+            step = max(1, int(100 / args.changed))
+            changed = names[::step]
+            for name in changed:
+                os.utime(name, (long_ago + 60, long_ago + 60))
+            touched = timed_status(args.jobs)
+            refreshed = timed_status(args.jobs)
+
+            for name in changed:
+                with open(name, "r+b") as file:
+                    file.write(b"X")
+            modified = timed_status(args.jobs)
+
+            #listing every directory, then the same walk served by the untracked cache
+            untracked_dirs = [f"untracked{i % 100}/dir{i}" for i in range(args.untracked_dirs)]
+            for dir_path in untracked_dirs:
+                os.makedirs(dir_path)
+                with open(os.path.join(dir_path, "new.txt"), "wb") as file:
+                    file.write(b"new")
+            for dir_path in ["."] + sorted({os.path.dirname(x) for x in names + untracked_dirs}) + untracked_dirs:
+                os.utime(dir_path, (long_ago, long_ago))
+            listed = timed_status(args.jobs)
+            cached = timed_status(args.jobs)
+        finally:
+            os.chdir(cwd)
+
+    print(f"files: {args.files} of {args.size} bytes, {len(changed)} touched or modified")
+    print(f"clean:                 {clean * 1e3:.0f}ms")
+    print(f"touched, same content: {touched * 1e3:.0f}ms")
+    print(f"after the refresh:     {refreshed * 1e3:.0f}ms")
+    print(f"modified, same size:   {modified * 1e3:.0f}ms")
+    print(f"{args.untracked_dirs} untracked dirs, listed: {listed * 1e3:.0f}ms")
+    print(f"{args.untracked_dirs} untracked dirs, cached: {cached * 1e3:.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#update-cache scaling with the number of hashing processes
+#usage: python -m py_git.benchmarks.bench_update_cache --files 2000 --size 256
+import os
+import time
+import random
+import argparse
+import shutil
+import tempfile
+import py_git.git as git
+import py_git.cache as cache
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=256, help="file size in KB")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            file_paths = []
+            for i in range(args.files):
+                file_path = f"dir{i % 50}/file{i}.bin"
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, "wb") as file:
+                    file.write(rng.randbytes(args.size * 1024 // 2) * 2)
+                file_paths.append(file_path)
+
+            baseline = None
+            serial_time = None
+            print(f"{args.files} files of {args.size} KB, {os.cpu_count()} cores")
+            for jobs in args.jobs:
+                shutil.rmtree(".git", ignore_errors=True)
+                git.init()
+                start = time.perf_counter()
+                git.update_cache_bulk(file_paths, jobs)
+                elapsed = time.perf_counter() - start
+                entries = [(x.file_path, x.sha1) for x in cache.CacheHandeler().load_cache().contents]
+                if baseline is None:
+                    baseline, serial_time = entries, elapsed
+                same = "identical" if entries == baseline else "DIFFERENT"
+                print(f"jobs {jobs:>3}: {elapsed:6.2f}s  speedup {serial_time / elapsed:4.1f}x  index {same}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,47 @@
 import os
+import mmap
+import bisect
+import struct
 import pickle
-from typing import List
+import hashlib
+import tempfile
+from typing import Dict, List, Set, Tuple
 import operator
 
 git_dir = ".git"
 SIGNATURE = "HAO'S GIT CLONE"
 
+#binary index layout: header, one fixed width record per entry sorted by path,
+#the packed utf-8 paths the records point into, optional extensions (4 byte
+#signature, 4 byte length, data), then a sha1 of everything before it
+INDEX_SIGNATURE = b"PGIX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct(">4sIII")
+#ctime_ns, mtime_ns, dev, ino, mode, size, flags, path offset, path length, binary sha1
+INDEX_ENTRY = struct.Struct(">qqQQIQHIH20s")
+CHECKSUM_SIZE = 20
+EXTENSION_HEADER = struct.Struct(">4sI")
+#cached tree extension: per directory its path length and path, entry count and tree sha1
+TREE_EXTENSION = b"TREE"
+TREE_RECORD = struct.Struct(">H")
+TREE_VALUE = struct.Struct(">I20s")
+#fsmonitor extension: token length and token, then the nul separated paths to look at again
+FSMONITOR_EXTENSION = b"FSMN"
+FSMONITOR_RECORD = struct.Struct(">H")
+#untracked cache extension: stat of .git/info/exclude, then per directory its path length
+#and path, the stat data of the directory and of its .gitignore, the number of file and of
+#subdirectory names and their byte length, then those names nul terminated
+UNTRACKED_EXTENSION = b"UNTR"
+UNTRACKED_HEADER = struct.Struct(">qQ")
+UNTRACKED_RECORD = struct.Struct(">H")
+UNTRACKED_VALUE = struct.Struct(">qQqQIII")
+TYPE_FLAGS = {"blob": 0, "tree": 1}
+TYPE_NAMES = {flag: name for name, flag in TYPE_FLAGS.items()}
+TYPE_MASK = 0x0003
+#the entry is not in the working tree, set on the "tree" entries that stand for a
+#directory left out by sparse checkout, whose paths end in "/"
+SKIP_WORKTREE = 0x4000
+
 class Header(): 
     def __init__(self) -> None:
         self.numEntries = 0 
@@ -15,19 +51,343 @@ class Header():
         return f'Header(numEntries={self.numEntries})'
 
 class CacheEntry():
-    def __init__(self, _type, mode, sha1, file_path) -> None:
+    def __init__(self, _type, mode, sha1, file_path, ctime_ns=0, mtime_ns=0, dev=0, ino=0, size=0, flags=0) -> None:
         self.sha1 = sha1
         self.type = _type
         self.mode = mode
         self.file_path = file_path
+        self.ctime_ns = ctime_ns
+        self.mtime_ns = mtime_ns
+        self.dev = dev
+        self.ino = ino
+        self.size = size
+        self.flags = flags
 
     def __str__(self): 
         return f'CacheEntry(type={self.type} file_path={self.file_path} sha1={self.sha1})'
 
+class DirListing(): 
+    """Names a directory held when it was last listed, the files and subdirectories not ignored."""
+    def __init__(self, mtime_ns: int, ino: int, ignore_stat: Tuple[int, int], files: List[str], dirs: List[str]) -> None:
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+        self.ignore_stat = ignore_stat
+        self.files = files
+        self.dirs = dirs
+
+class UntrackedCache(): 
+    """Directory listings kept across status runs, reused while a directory's mtime is unchanged."""
+    def __init__(self) -> None:
+        #(mtime_ns, size) of .git/info/exclude, any change drops every listing
+        self.exclude_stat: Tuple[int, int] = (0, 0)
+        #directory path, "" or ending in "/" -> its listing
+        self.dirs: Dict[str, DirListing] = {}
+
+def fill_stat(entry: CacheEntry, st: os.stat_result) -> None: 
+    entry.mode = st.st_mode
+    entry.ctime_ns = st.st_ctime_ns
+    entry.mtime_ns = st.st_mtime_ns
+    entry.dev = st.st_dev
+    entry.ino = st.st_ino
+    entry.size = st.st_size
+
+def stat_matches(entry: CacheEntry, st: os.stat_result) -> bool: 
+    return (entry.mtime_ns == st.st_mtime_ns and entry.ctime_ns == st.st_ctime_ns and entry.size == st.st_size 
+            and entry.ino == st.st_ino and entry.dev == st.st_dev)
+
+def is_racy(entry: CacheEntry, index_mtime_ns: int) -> bool: 
+    #a file changed in the same second the index was written can keep identical
+    #stat data on coarse timestamp filesystems, so its content has to be checked
+    return entry.mtime_ns >= (index_mtime_ns // 10**9) * 10**9
+
 class Cache: 
+    """Index entries kept sorted by path, with a parallel path list for bisect lookups."""
     def __init__(self) -> None:
         self.header: Header = Header()
         self.contents: List[CacheEntry] = []
+        self.paths: List[str] = []
+        #directory path -> (tree sha1, number of entries below it), "" is the root
+        self.tree_cache: Dict[str, Tuple[str, int]] = {}
+        #fsmonitor token of the last status, and the paths that did not match the index then
+        self.fsmonitor_token = ""
+        self.fsmonitor_dirty: Set[str] = set()
+        self.untracked_cache = UntrackedCache()
+
+    def invalidate_tree(self, file_path: str) -> None: 
+        #only the directories containing file_path can have a different tree now,
+        #and the entry may no longer match the working tree the fsmonitor token vouches for
+        if self.fsmonitor_token: 
+            self.fsmonitor_dirty.add(file_path)
+        parts = file_path.split("/")[:-1]
+        for depth in range(len(parts) + 1): 
+            self.tree_cache.pop("/".join(parts[:depth]), None)
+
+    def set_contents(self, entries: List[CacheEntry]) -> None: 
+        #entries must already be sorted by path, cached trees are left to the caller
+        self.contents = entries
+        self.paths = [entry.file_path for entry in entries]
+        self.header.numEntries = len(entries)
+
+    def find(self, file_path: str) -> int: 
+        i = bisect.bisect_left(self.paths, file_path)
+        if i < len(self.paths) and self.paths[i] == file_path: 
+            return i
+        return -1
+
+    def get(self, file_path: str): 
+        i = self.find(file_path)
+        return self.contents[i] if i != -1 else None
+
+    def __contains__(self, file_path: str) -> bool: 
+        return self.find(file_path) != -1
+
+    def insert(self, entry: CacheEntry) -> bool: 
+        #replaces an entry with the same path, returns True when the path is new
+        self.invalidate_tree(entry.file_path)
+        i = bisect.bisect_left(self.paths, entry.file_path)
+        if i < len(self.paths) and self.paths[i] == entry.file_path: 
+            self.contents[i] = entry
+            return False
+        self.contents.insert(i, entry)
+        self.paths.insert(i, entry.file_path)
+        self.header.numEntries += 1
+        return True
+
+    def remove(self, file_path: str) -> bool: 
+        i = self.find(file_path)
+        if i == -1: 
+            return False
+        del self.contents[i]
+        del self.paths[i]
+        self.header.numEntries -= 1
+        self.invalidate_tree(file_path)
+        return True
+
+    def prefix_range(self, dir_path: str) -> Tuple[int, int]: 
+        #every path under dir_path sorts between "dir_path/" and "dir_path0"
+        #since "0" is the character right after "/"
+        dir_path = dir_path.rstrip("/")
+        if not dir_path: 
+            return (0, len(self.paths))
+        lo = bisect.bisect_left(self.paths, dir_path + "/")
+        hi = bisect.bisect_left(self.paths, dir_path + "0", lo)
+        return (lo, hi)
+
+    def entries_under(self, dir_path: str) -> List[CacheEntry]: 
+        lo, hi = self.prefix_range(dir_path)
+        return self.contents[lo:hi]
+
+    def remove_many(self, file_paths) -> int: 
+        #one filtering pass no matter how many paths are removed
+        targets = set(file_paths)
+        kept = [entry for entry in self.contents if entry.file_path not in targets]
+        removed = len(self.contents) - len(kept)
+        if removed: 
+            self.set_contents(kept)
+            for file_path in targets: 
+                self.invalidate_tree(file_path)
+        return removed
+
+    def remove_prefix(self, dir_path: str) -> int: 
+        dir_path = dir_path.rstrip("/")
+        lo, hi = self.prefix_range(dir_path)
+        del self.contents[lo:hi]
+        del self.paths[lo:hi]
+        self.header.numEntries = len(self.contents)
+        if hi > lo: 
+            self.invalidate_tree(dir_path + "/")
+            #the cached trees of its subdirectories went with their entries
+            for cached_dir in [x for x in self.tree_cache if x.startswith(dir_path + "/")]: 
+                del self.tree_cache[cached_dir]
+        return hi - lo
+
+def pack_entry(entry: CacheEntry, path_offset: int, path_length: int) -> bytes: 
+    flags = (entry.flags & ~TYPE_MASK) | TYPE_FLAGS.get(entry.type, 0)
+    binsha = bytes.fromhex(entry.sha1) if entry.sha1 else bytes(20)
+    return INDEX_ENTRY.pack(entry.ctime_ns, entry.mtime_ns, entry.dev, entry.ino, entry.mode, entry.size, flags, path_offset, path_length, binsha)
+
+def unpack_entry(record, file_path: str) -> CacheEntry: 
+    ctime_ns, mtime_ns, dev, ino, mode, size, flags, __, __, binsha = record
+    return CacheEntry(TYPE_NAMES[flags & TYPE_MASK], mode, binsha.hex(), file_path, ctime_ns, mtime_ns, dev, ino, size, flags & ~TYPE_MASK)
+
+def serialize_cache(cache: Cache) -> bytes: 
+    records = []
+    paths = []
+    path_offset = 0
+    for entry in cache.contents: 
+        encoded_path = entry.file_path.encode("utf-8")
+        records.append(pack_entry(entry, path_offset, len(encoded_path)))
+        paths.append(encoded_path)
+        path_offset += len(encoded_path)
+
+    header = INDEX_HEADER.pack(INDEX_SIGNATURE, INDEX_VERSION, len(cache.contents), path_offset)
+    parts = [header, b"".join(records), b"".join(paths)]
+    if cache.tree_cache: 
+        tree_data = serialize_tree_cache(cache.tree_cache)
+        parts.append(EXTENSION_HEADER.pack(TREE_EXTENSION, len(tree_data)) + tree_data)
+    if cache.untracked_cache.dirs: 
+        untracked_data = serialize_untracked_cache(cache.untracked_cache)
+        parts.append(EXTENSION_HEADER.pack(UNTRACKED_EXTENSION, len(untracked_data)) + untracked_data)
+    if cache.fsmonitor_token: 
+        fsmonitor_data = serialize_fsmonitor(cache.fsmonitor_token, cache.fsmonitor_dirty)
+        parts.append(EXTENSION_HEADER.pack(FSMONITOR_EXTENSION, len(fsmonitor_data)) + fsmonitor_data)
+    data = b"".join(parts)
+    return data + hashlib.sha1(data).digest()
+
+def serialize_tree_cache(tree_cache: Dict[str, Tuple[str, int]]) -> bytes: 
+    parts = []
+    for dir_path in sorted(tree_cache): 
+        sha1, count = tree_cache[dir_path]
+        encoded_path = dir_path.encode("utf-8")
+        parts.append(TREE_RECORD.pack(len(encoded_path)) + encoded_path + TREE_VALUE.pack(count, bytes.fromhex(sha1)))
+    return b"".join(parts)
+
+def parse_tree_cache(data) -> Dict[str, Tuple[str, int]]: 
+    tree_cache = {}
+    offset = 0
+    while offset < len(data): 
+        path_length, = TREE_RECORD.unpack_from(data, offset)
+        offset += TREE_RECORD.size
+        dir_path = bytes(data[offset:offset + path_length]).decode("utf-8")
+        offset += path_length
+        count, binsha = TREE_VALUE.unpack_from(data, offset)
+        offset += TREE_VALUE.size
+        tree_cache[dir_path] = (binsha.hex(), count)
+    return tree_cache
+
+def serialize_untracked_cache(untracked_cache: UntrackedCache) -> bytes: 
+    parts = [UNTRACKED_HEADER.pack(*untracked_cache.exclude_stat)]
+    for dir_path in sorted(untracked_cache.dirs): 
+        listing = untracked_cache.dirs[dir_path]
+        encoded_path = dir_path.encode("utf-8", "surrogateescape")
+        names = "".join(name + "\0" for name in listing.files + listing.dirs).encode("utf-8", "surrogateescape")
+        parts.append(UNTRACKED_RECORD.pack(len(encoded_path)) + encoded_path)
+        parts.append(UNTRACKED_VALUE.pack(listing.mtime_ns, listing.ino, *listing.ignore_stat, len(listing.files), len(listing.dirs), len(names)))
+        parts.append(names)
+    return b"".join(parts)
+
+def parse_untracked_cache(data) -> UntrackedCache: 
+    untracked_cache = UntrackedCache()
+    untracked_cache.exclude_stat = UNTRACKED_HEADER.unpack_from(data, 0)
+    offset = UNTRACKED_HEADER.size
+    while offset < len(data): 
+        path_length, = UNTRACKED_RECORD.unpack_from(data, offset)
+        offset += UNTRACKED_RECORD.size
+        dir_path = bytes(data[offset:offset + path_length]).decode("utf-8", "surrogateescape")
+        offset += path_length
+        mtime_ns, ino, ignore_mtime_ns, ignore_size, file_count, __, names_length = UNTRACKED_VALUE.unpack_from(data, offset)
+        offset += UNTRACKED_VALUE.size
+        names = bytes(data[offset:offset + names_length]).decode("utf-8", "surrogateescape").split("\0")[:-1]
+        offset += names_length
+        untracked_cache.dirs[dir_path] = DirListing(mtime_ns, ino, (ignore_mtime_ns, ignore_size), names[:file_count], names[file_count:])
+    return untracked_cache
+
+def serialize_fsmonitor(token: str, dirty: Set[str]) -> bytes: 
+    encoded_token = token.encode("utf-8")
+    paths = "\0".join(sorted(dirty)).encode("utf-8", "surrogateescape")
+    return FSMONITOR_RECORD.pack(len(encoded_token)) + encoded_token + paths
+
+def parse_fsmonitor(data) -> Tuple[str, Set[str]]: 
+    token_length, = FSMONITOR_RECORD.unpack_from(data, 0)
+    token = bytes(data[FSMONITOR_RECORD.size:FSMONITOR_RECORD.size + token_length]).decode("utf-8")
+    paths = bytes(data[FSMONITOR_RECORD.size + token_length:]).decode("utf-8", "surrogateescape")
+    return (token, set(paths.split("\0")) if paths else set())
+
+def merge_entries(cache: Cache, entries: List[CacheEntry]) -> Tuple[int, int]: 
+    #one merge pass of two sorted lists, staged entries replace existing ones
+    #returns the number of added and of changed entries
+    staged = {entry.file_path: entry for entry in entries}
+    staged_sorted = sorted(staged.values(), key=lambda entry: entry.file_path)
+    merged = []
+    added = changed = 0
+    i = 0
+    contents = cache.contents
+    for entry in staged_sorted: 
+        while i < len(contents) and contents[i].file_path < entry.file_path: 
+            merged.append(contents[i])
+            i += 1
+        if i < len(contents) and contents[i].file_path == entry.file_path: 
+            if contents[i].sha1 != entry.sha1: 
+                changed += 1
+            i += 1
+        else: 
+            added += 1
+        merged.append(entry)
+    merged.extend(contents[i:])
+
+    cache.set_contents(merged)
+    for entry in staged_sorted: 
+        cache.invalidate_tree(entry.file_path)
+    return (added, changed)
+
+class IndexFile(): 
+    """Read-only view of a binary index through mmap, records are decoded on demand."""
+    def __init__(self, index_file: str) -> None:
+        with open(index_file, "rb") as file: 
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, self.count, path_table_size = INDEX_HEADER.unpack_from(self.map, 0)
+        if signature != INDEX_SIGNATURE or version != INDEX_VERSION: 
+            self.map.close()
+            raise ValueError(f"{index_file} is not a supported index")
+        self.path_table = INDEX_HEADER.size + INDEX_ENTRY.size * self.count
+        self.end = self.path_table + path_table_size
+
+    def verify(self) -> bool: 
+        data_end = len(self.map) - CHECKSUM_SIZE
+        with memoryview(self.map) as view, view[:data_end] as data: 
+            digest = hashlib.sha1(data).digest()
+        return digest == self.map[data_end:]
+
+    def extension(self, signature: bytes): 
+        offset = self.end
+        data_end = len(self.map) - CHECKSUM_SIZE
+        while offset + EXTENSION_HEADER.size <= data_end: 
+            current, length = EXTENSION_HEADER.unpack_from(self.map, offset)
+            offset += EXTENSION_HEADER.size
+            if current == signature: 
+                return self.map[offset:offset + length]
+            offset += length
+        return None
+
+    def record_at(self, i: int): 
+        return INDEX_ENTRY.unpack_from(self.map, INDEX_HEADER.size + INDEX_ENTRY.size * i)
+
+    def path_at(self, i: int, record=None) -> str: 
+        if record is None: 
+            record = self.record_at(i)
+        start = self.path_table + record[7]
+        return self.map[start:start + record[8]].decode("utf-8")
+
+    def entry_at(self, i: int) -> CacheEntry: 
+        record = self.record_at(i)
+        return unpack_entry(record, self.path_at(i, record))
+
+    def find(self, file_path: str) -> int: 
+        #binary search over the sorted records, only the probed paths are decoded
+        lo, hi = 0, self.count
+        while lo < hi: 
+            mid = (lo + hi) // 2
+            current = self.path_at(mid)
+            if current < file_path: 
+                lo = mid + 1
+            elif current > file_path: 
+                hi = mid
+            else: 
+                return mid
+        return -1
+
+    def entries(self) -> List[CacheEntry]: 
+        return [self.entry_at(i) for i in range(self.count)]
+
+    def close(self) -> None: 
+        self.map.close()
+
+    def __enter__(self): 
+        return self
+
+    def __exit__(self, *args) -> None: 
+        self.close()
 
 class CacheHandeler: 
     def __init__(self) -> None:
@@ -38,46 +398,75 @@ class CacheHandeler:
         if not os.path.exists(self.index_file): 
             self.initialize_cache()
 
+        if self.is_pickled(): 
+            self.migrate_pickled_cache()
+
+        with IndexFile(self.index_file) as index: 
+            if not index.verify(): 
+                raise ValueError(f"{self.index_file} is corrupt, checksum mismatch")
+            cache = Cache()
+            cache.set_contents(index.entries())
+            tree_data = index.extension(TREE_EXTENSION)
+            if tree_data is not None: 
+                cache.tree_cache = parse_tree_cache(tree_data)
+            untracked_data = index.extension(UNTRACKED_EXTENSION)
+            if untracked_data is not None: 
+                cache.untracked_cache = parse_untracked_cache(untracked_data)
+            fsmonitor_data = index.extension(FSMONITOR_EXTENSION)
+            if fsmonitor_data is not None: 
+                cache.fsmonitor_token, cache.fsmonitor_dirty = parse_fsmonitor(fsmonitor_data)
+        return cache
+
+    def lookup(self, file_path: str): 
+        #finds one entry without decoding the rest of the index
+        if not os.path.exists(self.index_file): 
+            return None
+        if self.is_pickled(): 
+            self.migrate_pickled_cache()
+
+        with IndexFile(self.index_file) as index: 
+            i = index.find(file_path)
+            if i == -1: 
+                return None
+            return index.entry_at(i)
+
+    def index_mtime_ns(self) -> int: 
+        if not os.path.exists(self.index_file): 
+            return 0
+        return os.stat(self.index_file).st_mtime_ns
+
+    def is_pickled(self) -> bool: 
         with open(self.index_file, "rb") as file: 
-            serialized_cache = file.read()
+            return file.read(len(INDEX_SIGNATURE)) != INDEX_SIGNATURE
 
-        cache = pickle.loads(serialized_cache)
-        return cache
+    def migrate_pickled_cache(self) -> None: 
+        #one time upgrade of indexes written by the old pickle based format
+        with open(self.index_file, "rb") as file: 
+            old_cache = pickle.load(file)
+
+        cache = Cache()
+        for old_entry in old_cache.contents: 
+            cache.insert(CacheEntry(old_entry.type, old_entry.mode, old_entry.sha1, old_entry.file_path))
+        self.save_cache(cache)
         
     def initialize_cache(self) -> None: 
-        cache = Cache()
-        serialized_cache = pickle.dumps(cache)
-        with open(self.index_file, "wb") as file: 
-            file.write(serialized_cache)
+        self.save_cache(Cache())
 
-    def insert_cache(self, _type, mode, sha1, file_path): 
+    def insert_cache(self, _type, mode, sha1, file_path, st: os.stat_result = None): 
         cache_entry = CacheEntry(_type, mode, sha1, file_path)
+        if st is not None: 
+            fill_stat(cache_entry, st)
         cache = self.load_cache()
-
-        if cache.header.numEntries == 0: 
-            cache.contents.append(cache_entry)
-            cache.header.numEntries += 1  
-            self.save_cache(cache)
-            return
-
-        #check if file is already in index 
-        for i, entry in enumerate(cache.contents): 
-            if file_path == entry.file_path: 
-                cache.contents[i] = cache_entry
-                self.save_cache(cache)
-                return
-                
-        #implement binary search here later
-        cache.contents.append(cache_entry)
-        cache.contents.sort(key=lambda entry: entry.file_path)
-        cache.header.numEntries += 1 
+        cache.insert(cache_entry)
         self.save_cache(cache)
-        return
 
     def save_cache(self, cache: Cache) -> None: 
-        with open(self.index_file, "wb") as file: 
-            serialized_cache = pickle.dumps(cache)
-            file.write(serialized_cache)
+        #written to a temp file and renamed, so a reader never maps a half written index
+        cache.header.numEntries = len(cache.contents)
+        fd, temp_path = tempfile.mkstemp(prefix="index_", dir=os.path.dirname(self.index_file))
+        with os.fdopen(fd, "wb") as file: 
+            file.write(serialize_cache(cache))
+        os.replace(temp_path, self.index_file)
 
     def printCache(self) -> None: 
         cache = self.load_cache()
@@ -86,44 +475,24 @@ class CacheHandeler:
             print(entry.file_path)
 
     def remove(self, file_path: str) -> None: 
+        #a directory path removes every entry below it, never the root, which is remove_all
+        if not file_path.strip("/"): 
+            return 0
         cache = self.load_cache()
-        for i, entry in enumerate(cache.contents): 
-            if entry.file_path == file_path: 
-                cache.contents.pop(i)
-                cache.header.numEntries -= 1 
-                self.save_cache(cache)
-                return 1
-        return 0
-                
+        removed = cache.remove(file_path) or cache.remove_prefix(file_path)
+        if not removed: 
+            return 0
+        self.save_cache(cache)
+        return 1
+
     def remove_all(self): 
         cache = self.load_cache()
         n = len(cache.contents)
         if n == 0: 
             return 0 
-        cache.contents = []
-        cache.header.numEntries = 0 
+        cache.set_contents([])
+        cache.tree_cache = {}
+        #every file is untracked now, which the token cannot tell a status
+        cache.fsmonitor_token = ""
         self.save_cache(cache)
         return 1 
-
-            
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -1,8 +1,9 @@
-import os 
 import typer 
 import py_git.git as git
 import py_git.models as models
-import py_git.utils as utils
+import py_git.pack as pack
+import py_git.fsmonitor as monitor
+import py_git.sparse as sparse
 from typing_extensions import Annotated
 from typing import List
 from py_git import SUCCESS, ERRORS, INIT_ERROR, F_EXIST_ERROR, F_LARGE_ERROR, HASH_EXISTS_ERROR
@@ -36,9 +37,9 @@ def cat_file(
 
 def display_content(input_object):
     if input_object[0] == "blob": 
-        print(input_object[2])
+        typer.echo(input_object[2])
     elif input_object[0] == "tree": 
-        tree = input_object[2].split(" ")
+        tree = input_object[2].decode("utf-8").split(" ")
         n = len(tree)
         for i in range(0, n, 3):
             file_type = tree[i]
@@ -47,7 +48,7 @@ def display_content(input_object):
             print(f"{file_type} {hash_code}\t{file_name}")
     elif input_object[0] == "commit": 
         delimiter = '\x1F'
-        commit = input_object[2].split(delimiter)
+        commit = input_object[2].decode("utf-8").split(delimiter)
         for line in commit: 
             print(line) 
     else: 
@@ -72,19 +73,58 @@ def hash_object(
     if hash_result == SUCCESS: 
         typer.echo(sha1)
 
+@app.command()
+def repack(
+    all: Annotated[bool, typer.Option("--all", "-a", help="Also fold existing packs into the new pack")] = False,
+    window: Annotated[int, typer.Option(help="Number of objects to try as delta bases, 0 disables deltas")] = pack.DEFAULT_WINDOW,
+    depth: Annotated[int, typer.Option(help="Maximum delta chain length")] = pack.DEFAULT_DEPTH,
+) -> None: 
+    """Moves loose objects into a single pack file"""
+    count, name = git.repack(all, window, depth)
+    if not count: 
+        print("nothing to pack")
+        return
+    print(f"Packed {count} objects into {name}")
+
+@app.command()
+def commit_graph() -> None: 
+    """Adds every commit reachable from a branch to the commit graph and merges its layers into one file"""
+    count = git.update_commit_graph()
+    print(f"Added {count} commits to the commit graph")
+
+@app.command()
+def fsmonitor(
+    action: Annotated[str, typer.Argument(help="start, stop or run, which serves in the foreground")],
+    poll: Annotated[bool, typer.Option(help="Compare stat data instead of using inotify")] = False,
+) -> None: 
+    """Runs a daemon that tracks changed paths so status and update-cache only look at those"""
+    if action == "run": 
+        monitor.Daemon(monitor.make_watcher(poll)).serve()
+    elif action == "start": 
+        if not monitor.start(poll): 
+            print("fsmonitor did not start")
+            raise typer.Exit(1)
+        print("fsmonitor is running")
+    elif action == "stop": 
+        if not monitor.stop(): 
+            print("fsmonitor is not running")
+    else: 
+        print(f"Unknown fsmonitor action {action}")
+        raise typer.Exit(1)
+
 @app.command()
 def update_cache(
-    file_paths: Annotated[List[str], typer.Argument()] = None    
+    file_paths: Annotated[List[str], typer.Argument()] = None,
+    summary: Annotated[bool, typer.Option(help="Print how many files were staged")] = False,
+    jobs: Annotated[int, typer.Option("--jobs", "-j", help="Processes used for hashing, 0 uses every core")] = 1,
 ) -> None: 
     """Adds object to the stagging area as well as hashes the object"""
     if file_paths[0] == ".": 
-        abs_file_paths = utils.get_all_files()
-        cwd = os.getcwd()
-        relative_paths = [os.path.relpath(file_path, cwd) for file_path in abs_file_paths]
-        file_paths = relative_paths
+        file_paths = git.working_tree_files()
 
-    for file in file_paths: 
-        git.update_cache(file.lstrip("./"))
+    staged, added, changed = git.update_cache_bulk((file[2:] if file.startswith("./") else file for file in file_paths), jobs)
+    if summary: 
+        print(f"{staged} files staged ({added} new, {changed} changed)")
 
 @app.command()
 def write_tree() -> None: 
@@ -119,9 +159,13 @@ def rm(
         print("nothing to remove")
 
 @app.command()
-def log(): 
+def log(
+    max_count: Annotated[int, typer.Option("--max-count", "-n", help="Stop after this many commits")] = None,
+    skip: Annotated[int, typer.Option(help="Skip this many commits before showing any")] = 0,
+    oneline: Annotated[bool, typer.Option(help="Show each commit as its short sha1 and subject")] = False,
+) -> None: 
     """Shows history of all commits on current branch"""
-    git.log()
+    git.log(max_count, skip, oneline)
 
 @app.command()
 def branch(
@@ -136,20 +180,62 @@ def checkout(
     #commit_sha: Annotated[str, typer.Argument()]
     branch: Annotated[str, typer.Option()] = "", 
     commit: Annotated[str, typer.Option()] = "", 
+    jobs: Annotated[int, typer.Option("--jobs", "-j", help="Threads used for writing files, 0 picks a default")] = 0,
 ): 
     """Checkout a branch or commit"""
-    git.checkout(branch, commit)
+    git.checkout(branch, commit, jobs)
 
 @app.command()
-def status(): 
+def sparse_checkout(
+    action: Annotated[str, typer.Argument(help="set, add, list, disable or reapply")],
+    dirs: Annotated[List[str], typer.Argument()] = None,
+    jobs: Annotated[int, typer.Option("--jobs", "-j", help="Threads used for writing files, 0 picks a default")] = 0,
+) -> None: 
+    """Checks out only the given directories, and the files above them"""
+    patterns = sparse.load()
+    current = sorted(patterns.dirs) if patterns else []
+    if action == "list": 
+        for dir_path in current: 
+            print(dir_path)
+    elif action == "set": 
+        git.sparse_checkout(dirs or [], jobs)
+    elif action == "add": 
+        git.sparse_checkout(current + (dirs or []), jobs)
+    elif action == "disable": 
+        git.sparse_checkout(None, jobs)
+    elif action == "reapply": 
+        git.sparse_checkout(current if patterns else None, jobs)
+    else: 
+        print(f"Unknown sparse-checkout action {action}")
+        raise typer.Exit(1)
+
+@app.command()
+def status(
+    jobs: Annotated[int, typer.Option("--jobs", "-j", help="Threads used for hashing changed files, 0 picks a default")] = 0,
+) -> None: 
     """Shows files in stagging area and changes"""
-    git.status()
+    git.status(jobs)
 
 @app.command()
 def merge(
     branch: Annotated[str, typer.Argument()], 
+    jobs: Annotated[int, typer.Option("--jobs", "-j", help="Threads used for writing files, 0 picks a default")] = 0,
 ): 
-    git.merge(branch)
+    git.merge(branch, jobs)
+
+@app.command()
+def merge_base(
+    commit_a: Annotated[str, typer.Argument()],
+    commit_b: Annotated[str, typer.Argument()],
+    all: Annotated[bool, typer.Option("--all", "-a", help="Print every best common ancestor")] = False,
+) -> None: 
+    """Finds the best common ancestor of two branches or commits"""
+    merge_bases = git.merge_base(commit_a, commit_b)
+    if not merge_bases: 
+        raise typer.Exit(1)
+
+    for commit_sha in merge_bases if all else merge_bases[:1]: 
+        typer.echo(commit_sha)
 
 @app.command()
 def diff(
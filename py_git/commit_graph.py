@@ -0,0 +1,271 @@
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+from typing import Dict, List, Tuple
+
+GRAPH_SIGNATURE = b"PGCG"
+GRAPH_VERSION = 1
+NO_PARENT = 0xffffffff
+
+#layout: header, 256 entry fan-out table over the sorted lookup, a lookup table of
+#(sha1, position) sorted by sha1, then one fixed width record per commit in the order
+#commits were added, so parents always sit at lower positions than their children.
+#a trailing sha1 covers everything before it
+GRAPH_HEADER = struct.Struct(">4sII")
+FANOUT = struct.Struct(">256I")
+LOOKUP = struct.Struct(">20sI")
+#commit sha1, tree sha1, first parent, second parent, generation, commit time
+RECORD = struct.Struct(">20s20sIIIq")
+#above this many new commits the lookup table is rebuilt instead of spliced
+SPLICE_LIMIT = 64
+#commits added one at a time go into layers on top of the graph file, named in a chain
+#file next to it, bottom first. a layer holds positions after every layer below it, and is
+#merged into the one below while that holds fewer than SIZE_MULTIPLE times its commits,
+#so appending stays cheap and the number of layers logarithmic
+CHAIN_SUFFIX = "-chain"
+LAYER_PREFIX = "commit-graph-"
+SIZE_MULTIPLE = 2
+
+class CommitGraph():
+    """One layer of the commit graph, with the layers below it reached through base.
+
+    Positions count from the bottom layer, so a parent position may point below this one."""
+    def __init__(self, graph_path: str, base=None) -> None:
+        self.path = graph_path
+        self.base = base
+        self.base_count = base.count if base else 0
+        with open(graph_path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, self.local_count = GRAPH_HEADER.unpack_from(self.map, 0)
+        if signature != GRAPH_SIGNATURE or version != GRAPH_VERSION:
+            self.map.close()
+            raise ValueError(f"{graph_path} is not a supported commit graph")
+
+        self.count = self.base_count + self.local_count
+        self.fanout = FANOUT.unpack_from(self.map, GRAPH_HEADER.size)
+        self.lookup_table = GRAPH_HEADER.size + FANOUT.size
+        self.record_table = self.lookup_table + LOOKUP.size * self.local_count
+
+    def find(self, sha1_hash: str) -> int:
+        #position of a commit, or -1 when the graph does not have it
+        binsha = bytes.fromhex(sha1_hash)
+        first = binsha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.lookup_table + LOOKUP.size * mid
+            current = self.map[start:start + 20]
+            if current < binsha:
+                lo = mid + 1
+            elif current > binsha:
+                hi = mid
+            else:
+                return LOOKUP.unpack_from(self.map, start)[1]
+        return self.base.find(sha1_hash) if self.base else -1
+
+    def record(self, position: int) -> Tuple[str, str, List[int], int, int]:
+        if position < self.base_count:
+            return self.base.record(position)
+        binsha, bintree, first, second, generation, commit_time = RECORD.unpack_from(self.map, self.record_table + RECORD.size * (position - self.base_count))
+        parents = [x for x in (first, second) if x != NO_PARENT]
+        return (binsha.hex(), bintree.hex(), parents, generation, commit_time)
+
+    def sha_at(self, position: int) -> str:
+        if position < self.base_count:
+            return self.base.sha_at(position)
+        start = self.record_table + RECORD.size * (position - self.base_count)
+        return self.map[start:start + 20].hex()
+
+    def layers(self) -> List["CommitGraph"]:
+        #bottom layer first
+        return (self.base.layers() if self.base else []) + [self]
+
+    def lookups(self) -> List[bytes]:
+        return [self.map[self.lookup_table + LOOKUP.size * i:self.lookup_table + LOOKUP.size * (i + 1)] for i in range(self.local_count)]
+
+    def records(self) -> bytes:
+        return self.map[self.record_table:self.record_table + RECORD.size * self.local_count]
+
+    def lookup(self, sha1_hash: str):
+        #(tree sha1, parent sha1s, generation, commit time) without touching the commit object
+        position = self.find(sha1_hash)
+        if position == -1:
+            return None
+        __, tree_sha, parents, generation, commit_time = self.record(position)
+        return (tree_sha, [self.sha_at(x) for x in parents], generation, commit_time)
+
+    def close(self) -> None:
+        self.map.close()
+        if self.base:
+            self.base.close()
+
+def lookup_position(table, binsha: bytes) -> int:
+    #first lookup entry not below binsha
+    lo, hi = 0, len(table) // LOOKUP.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = LOOKUP.size * mid
+        if table[start:start + 20] < binsha:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+graphs: Dict[str, Tuple[tuple, CommitGraph]] = {}
+
+def read_chain(graph_path: str) -> List[str]:
+    #file names of the layers above the graph file, bottom first
+    try:
+        with open(graph_path + CHAIN_SUFFIX, "r") as file:
+            return [x.strip() for x in file if x.strip()]
+    except FileNotFoundError:
+        return []
+
+def file_signature(file_path: str):
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def get_graph(graph_path: str):
+    #the top layer, mapped once and reopened when the graph file or the chain is replaced
+    #or another repository is used. layer files are named by content and never change
+    signature = (file_signature(graph_path), file_signature(graph_path + CHAIN_SUFFIX))
+    if signature[0] is None:
+        graphs.pop(graph_path, None)
+        return None
+
+    loaded = graphs.get(graph_path)
+    if loaded is not None and loaded[0] == signature:
+        return loaded[1]
+    graph = CommitGraph(graph_path)
+    for name in read_chain(graph_path):
+        graph = CommitGraph(os.path.join(os.path.dirname(graph_path), name), graph)
+    graphs[graph_path] = (signature, graph)
+    return graph
+
+def update(graph_path: str, tips: List[str], read_commit, split: bool = False) -> int:
+    #adds every commit reachable from tips that the graph does not have yet.
+    #read_commit(sha1) returns (tree sha1, parent sha1s, commit time). with split the
+    #new commits go into a layer on top, otherwise every layer is merged into one file
+    graph = get_graph(graph_path)
+    known = (lambda sha1_hash: graph.find(sha1_hash) != -1) if graph else (lambda sha1_hash: False)
+
+    missing = {}
+    stack = [x for x in tips if x]
+    while stack:
+        sha1_hash = stack.pop()
+        if sha1_hash in missing or known(sha1_hash):
+            continue
+        missing[sha1_hash] = read_commit(sha1_hash)
+        stack.extend(missing[sha1_hash][1])
+    #without split, layers are still merged into one file when nothing is new
+    if not missing and (split or not graph or not graph.base):
+        return 0
+
+    #parents get positions before their children
+    order = []
+    visited = set()
+    for tip in missing:
+        stack = [(tip, False)]
+        while stack:
+            sha1_hash, expanded = stack.pop()
+            if expanded:
+                order.append(sha1_hash)
+                continue
+            if sha1_hash in visited:
+                continue
+            visited.add(sha1_hash)
+            stack.append((sha1_hash, True))
+            stack.extend((x, False) for x in missing[sha1_hash][1] if x in missing and x not in visited)
+
+    count = graph.count if graph else 0
+    positions = {}
+    generations = {}
+
+    def position_and_generation(sha1_hash: str) -> Tuple[int, int]:
+        if sha1_hash in positions:
+            return (positions[sha1_hash], generations[sha1_hash])
+        position = graph.find(sha1_hash)
+        return (position, graph.record(position)[3])
+
+    records = []
+    lookups = []
+    for sha1_hash in order:
+        tree_sha, parents, commit_time = missing[sha1_hash]
+        parent_positions = []
+        generation = 1
+        for parent in parents[:2]:
+            position, parent_generation = position_and_generation(parent)
+            parent_positions.append(position)
+            generation = max(generation, parent_generation + 1)
+        parent_positions += [NO_PARENT] * (2 - len(parent_positions))
+
+        positions[sha1_hash] = count + len(records)
+        generations[sha1_hash] = generation
+        binsha = bytes.fromhex(sha1_hash)
+        records.append(RECORD.pack(binsha, bytes.fromhex(tree_sha), parent_positions[0], parent_positions[1], generation, commit_time))
+        lookups.append(LOOKUP.pack(binsha, positions[sha1_hash]))
+
+    #the layers the new commits are written together with, the top ones
+    layers = graph.layers() if graph else []
+    merged = []
+    size = len(records)
+    while layers and (not split or layers[-1].local_count < SIZE_MULTIPLE * size):
+        merged.insert(0, layers.pop())
+        size += merged[0].local_count
+
+    if len(merged) == 1 and len(lookups) <= SPLICE_LIMIT:
+        #commit_tree adds one commit at a time, so splice it into the sorted table
+        #rather than rebuilding the whole table
+        table = bytearray(merged[0].map[merged[0].lookup_table:merged[0].record_table])
+        fanout = list(merged[0].fanout)
+        for entry in sorted(lookups):
+            position = lookup_position(table, entry[:20])
+            table[LOOKUP.size * position:LOOKUP.size * position] = entry
+            for i in range(entry[0], 256):
+                fanout[i] += 1
+        all_lookups = [bytes(table)]
+    else:
+        #each layer's table is already sorted, so this is close to a linear merge
+        all_lookups = sorted([x for layer in merged for x in layer.lookups()] + lookups)
+        fanout = [0] * 256
+        for entry in all_lookups:
+            fanout[entry[0]] += 1
+        for i in range(1, 256):
+            fanout[i] += fanout[i - 1]
+
+    old_records = [layer.records() for layer in merged]
+    data = b"".join([GRAPH_HEADER.pack(GRAPH_SIGNATURE, GRAPH_VERSION, size), FANOUT.pack(*fanout)] + all_lookups + old_records + records)
+    data += hashlib.sha1(data).digest()
+
+    graph_dir = os.path.dirname(graph_path)
+    os.makedirs(graph_dir, exist_ok=True)
+    old_chain = read_chain(graph_path)
+    if layers:
+        #a new layer file first, then the chain naming it replaces the old one
+        name = LAYER_PREFIX + hashlib.sha1(data).hexdigest()
+        write_file(os.path.join(graph_dir, name), data)
+        chain = [os.path.basename(x.path) for x in layers[1:]] + [name]
+        write_file(graph_path + CHAIN_SUFFIX, "".join(x + "\n" for x in chain).encode())
+    else:
+        #without the chain first, a reader never puts old layers on top of the new file
+        chain = []
+        if os.path.exists(graph_path + CHAIN_SUFFIX):
+            os.remove(graph_path + CHAIN_SUFFIX)
+        write_file(graph_path, data)
+    for name in set(old_chain) - set(chain):
+        if os.path.exists(os.path.join(graph_dir, name)):
+            os.remove(os.path.join(graph_dir, name))
+    return len(records)
+
+def write_file(file_path: str, data: bytes) -> None:
+    fd, temp_path = tempfile.mkstemp(prefix="tmp_graph_", dir=os.path.dirname(file_path))
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, file_path)
@@ -0,0 +1,165 @@
+import re
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+#delta layout follows git: varint base size, varint result size, then instructions.
+#a copy instruction has the high bit set and flags for which offset/size bytes follow,
+#an insert instruction is a length of 1-127 followed by that many literal bytes
+MIN_COPY = 16
+MAX_COPY_SIZE = 0xffffff
+MAX_INSERT = 0x7f
+
+#lines make natural match boundaries, long lines are cut into 256 byte pieces
+TOKEN = re.compile(rb"[^\n]{1,256}\n?|\n")
+
+def encode_varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def decode_varint(data, offset: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (n, offset)
+
+class DeltaIndex():
+    """Tokens of an object with their offsets and a first-occurrence lookup table.
+
+    Built once per object, it serves both when the object is a delta target
+    and later when it is tried as a base for other objects."""
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.tokens: List[bytes] = TOKEN.findall(data)
+        self.offsets: List[int] = list(accumulate(map(len, self.tokens), initial=0))
+        n = len(self.tokens)
+        self.index: Dict[bytes, int] = dict(zip(reversed(self.tokens), range(n - 1, -1, -1)))
+
+def run_length(base: DeltaIndex, i: int, target: DeltaIndex, j: int) -> int:
+    #gallops over the matching run of tokens, base token i equals target token j.
+    #each step only compares the bytes it adds, so a run costs about two passes over it
+    limit = min(len(base.tokens) - i, len(target.tokens) - j)
+    base_data, base_offsets = base.data, base.offsets
+    data, offsets = target.data, target.offsets
+
+    def matches(lo: int, hi: int) -> bool:
+        base_start, base_end = base_offsets[i + lo], base_offsets[i + hi]
+        start, end = offsets[j + lo], offsets[j + hi]
+        return base_end - base_start == end - start and base_data[base_start:base_end] == data[start:end]
+
+    lo, hi = 1, 2
+    while hi <= limit and matches(lo, hi):
+        lo, hi = hi, hi * 2
+    hi = min(hi, limit + 1)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if matches(lo, mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+def emit_copy(out: bytearray, offset: int, size: int) -> None:
+    while size:
+        length = min(size, MAX_COPY_SIZE)
+        op = 0x80
+        args = bytearray()
+        for i in range(4):
+            byte = (offset >> (8 * i)) & 0xff
+            if byte:
+                op |= 1 << i
+                args.append(byte)
+        for i in range(3):
+            byte = (length >> (8 * i)) & 0xff
+            if byte:
+                op |= 0x10 << i
+                args.append(byte)
+        out.append(op)
+        out += args
+        offset += length
+        size -= length
+
+def emit_insert(out: bytearray, data: bytes) -> None:
+    for start in range(0, len(data), MAX_INSERT):
+        piece = data[start:start + MAX_INSERT]
+        out.append(len(piece))
+        out += piece
+
+def create_delta(base: DeltaIndex, target: DeltaIndex, max_size: int = 0):
+    #returns None when the delta would not stay under max_size
+    out = bytearray(encode_varint(len(base.data)) + encode_varint(len(target.data)))
+    base_offsets, lookup = base.offsets, base.index
+    tokens, offsets = target.tokens, target.offsets
+    n = len(tokens)
+    pending = 0
+    j = 0
+
+    while j < n:
+        i = lookup.get(tokens[j])
+        if i is None:
+            j += 1
+            continue
+
+        k = run_length(base, i, target, j)
+        size = base_offsets[i + k] - base_offsets[i]
+        if size < MIN_COPY:
+            j += 1
+            continue
+
+        emit_insert(out, target.data[offsets[pending]:offsets[j]])
+        emit_copy(out, base_offsets[i], size)
+        j += k
+        pending = j
+        if max_size and len(out) > max_size:
+            return None
+
+    emit_insert(out, target.data[offsets[pending]:])
+    if max_size and len(out) > max_size:
+        return None
+    return bytes(out)
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    base_size, position = decode_varint(delta, 0)
+    result_size, position = decode_varint(delta, position)
+    if base_size != len(base):
+        raise ValueError("delta does not apply to this base")
+
+    base_view = memoryview(base)
+    out = bytearray()
+    n = len(delta)
+    while position < n:
+        op = delta[position]
+        position += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[position] << (8 * i)
+                    position += 1
+            if size == 0:
+                size = 0x10000
+            out += base_view[offset:offset + size]
+        elif op:
+            out += delta[position:position + op]
+            position += op
+        else:
+            raise ValueError("invalid delta instruction")
+
+    if len(out) != result_size:
+        raise ValueError("delta produced the wrong size")
+    return bytes(out)
@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import errno
+import select
+import socket
+import struct
+import ctypes
+import ctypes.util
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+SOCKET = ".git/fsmonitor.sock"
+#answered in place of a path list when the token is not one this daemon handed out
+EVERYTHING = "/"
+START_TIMEOUT = 5
+QUERY_TIMEOUT = 5
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_ONLYDIR | IN_DONT_FOLLOW)
+#wd, mask, cookie, name length, then the nul padded name
+EVENT = struct.Struct("iIII")
+
+def scan_dirs(top: str = ""):
+    #every directory of the working tree below top except .git. ignore rules are not
+    #applied because tracked files may sit in ignored directories
+    stack = [top]
+    while stack:
+        dir_path = stack.pop()
+        yield dir_path
+        try:
+            with os.scandir(dir_path or ".") as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False) and not (dir_path == "" and entry.name == ".git"):
+                        stack.append(dir_path + entry.name + "/")
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+class InotifyWatcher():
+    """Changed paths from linux inotify, with one watch per working tree directory."""
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        #watch descriptor -> directory path, "" or ending in "/"
+        self.dirs: Dict[int, str] = {}
+        self.watch_tree("")
+
+    def watch_tree(self, top: str) -> None:
+        for dir_path in scan_dirs(top):
+            wd = self.libc.inotify_add_watch(self.fd, (dir_path or ".").encode(), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                #the directory went away before it could be watched, its removal is reported anyway
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(error, f"cannot watch {dir_path or '.'}")
+            #a directory moved inside the tree keeps its watch, only the path is updated
+            self.dirs[wd] = dir_path
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self) -> Optional[List[str]]:
+        #drains the queued events, None when the kernel dropped some and changes were lost
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, __, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                if wd not in self.dirs or not name:
+                    continue
+                path = self.dirs[wd] + name
+                if path == ".git":
+                    continue
+                changed.append(path)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch_tree(path + "/")
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class PollingWatcher():
+    """Stand-in for filesystems without inotify, compares stat data of the whole tree when asked."""
+    def __init__(self) -> None:
+        self.snapshot = self.scan()
+
+    def scan(self) -> Dict[str, Tuple[int, int, int, int]]:
+        snapshot = {}
+        for dir_path in scan_dirs():
+            try:
+                with os.scandir(dir_path or ".") as entries:
+                    for entry in entries:
+                        path = dir_path + entry.name
+                        if path == ".git":
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        snapshot[path] = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+            except FileNotFoundError:
+                continue
+        return snapshot
+
+    def fileno(self) -> Optional[int]:
+        return None
+
+    def read(self) -> Optional[List[str]]:
+        current = self.scan()
+        previous = self.snapshot
+        self.snapshot = current
+        changed = [path for path, stat in current.items() if previous.get(path) != stat]
+        return changed + [path for path in previous if path not in current]
+
+    def close(self) -> None:
+        pass
+
+class Daemon():
+    """Remembers which paths changed and when, and answers token queries over a unix socket.
+
+    A token is the daemon instance and a sequence number. A query with a token from
+    another instance, or from before changes were lost, gets EVERYTHING back."""
+    def __init__(self, watcher, socket_path: str = SOCKET) -> None:
+        self.watcher = watcher
+        self.socket_path = socket_path
+        self.seq = 0
+        self.changes: Dict[str, int] = {}
+        self.new_instance()
+
+    def new_instance(self) -> None:
+        self.instance = f"{os.getpid()}.{time.time_ns()}"
+        self.changes = {}
+
+    def token(self) -> str:
+        return f"{self.instance}:{self.seq}"
+
+    def update(self) -> None:
+        changed = self.watcher.read()
+        if changed is None:
+            self.new_instance()
+            return
+        if changed:
+            self.seq += 1
+            for path in changed:
+                self.changes[path] = self.seq
+
+    def answer(self, token: str) -> bytes:
+        #events written before the client asked are already queued, so draining them first
+        #means the new token covers everything the client could have seen
+        self.update()
+        instance, __, seq = token.rpartition(":")
+        if instance != self.instance or not seq.isdigit():
+            paths = [EVERYTHING]
+        else:
+            paths = [path for path, changed_at in self.changes.items() if changed_at > int(seq)]
+        return "\0".join([self.token()] + paths).encode("utf-8", "surrogateescape")
+
+    def serve(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        sources = [server] + ([self.watcher] if self.watcher.fileno() is not None else [])
+        try:
+            while True:
+                readable, __, __ = select.select(sources, [], [])
+                if self.watcher in readable:
+                    self.update()
+                if server not in readable:
+                    continue
+                connection, __ = server.accept()
+                with connection:
+                    connection.settimeout(QUERY_TIMEOUT)
+                    try:
+                        request = receive(connection).decode("utf-8")
+                        if request == "quit":
+                            return
+                        connection.sendall(self.answer(request.partition(" ")[2]))
+                    except OSError:
+                        continue
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.watcher.close()
+
+def receive(connection: socket.socket) -> bytes:
+    #a request or reply ends when the sender shuts down its side
+    chunks = []
+    while True:
+        chunk = connection.recv(64 * 1024)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+def request(message: str, socket_path: str = SOCKET) -> Optional[bytes]:
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(QUERY_TIMEOUT)
+            client.connect(socket_path)
+            client.sendall(message.encode("utf-8"))
+            client.shutdown(socket.SHUT_WR)
+            return receive(client)
+    except OSError:
+        return None
+
+def query(token: str, socket_path: str = SOCKET) -> Tuple[str, Optional[List[str]]]:
+    #(new token, paths changed since token). paths is None when every path has to be
+    #looked at, because no daemon is running or it cannot vouch for the token
+    reply = request(f"query {token}", socket_path)
+    if not reply:
+        return ("", None)
+    new_token, *paths = reply.decode("utf-8", "surrogateescape").split("\0")
+    if paths == [EVERYTHING]:
+        return (new_token, None)
+    return (new_token, paths)
+
+def make_watcher(poll: bool = False):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher()
+
+def is_running(socket_path: str = SOCKET) -> bool:
+    return request("query ", socket_path) is not None
+
+def start(poll: bool = False) -> bool:
+    #runs the daemon as a detached process of its own and waits until it answers
+    if is_running():
+        return True
+    command = [sys.executable, "-m", "py_git", "fsmonitor", "run"] + (["--poll"] if poll else [])
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if is_running():
+            return True
+        time.sleep(0.05)
+    return False
+
+def stop() -> bool:
+    return request("quit") is not None
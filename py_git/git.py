@@ -1,19 +1,34 @@
 import os 
+import io
 import hashlib
 import zlib
 import py_git.models as models
 import py_git.cache as cache
 import py_git.cli as cli
 import py_git.utils as utils
+import py_git.pack as pack
+import py_git.object_cache as object_cache
+import py_git.commit_graph as commit_graph
+import py_git.revision as revision
+import py_git.xdiff as xdiff
+import py_git.xmerge as xmerge
+import py_git.ignore as ignore
+import py_git.fsmonitor as fsmonitor
+import py_git.sparse as sparse
 import tempfile
-import subprocess
+import shutil
+import itertools
 from py_git import SUCCESS, INIT_ERROR, F_EXIST_ERROR, F_LARGE_ERROR, HASH_EXISTS_ERROR
 from py_git import DEV_NULL_FILE
 from typing import Tuple, List
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime 
 
-SIZE = 4096
+SIZE = 1 << 16
+OBJECTS_DIR = ".git/objects"
+PACK_DIR = ".git/objects/pack"
+COMMIT_GRAPH = ".git/objects/info/commit-graph"
+MERGE_HEAD = ".git/MERGE_HEAD"
 
 def init() -> int: 
     #check whether a .git files exist already 
@@ -43,70 +58,170 @@ def init() -> int:
     return SUCCESS
 
 def cat_file(sha1_hash: str, byteObject: models.ByteFile) -> int: 
-    object_dir = ".git/objects"
-    folder_name = sha1_hash[:2]
-    file_name = sha1_hash[2:]
-    folder_path = os.path.join(object_dir, folder_name)
-    file_path = os.path.join(folder_path, file_name)
-
-    if not os.path.exists(file_path):
+    cached = object_cache.shared.get(sha1_hash)
+    if cached is not None: 
+        byteObject.type, byteObject.content = cached
+        byteObject.size = len(byteObject.content)
+        return SUCCESS
+
+    stream = open_stored_object(sha1_hash)
+    if stream is None: 
         return F_EXIST_ERROR 
 
-    decompressor =  zlib.decompressobj()
-    decompressed_content = b""
-    with open(file_path, "rb") as file: 
-        while True: 
-            chunk = file.read(4086)
-            if not chunk: 
-                break
-            decompressed_content += decompressor.decompress(chunk) #should this be += ? 
-
-        decompressed_content += decompressor.flush()
-        data = parseByteFormat(decompressed_content)
-        byteObject.type = data[0]
-        byteObject.size = data[1]
-        byteObject.content = data[2]
+    with stream: 
+        byteObject.type = stream.type
+        byteObject.size = stream.size
+        byteObject.content = stream.read()
 
+    object_cache.shared.put(sha1_hash, byteObject.type, byteObject.content)
     return SUCCESS 
 
-def parseByteFormat(input_str): 
-    data = input_str.decode("utf-8")
-    parseNullByte = data.split('\0')
-    raw_object = parseNullByte[0].split(" ")
-    raw_contents = parseNullByte[1]
-    object_type, size, contents = raw_object[0], raw_object[1], raw_contents 
+def open_object(sha1_hash: str): 
+    #returns the object with only its header parsed, the body is inflated as it is read
+    cached = object_cache.shared.get(sha1_hash)
+    if cached is not None: 
+        object_type, content = cached
+        return models.ObjectStream(object_type, len(content), io.BytesIO(content))
 
-    return (object_type, size, contents)
+    return open_stored_object(sha1_hash)
+
+def open_stored_object(sha1_hash: str): 
+    file_path = object_path(sha1_hash)
+    if not os.path.exists(file_path):
+        return pack.get_store(PACK_DIR).open_object(sha1_hash)
+
+    body = models.InflateReader(open(file_path, "rb"), SIZE)
+    try: 
+        object_type, size = parse_object_header(body.read_until(b"\0"))
+    except ValueError: 
+        body.close()
+        raise
+    return models.ObjectStream(object_type, size, body)
+
+def parse_object_header(header: bytes) -> Tuple[str, int]: 
+    object_type, size = header.decode("utf-8").split(" ")
+    return (object_type, int(size))
+
+def object_path(sha1_hash: str) -> str: 
+    return os.path.join(OBJECTS_DIR, sha1_hash[:2], sha1_hash[2:])
+
+def object_exists(sha1_hash: str) -> bool: 
+    if os.path.exists(object_path(sha1_hash)): 
+        return True
+    return pack.get_store(PACK_DIR).contains(sha1_hash)
+
+def list_loose_objects() -> List[str]: 
+    shas = []
+    for folder_name in sorted(os.listdir(OBJECTS_DIR)): 
+        folder_path = os.path.join(OBJECTS_DIR, folder_name)
+        if len(folder_name) != 2 or not os.path.isdir(folder_path): 
+            continue
+        for file_name in sorted(os.listdir(folder_path)): 
+            if len(file_name) == 38 and not file_name.startswith("tmp_"): 
+                shas.append(folder_name + file_name)
+    return shas
+
+def repack(all_packs: bool = False, window: int = pack.DEFAULT_WINDOW, depth: int = pack.DEFAULT_DEPTH) -> Tuple[int, str]: 
+    #moves loose objects into a new pack, with all_packs existing packs are folded in too
+    store = pack.get_store(PACK_DIR)
+    loose_shas = list_loose_objects()
+    shas = list(loose_shas)
+    old_packs = []
+    if all_packs: 
+        store.reload()
+        old_packs = list(store.packs)
+        shas.extend(store.list_objects())
+
+    if not shas: 
+        return (0, None)
+
+    name = pack.write_pack(PACK_DIR, shas, open_object, window, depth)
+
+    for sha1_hash in loose_shas: 
+        os.remove(object_path(sha1_hash))
+
+    for old_pack in old_packs: 
+        if old_pack == name + ".pack": 
+            continue
+        store.packs.pop(old_pack).close()
+        os.remove(os.path.join(PACK_DIR, old_pack))
+        os.remove(os.path.join(PACK_DIR, old_pack[:-len(".pack")] + ".idx"))
+    store.reload()
+
+    return (len(set(shas)), name)
 
 def hash_file(file_path: str, _type: str = "blob"): 
 
     if not os.path.exists(file_path): 
         return (F_EXIST_ERROR, None) 
 
-    size_in_bytes = str(os.path.getsize(file_path))
+    #first pass only hashes the canonical object, nothing is compressed
+    size_in_bytes = os.path.getsize(file_path)
+    header = f"{_type} {size_in_bytes}\0".encode("utf-8") 
+    hex_sha1 = file_sha(file_path, _type)
 
-    blob_string = f"{_type} {size_in_bytes}\0".encode("utf-8") 
+    if object_exists(hex_sha1): 
+        return (SUCCESS, hex_sha1)
 
-    compressor = zlib.compressobj()
-    compressed_content = compressor.compress(blob_string)
     with open(file_path, "rb") as file:
+        hex_sha1 = write_loose_object(header, file, hex_sha1)
+
+    return (SUCCESS, hex_sha1) 
+
+def file_sha(file_path: str, _type: str = "blob") -> str: 
+    #the object id a file would get, without storing anything
+    with open(file_path, "rb") as file:
+        size_in_bytes = os.fstat(file.fileno()).st_size
+        sha1 = hashlib.sha1(f"{_type} {size_in_bytes}\0".encode("utf-8"))
         while(True): 
             chunk = file.read(SIZE)
             if not chunk: 
                 break 
-            compressed_content += compressor.compress(chunk)
-    compressed_content += compressor.flush()
-
-    sha1 = hashlib.sha1()
-    sha1.update(compressed_content)
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def write_object(_type: str, data: bytes) -> str: 
+    #hashes and stores an object straight from memory
+    header = f"{_type} {len(data)}\0".encode("utf-8")
+    sha1 = hashlib.sha1(header)
+    sha1.update(data)
     hex_sha1 = sha1.hexdigest()
+    if object_exists(hex_sha1): 
+        return hex_sha1
+
+    return write_loose_object(header, io.BytesIO(data), hex_sha1)
+
+def write_loose_object(header: bytes, stream, expected_sha1: str) -> str: 
+    #compress into a temp file inside the fan-out dir and rename it into place,
+    #so readers never see a partially written object
+    folder_path = os.path.dirname(object_path(expected_sha1))
+    os.makedirs(folder_path, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=folder_path)
+
+    try: 
+        sha1 = hashlib.sha1(header)
+        compressor = zlib.compressobj()
+        with os.fdopen(fd, "wb") as temp: 
+            temp.write(compressor.compress(header))
+            while(True): 
+                chunk = stream.read(SIZE)
+                if not chunk: 
+                    break 
+                sha1.update(chunk)
+                temp.write(compressor.compress(chunk))
+            temp.write(compressor.flush())
+
+        #the source may have changed since it was hashed, trust what was written
+        hex_sha1 = sha1.hexdigest()
+        write_file = object_path(hex_sha1)
+        os.makedirs(os.path.dirname(write_file), exist_ok=True)
+        os.replace(temp_path, write_file)
+    except BaseException: 
+        if os.path.exists(temp_path): 
+            os.remove(temp_path)
+        raise
 
-    write_file = ".git/objects/" + hex_sha1[0:2] + "/" + hex_sha1[2:]
-    with open(write_file, "wb") as file: 
-        file.write(compressed_content)
-
-
-    return (SUCCESS, hex_sha1) 
+    return hex_sha1
 
 def database_add_hash(sha1_hash: str) -> int: 
     object_dir = ".git/objects"
@@ -126,79 +241,114 @@ def database_add_hash(sha1_hash: str) -> int:
     return SUCCESS
 
 def update_cache(file_path: str): 
-    #check filepath exists 
+    return update_cache_bulk([file_path])
+
+def stat_and_hash(file_path: str): 
     if not os.path.exists(file_path): 
-        return
+        return None
 
-    #ASSUME FIRST ADD
+    #stat before hashing, so a change made while hashing is seen as dirty later
+    st = os.stat(file_path)
     hash_result, sha1 = hash_file(file_path)
+    return (file_path, st, sha1)
+
+def update_cache_bulk(file_paths, jobs: int = 1, chunk_size: int = 64) -> Tuple[int, int, int]: 
+    #hashes every path, then loads, merges and writes the index exactly once
+    #with jobs other than 1 the hashing runs on a process pool, 0 means one per core
+    #returns the number of staged, added and changed entries
+    file_paths = list(file_paths)
+    if jobs != 1 and len(file_paths) > chunk_size: 
+        with ProcessPoolExecutor(max_workers=jobs or None) as executor: 
+            results = list(executor.map(stat_and_hash, file_paths, chunksize=chunk_size))
+    else: 
+        results = [stat_and_hash(file_path) for file_path in file_paths]
+
+    entries = []
+    for result in results: 
+        if result is None: 
+            continue
+        file_path, st, sha1 = result
+        entry = cache.CacheEntry("blob", st.st_mode, sha1, file_path)
+        cache.fill_stat(entry, st)
+        entries.append(entry)
+
+    if not entries: 
+        return (0, 0, 0)
 
-    _type = "blob"
-    mode = os.stat(file_path).st_mode 
     cache_handler = cache.CacheHandeler()
-    cache_handler.insert_cache(_type, mode, sha1, file_path)
-    cache_handler.printCache()
+    current_cache = cache_handler.load_cache()
+    expand_sparse_dirs(current_cache, [entry.file_path for entry in entries], jobs)
+    added, changed = cache.merge_entries(current_cache, entries)
+    cache_handler.save_cache(current_cache)
+    return (len(entries), added, changed)
 
 def write_tree() -> str: 
     cache_handler = cache.CacheHandeler()
     current_cache = cache_handler.load_cache()
-    cache_array = current_cache.contents
-    numEntries = current_cache.header.numEntries
-
-    #create nested hashmap structure
-    #this data structure should be stored and serialilzed in the cache
-    files_list = []
-    files_hash = {}
-    for cache_object in cache_array: 
-        files_list.append(cache_object.file_path)
-        files_hash[cache_object.file_path] = cache_object.sha1
-
-    fileTreeHash = create_hash(files_list)
-    sha1 = helper(fileTreeHash["root"], files_hash, 1, "")
+    cached_trees = dict(current_cache.tree_cache)
+    sha1 = build_tree(current_cache)
+
+    #only rewrite the index when new trees were hashed into its cached tree section
+    if current_cache.tree_cache != cached_trees: 
+        cache_handler.save_cache(current_cache)
     return sha1
 
-def create_hash(files_list): 
-    tree = defaultdict(dict)
-    tree['root'] = {}
-
-    for file_path in files_list:
-        path_parts = file_path.split('/')
-        add_path(tree['root'], path_parts)
-
-    return tree
-
-def add_path(tree, path_parts):
-    if path_parts:
-        current = path_parts[0]
-        tree[current] = add_path(tree.get(current, {}), path_parts[1:])
-    return tree
-
-def helper(tree, files_hash, level: int, dirPath: str):
-    treeText = ""
-    for key, value in tree.items():
-        obj, sha, filename = "", "", ""
-        if "." in key: 
-            obj = "blob"
-            filename = key
-            filepath = (dirPath + "/" + key).lstrip("/")
-            sha = files_hash[filepath]
-        
-        else: 
-            if isinstance(value, dict):
-                obj = "tree"
-                filename = (dirPath + "/" + key).lstrip("/") 
-                sha = helper(value, files_hash, level + 1, filename)
-
-        line = f"{obj} {sha} {filename} "
-        treeText += (line)
-            
-    with tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as temp: 
-        temp.write(treeText.rstrip(" "))
-        temp.flush()
-        temp_file_path = os.path.join('.', temp.name)
-        hash_status, hex_sha1 = hash_file(temp_file_path, "tree")
+def build_tree(current_cache: cache.Cache) -> str: 
+    #one pass over the sorted entries, a stack holds the lines of every open directory.
+    #paths under one directory are contiguous when sorted, so a subtree is complete and
+    #hashed as soon as a path outside it shows up, then its line goes to the parent.
+    #directories still valid in the cached tree section are reused and skipped whole
+    entries = current_cache.contents
+    tree_cache = current_cache.tree_cache
+    n = len(entries)
+    cached = tree_cache.get("")
+    if cached is not None and cached[1] == n: 
+        return cached[0]
+
+    stack = [("", [], 0)]
+    i = 0
+    while i < n: 
+        entry = entries[i]
+        #a sparse directory entry is a finished subtree, its path ends in "/"
+        path = entry.file_path.rstrip("/") if entry.type == "tree" else entry.file_path
+        parts = path.split("/")
+        dir_parts = parts[:-1]
+
+        depth = 0
+        while depth < len(dir_parts) and depth + 1 < len(stack) and stack[depth + 1][0] == "/".join(dir_parts[:depth + 1]): 
+            depth += 1
+        while len(stack) > depth + 1: 
+            close_tree(stack, tree_cache, i)
+
+        skipped = False
+        for d in range(depth, len(dir_parts)): 
+            dir_path = "/".join(dir_parts[:d + 1])
+            cached = tree_cache.get(dir_path)
+            if cached is not None: 
+                lo, hi = current_cache.prefix_range(dir_path)
+                if hi - lo == cached[1]: 
+                    stack[-1][1].append(f"tree {cached[0]} {dir_path}")
+                    i = hi
+                    skipped = True
+                    break
+            stack.append((dir_path, [], i))
+        if skipped: 
+            continue
 
-    return hex_sha1
+        stack[-1][1].append(f"{entry.type} {entry.sha1} {path if entry.type == 'tree' else parts[-1]}")
+        i += 1
+
+    while len(stack) > 1: 
+        close_tree(stack, tree_cache, n)
+    sha1 = write_object("tree", " ".join(stack[0][1]).encode("utf-8"))
+    tree_cache[""] = (sha1, n)
+    return sha1
+
+def close_tree(stack, tree_cache, end: int) -> None: 
+    dir_path, lines, start = stack.pop()
+    sha1 = write_object("tree", " ".join(lines).encode("utf-8"))
+    tree_cache[dir_path] = (sha1, end - start)
+    stack[-1][1].append(f"tree {sha1} {dir_path}")
 
 def commit_tree(tree_sha: str, raw_user_input: str, commit_parents= []):
     #validate sha1
@@ -214,28 +364,30 @@ def commit_tree(tree_sha: str, raw_user_input: str, commit_parents= []):
     name, email = utils.extract_name_and_email(home_file_path + "/.py_git_config")
     os.chdir(cwd)
 
-    current_date_time = datetime.now()
-    formatted_date_time = current_date_time.strftime("Date:   %a %b %d %H:%M:%S %Y %z")
+    current_date_time = datetime.now().astimezone()
+    timestamp = f"{int(current_date_time.timestamp())} {current_date_time.strftime('%z')}"
 
     parentCommit = utils.extract_commit_from_head()
 
+    #committing the resolution of a conflicted merge records both parents
+    if not commit_parents and os.path.exists(MERGE_HEAD): 
+        with open(MERGE_HEAD) as file: 
+            commit_parents = [parentCommit, file.read().strip()]
+        os.remove(MERGE_HEAD)
+
     delimiter = '\x1F'
     commitString = ""
     treeLine = f"tree {tree_sha}{delimiter}"
     prevCommitLine = f"parent {parentCommit}{delimiter}"
     if commit_parents: 
         prevCommitLine = f"parent {commit_parents[0]} {commit_parents[1]}{delimiter}"
-    authorLine = f"author {name} <{email}>{delimiter}"
-    commitLine = f"commiter {name} <{email}>{delimiter}"
+    authorLine = f"author {name} <{email}> {timestamp}{delimiter}"
+    commitLine = f"commiter {name} <{email}> {timestamp}{delimiter}"
     commitString += (treeLine + prevCommitLine + authorLine + commitLine) + '\n'
     commitString += raw_user_input
 
-    with tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as temp: 
-        temp.write(commitString)
-        temp.flush()
-        temp_file_path = os.path.join('.', temp.name)
-        hash_status, hex_sha1 = hash_file(temp_file_path, "commit")
-
+    hex_sha1 = write_object("commit", commitString.encode("utf-8"))
+    update_commit_graph([hex_sha1], True)
 
     branch_name = utils.extract_ref_from_head()
     if branch_name: 
@@ -248,6 +400,19 @@ def commit_tree(tree_sha: str, raw_user_input: str, commit_parents= []):
 
     return hex_sha1
 
+def update_commit_graph(tips: List[str] = None, split: bool = False) -> int: 
+    #without tips every branch and HEAD are walked, which builds the graph for an existing history.
+    #split adds the commits as a layer on top instead of writing the graph as one file
+    if tips is None: 
+        tips = [utils.extract_commit_from_head()]
+        heads_dir = ".git/refs/heads"
+        for root, dirs, files in os.walk(heads_dir): 
+            for name in files: 
+                with open(os.path.join(root, name)) as file: 
+                    tips.append(file.read().strip())
+
+    return commit_graph.update(COMMIT_GRAPH, [x for x in tips if x], utils.parse_commit, split)
+
 def rm(file: str, all: bool): 
     cache_handler = cache.CacheHandeler()
     result = None
@@ -258,26 +423,24 @@ def rm(file: str, all: bool):
 
     return result
 
-def log(): 
+def log(max_count: int = None, skip: int = 0, one_line: bool = False): 
     current_commit_sha = utils.extract_commit_from_head()
 
-    log_helper(current_commit_sha)
-
-def log_helper(commit_sha: str): 
-    fileObject = models.ByteFile(None, None, None)
-    cat_result = cat_file(commit_sha, fileObject)
-    #if cat_result == F_EXIST_ERROR: 
-    #    return 0 
-    input_object = (fileObject.type, fileObject.size, fileObject.content)
-    cli.display_content(input_object)
-
-    prevCommit = utils.extract_commit_from_commit(commit_sha)
+    #the walk is lazy, so output starts right away and stops at max_count
+    commits = revision.walk_commits([current_commit_sha])
+    end = skip + max_count if max_count is not None else None
+    for i, commit_sha in enumerate(itertools.islice(commits, skip, end)): 
+        if one_line: 
+            print(revision.oneline(commit_sha))
+            continue
 
-    if not prevCommit: 
-        return
+        if i: 
+            print("----------------------------------")
+        fileObject = models.ByteFile(None, None, None)
+        cat_file(commit_sha, fileObject)
+        cli.display_content((fileObject.type, fileObject.size, fileObject.content))
 
-    print("----------------------------------")
-    log_helper(prevCommit)
+    return SUCCESS
 
 def branch(new_branch_name: str): 
     new_branch_path = ".git/refs/heads/" + new_branch_name
@@ -293,7 +456,7 @@ def branch(new_branch_name: str):
     with open(".git/HEAD", "w") as file: 
         file.write(f"ref: refs/heads/{new_branch_name}")
 
-def checkout(branch_name: str = "", input_commit_sha: str = ""): 
+def checkout(branch_name: str = "", input_commit_sha: str = "", jobs: int = 0): 
     if not branch_name and not input_commit_sha: 
         return 0 
 
@@ -319,16 +482,49 @@ def checkout(branch_name: str = "", input_commit_sha: str = ""):
 
         checkout_tree_sha = utils.extract_tree_from_commit(input_commit_sha)
 
+    checkout_tree(checkout_tree_sha, jobs)
+
+def checkout_tree(tree_sha: str, jobs: int = 0, reapply: bool = False) -> None: 
+    #two tree checkout: only paths where the index and the target tree differ are
+    #removed or written, and the index is saved once. directories left out by sparse
+    #checkout become one skip-worktree entry and nothing below them is written.
+    #reapply compares every directory again, for when the sparse patterns changed
     cache_handler = cache.CacheHandeler()
     current_cache = cache_handler.load_cache()
-    utils.clear_working_tree(current_cache)
-    cache_handler.remove_all()
-    utils.load_tree_into_cache(checkout_tree_sha, "", cache_handler)
-    current_cache = cache_handler.load_cache()
-    utils.load_cache_into_working_tree(current_cache)
-
+    if reapply: 
+        current_cache.tree_cache = {}
+    patterns = sparse.load()
+    trees = {}
+    changes = index_tree_changes(current_cache, tree_sha, trees, patterns.excludes if patterns else lambda dir_path: False)
+
+    removed = [file_path for file_path, __, blob_sha in changes if blob_sha is None]
+    current_cache.remove_many(removed)
+    utils.delete_files_and_directories([x for x in removed if not x.endswith("/")])
+
+    entries = [cache.CacheEntry("blob", 0, blob_sha, file_path) for file_path, __, blob_sha in changes if blob_sha and not file_path.endswith("/")]
+    utils.load_cache_into_working_tree(entries, jobs)
+    entries += [cache.CacheEntry("tree", 0, sha1, dir_path, flags=cache.SKIP_WORKTREE) for dir_path, __, sha1 in changes if sha1 and dir_path.endswith("/")]
+    cache.merge_entries(current_cache, entries)
+
+    #the index now holds the target tree, so every directory read from it is a valid cached tree
+    for dir_path, tree_sha in trees.items(): 
+        lo, hi = current_cache.prefix_range(dir_path)
+        current_cache.tree_cache[dir_path] = (tree_sha, hi - lo)
+    cache_handler.save_cache(current_cache)
+
+
+def sparse_checkout(dirs: List[str] = None, jobs: int = 0) -> None: 
+    #sets the directories to check out, or turns sparse checkout off without any, and
+    #brings the working tree and index of HEAD in line with that
+    if dirs is not None: 
+        sparse.write(dirs)
+    else: 
+        sparse.disable()
+    head_commit = utils.extract_commit_from_head()
+    if head_commit: 
+        checkout_tree(utils.extract_tree_from_commit(head_commit), jobs, True)
 
-def status(): 
+def status(jobs: int = 0): 
     #display current branch
     current_ref = utils.extract_ref_from_head()
     if current_ref: 
@@ -337,51 +533,214 @@ def status():
         head_commit = utils.extract_commit_from_head()
         print(f"Detached head at {head_commit}")
 
-    #display modified unstaged files
-    modified_files = []
     cache_handler = cache.CacheHandeler()
     loaded_cache = cache_handler.load_cache()
-    cache_content_array = loaded_cache.contents
-    cache_file_paths_array = [x.file_path for x in cache_content_array]
-
-    for cache_entry in cache_content_array: 
-        file_path, sha1 = cache_entry.file_path, cache_entry.sha1
-        fileObject = models.ByteFile(None, None, None)   
-        cat_file(sha1, fileObject)
-
-        #write cache file -> temp file 
-        #compare temp file with current file
-        with tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as temp: 
-            temp.write(fileObject.content)
-            temp.flush()
-            temp_file_path = os.path.join('.', temp.name)
-            diff_output = utils.run_diff_with_diffstat(temp_file_path, file_path)
-            
-        if diff_output != " 0 files changed": 
-            modified_files.append(file_path)
-
-    if modified_files: 
-        print("Changes to be commited: ")
-        for file in modified_files: 
-            print(f"\t{file}")
+    index_mtime_ns = cache_handler.index_mtime_ns()
+
+    #index against HEAD, then working tree against index. with a running fsmonitor only
+    #the paths it reported and the ones that differed last time are looked at
+    staged = staged_changes(loaded_cache, utils.extract_commit_from_head())
+    token, candidates = fsmonitor_candidates(loaded_cache)
+    if candidates is None: 
+        unstaged, refreshed = unstaged_changes(loaded_cache, index_mtime_ns, jobs)
+        #directories listed before and unchanged since come from the untracked cache,
+        #the index lookup is a bisect over its sorted paths
+        files, listed = ignore.walk_files_cached(loaded_cache.untracked_cache, (index_mtime_ns // 10**9) * 10**9)
+        untracked_files = [file for file in files if file not in loaded_cache]
+    else: 
+        entries, untracked_files = candidate_files(loaded_cache, candidates)
+        unstaged, refreshed = unstaged_changes(loaded_cache, index_mtime_ns, jobs, entries)
+        listed = 0
+    untracked_files = outside_sparse_dirs(loaded_cache, untracked_files)
+
+    #files whose content matched get fresh stat data and new listings are kept, so the next status skips them
+    dirty = {file for __, file in unstaged} | set(untracked_files)
+    if refreshed or listed or token != loaded_cache.fsmonitor_token or (token and dirty != loaded_cache.fsmonitor_dirty): 
+        loaded_cache.fsmonitor_token = token
+        loaded_cache.fsmonitor_dirty = dirty if token else set()
+        cache_handler.save_cache(loaded_cache)
+
+    if staged: 
+        print("Changes to be committed: ")
+        for label, file in staged: 
+            print(f"\t{label + ':':<12}{file}")
         print()
 
-    #display untracked files
-    untracked_files = []
-    all_files = utils.get_all_files()
-    cwd = os.getcwd()
-    relative_paths = [os.path.relpath(file_path, cwd) for file_path in all_files]
-
-    for file in relative_paths: 
-        if file not in cache_file_paths_array: 
-            untracked_files.append(file)
+    if unstaged: 
+        print("Changes not staged for commit: ")
+        for label, file in unstaged: 
+            print(f"\t{label + ':':<12}{file}")
+        print()
 
     if untracked_files: 
         print("Untracked files: ")
         for file in untracked_files: 
             print(f"\t{file}")
 
-def merge(merge_target_branch: str): 
+def staged_changes(current_cache: cache.Cache, head_commit: str) -> List[Tuple[str, str]]: 
+    #(label, path) for every difference between the HEAD tree and the index
+    tree_sha = utils.extract_tree_from_commit(head_commit) if head_commit else ""
+    changes = []
+    for file_path, index_sha, head_sha in index_tree_changes(current_cache, tree_sha): 
+        if head_sha is None: 
+            changes.append(("new file", file_path))
+        elif index_sha is None: 
+            changes.append(("deleted", file_path))
+        else: 
+            changes.append(("modified", file_path))
+    return changes
+
+def index_tree_changes(current_cache: cache.Cache, tree_sha: str, trees: dict = None, excluded=None) -> List[Tuple[str, str, str]]: 
+    #(path, sha1 in the index, sha1 in the tree) for every blob that differs, None where a
+    #side lacks it, sorted by path. directories whose cached tree id equals the subtree are
+    #not compared. trees, when given, gets the sha1 of every directory of the tree read.
+    #a directory for which excluded(dir_path) holds is compared as one "dir/" path against
+    #a sparse directory entry, by default the directories that have one in the index
+    excluded = excluded or (lambda dir_path: dir_path in current_cache)
+    tree_blobs = {}
+    skipped = []
+    stack = [(tree_sha, "")] if tree_sha else []
+    while stack: 
+        tree_sha, dir_path = stack.pop()
+        #a cached tree only stands for the index while it covers as many entries as are there
+        cached = current_cache.tree_cache.get(dir_path.rstrip("/"))
+        if cached and cached[0] == tree_sha: 
+            lo, hi = current_cache.prefix_range(dir_path)
+            if hi - lo == cached[1]: 
+                skipped.append((lo, hi))
+                continue
+        if trees is not None: 
+            trees[dir_path.rstrip("/")] = tree_sha
+        if dir_path and excluded(dir_path): 
+            tree_blobs[dir_path] = tree_sha
+            continue
+        for file_type, hash_code, file_name in read_tree(tree_sha): 
+            if file_type == "blob": 
+                tree_blobs[dir_path + file_name] = hash_code
+            else: 
+                stack.append((hash_code, file_name + "/"))
+
+    changes = []
+    skipped.sort()
+    i = 0
+    for lo, hi in skipped + [(len(current_cache.contents), len(current_cache.contents))]: 
+        for entry in current_cache.contents[i:lo]: 
+            blob_sha = tree_blobs.pop(entry.file_path, None)
+            if blob_sha != entry.sha1: 
+                changes.append((entry.file_path, entry.sha1, blob_sha))
+        i = max(i, hi)
+    changes += [(file_path, None, blob_sha) for file_path, blob_sha in tree_blobs.items()]
+    changes.sort()
+    return changes
+
+def fsmonitor_candidates(current_cache: cache.Cache) -> Tuple[str, set]: 
+    #(new fsmonitor token, paths that may no longer match the index). the paths are None
+    #when every file has to be looked at, also after an ignore file changed
+    token, changed = fsmonitor.query(current_cache.fsmonitor_token)
+    if changed is None or any(os.path.basename(path) == ignore.IGNORE_FILE for path in changed): 
+        return (token, None)
+    return (token, set(changed) | current_cache.fsmonitor_dirty)
+
+def candidate_files(current_cache: cache.Cache, candidates: set) -> Tuple[List[cache.CacheEntry], List[str]]: 
+    #the index entries and the untracked files at or below the candidate paths
+    entries = {}
+    untracked = set()
+    rules = ignore.load_rules()
+    for path in candidates: 
+        path = path.rstrip("/")
+        entry = current_cache.get(path)
+        if entry: 
+            entries[path] = entry
+        for entry in current_cache.entries_under(path): 
+            entries[entry.file_path] = entry
+
+        if os.path.isdir(path) and not os.path.islink(path): 
+            untracked.update(file for file in ignore.walk_files(rules, path) if file not in current_cache)
+        elif path not in current_cache and os.path.lexists(path) and not rules.is_excluded(path): 
+            untracked.add(path)
+    return ([entries[x] for x in sorted(entries)], sorted(untracked))
+
+def working_tree_files() -> List[str]: 
+    #the files update-cache . has to stage, only the candidates when a fsmonitor is running
+    current_cache = cache.CacheHandeler().load_cache()
+    token, candidates = fsmonitor_candidates(current_cache)
+    if candidates is None: 
+        return outside_sparse_dirs(current_cache, utils.get_all_files())
+    entries, untracked = candidate_files(current_cache, candidates)
+    files = {entry.file_path for entry in entries if not entry.flags & cache.SKIP_WORKTREE} | set(untracked)
+    return outside_sparse_dirs(current_cache, sorted(files))
+
+def outside_sparse_dirs(current_cache: cache.Cache, file_paths: List[str]) -> List[str]: 
+    #a file made inside a directory left out by sparse checkout is neither untracked nor staged
+    sparse_dirs = tuple(entry.file_path for entry in current_cache.contents if entry.flags & cache.SKIP_WORKTREE)
+    if not sparse_dirs: 
+        return file_paths
+    return [file for file in file_paths if not file.startswith(sparse_dirs)]
+
+def expand_sparse_dirs(current_cache: cache.Cache, file_paths: List[str], jobs: int = 0) -> List[str]: 
+    #a path under a directory left out by sparse checkout cannot sit next to that directory's
+    #single entry, so the entry is replaced by the files of its subtree and those are written
+    #to the working tree, keeping any file already there. returns the directories expanded,
+    #the next sparse-checkout reapply leaves them out again
+    expanded = []
+    for dir_path in sorted({os.path.dirname(file_path) for file_path in file_paths} - {""}): 
+        parts = dir_path.split("/")
+        for depth in range(1, len(parts) + 1): 
+            sparse_dir = "/".join(parts[:depth]) + "/"
+            entry = current_cache.get(sparse_dir)
+            if entry and entry.flags & cache.SKIP_WORKTREE: 
+                current_cache.remove_prefix(sparse_dir)
+                utils.load_tree_into_cache(entry.sha1, sparse_dir, current_cache)
+                expanded.append(sparse_dir)
+                break
+    if expanded: 
+        entries = [entry for dir_path in expanded for entry in current_cache.entries_under(dir_path) if not os.path.lexists(entry.file_path)]
+        utils.load_cache_into_working_tree(entries, jobs)
+    return expanded
+
+def unstaged_changes(current_cache: cache.Cache, index_mtime_ns: int, jobs: int = 0, entries: List[cache.CacheEntry] = None) -> Tuple[List[Tuple[str, str]], int]: 
+    #(label, path) for every tracked file that differs from the index, and how many
+    #entries had their stat data refreshed because only the stat data had changed.
+    #entries limits the comparison to those index entries
+    changes = []
+    to_hash = []
+    for entry in (current_cache.contents if entries is None else entries): 
+        #left out of the working tree by sparse checkout
+        if entry.flags & cache.SKIP_WORKTREE: 
+            continue
+        try: 
+            st = os.stat(entry.file_path)
+        except FileNotFoundError: 
+            changes.append(("deleted", entry.file_path))
+            continue
+
+        #matching stat data means the file is unchanged, unless it is racily clean
+        if cache.stat_matches(entry, st) and not cache.is_racy(entry, index_mtime_ns): 
+            continue
+        #a different size is a change whatever the content
+        if entry.mtime_ns and entry.size != st.st_size: 
+            changes.append(("modified", entry.file_path))
+            continue
+        to_hash.append((entry, st))
+
+    if len(to_hash) > 1 and jobs != 1: 
+        with ThreadPoolExecutor(max_workers=jobs or None) as executor: 
+            shas = list(executor.map(file_sha, [x[0].file_path for x in to_hash]))
+    else: 
+        shas = [file_sha(x[0].file_path) for x in to_hash]
+
+    refreshed = 0
+    for (entry, st), sha1 in zip(to_hash, shas): 
+        if sha1 == entry.sha1: 
+            cache.fill_stat(entry, st)
+            refreshed += 1
+        else: 
+            changes.append(("modified", entry.file_path))
+
+    changes.sort(key=lambda x: x[1])
+    return (changes, refreshed)
+
+def merge(merge_target_branch: str, jobs: int = 0): 
     #check error cases
     current_branch = utils.extract_ref_from_head()
     if not current_branch: 
@@ -393,41 +752,40 @@ def merge(merge_target_branch: str):
         print("Merge branch does not exist")
         return 0 
 
-    #create array of commit histories 
     with open(".git/refs/heads/" + current_branch) as file: 
         current_commit_sha = file.read()
 
     with open(".git/refs/heads/" + merge_target_branch) as file: 
         merge_commit_sha = file.read()
 
-    current_commit_history = []
-    merge_commit_history = []
+    merge_bases = revision.merge_bases(current_commit_sha, merge_commit_sha)
+    if not merge_bases: 
+        print("Branches have no common ancestor")
+        return 0 
 
-    list_commit_history_from_commit(current_commit_sha, current_commit_history)
-    list_commit_history_from_commit(merge_commit_sha, merge_commit_history)
+    if merge_commit_sha in merge_bases: 
+        print("Already up to date")
+        return 1 
 
     #check for fast forward
-    for sha in merge_commit_history: 
-        if sha == current_commit_sha: 
-            print("Merged with fast-forward")
-            with open(".git/refs/heads/" + current_branch, "w") as file: 
-                file.write(merge_commit_sha)
-            return 1 
-
-    #find common ancestor
-    common_ancestor = find_common_ancestor(current_commit_history, merge_commit_history)
-
-    #create merge in working tree
-    checkout("", common_ancestor)
-    apply_threeway_merge(common_ancestor, current_commit_sha, merge_commit_sha)
+    if current_commit_sha in merge_bases: 
+        print("Merged with fast-forward")
+        with open(".git/refs/heads/" + current_branch, "w") as file: 
+            file.write(merge_commit_sha)
+        return 1 
+
+    common_ancestor = merge_bases[0]
+
+    #merge the other branch into the working tree and index
+    conflicts = apply_threeway_merge(common_ancestor, current_commit_sha, merge_commit_sha, current_branch, merge_target_branch, jobs)
+    if conflicts: 
+        for file in conflicts: 
+            print(f"CONFLICT: Merge conflict in {file}")
+        with open(MERGE_HEAD, "w") as file: 
+            file.write(merge_commit_sha)
+        print("Automatic merge failed; fix conflicts, update-cache the files and commit the result")
+        return 0 
 
-    #create tree
-    cache_handler = cache.CacheHandeler()
-    cache_handler.remove_all()
-    all_files = []
-    get_all_files_from_three_commits(common_ancestor, current_commit_sha, merge_commit_sha, all_files)
-    for file in all_files: 
-        update_cache(file)
     working_tree_sha = write_tree()
 
     #create new commit 
@@ -443,285 +801,170 @@ def merge(merge_target_branch: str):
 
     return 1 
 
-def list_commit_history_from_commit(commit_sha: str, history: List[str]): 
-    history.append(commit_sha)
-    prev_commit_sha = utils.extract_commit_from_commit(commit_sha)
-    if not prev_commit_sha: 
-        return
-
-    list_commit_history_from_commit(prev_commit_sha, history)
-
-def find_common_ancestor(array_1: List[str], array_2: List[str]): 
-    s1 = set(array_1)
-    s2 = set(array_2)
-
-    intersection = s1.intersection(s2)
-    for ele in array_1: 
-        if ele in intersection: 
-            return ele
-
-def get_all_files_from_three_commits(a: str, b: str, c: str, all_files_list: List[str]): 
-    # exclude files which are only in ancestor 
-    a_tree = utils.extract_tree_from_commit(a)
-    b_tree = utils.extract_tree_from_commit(b)
-    c_tree = utils.extract_tree_from_commit(c)
-
-    a_hash, b_hash, c_hash = {}, {}, {}
-    load_tree_into_hash(a_tree, "", a_hash)
-    load_tree_into_hash(b_tree, "", b_hash)
-    load_tree_into_hash(c_tree, "", c_hash)
-
-    for key in b_hash.keys(): 
-        all_files_list.append(key)
-
-    for key in c_hash.keys(): 
-        all_files_list.append(key)
-
-    for key in a_hash.keys(): 
-        if key not in b_hash and key not in c_hash: 
-            continue
-        all_files_list.append(key) 
-
+def merge_base(commit_a: str, commit_b: str) -> List[str]: 
+    return revision.merge_bases(utils.resolve_commit(commit_a), utils.resolve_commit(commit_b))
 
-def apply_threeway_merge(ancestor_sha: str, m1_sha: str, m2_sha: str): 
+def apply_threeway_merge(ancestor_sha: str, m1_sha: str, m2_sha: str, m1_label: str = "ours", m2_label: str = "theirs", jobs: int = 0) -> List[str]: 
+    #brings the changes m2 made since the ancestor into the working tree and index,
+    #which hold m1. returns the conflicted paths, which are left out of the index.
+    #blobs taken whole from one side are written together on a thread pool
     ancestor_tree = utils.extract_tree_from_commit(ancestor_sha)
-    m1_tree = utils.extract_tree_from_commit(m1_sha)
-    m2_tree = utils.extract_tree_from_commit(m2_sha)
-
-    ancestor_hash, m1_hash, m2_hash = {}, {}, {}
-    load_tree_into_hash(ancestor_tree, "", ancestor_hash)
-    load_tree_into_hash(m1_tree, "", m1_hash)
-    load_tree_into_hash(m2_tree, "", m2_hash)
-    
-    common_file_set = set(ancestor_hash.keys()) & set(m1_hash.keys()) & set(m2_hash.keys()) 
-    for key in common_file_set: 
-        apply_merge(key, m1_hash[key], m2_hash[key])
-        m1_hash.pop(key)
-        m2_hash.pop(key)
-
-    # files in ancestor and current branch or ancestor and merge branch
-    # but not in all three branches
-    ancestor_and_current_set = set(ancestor_hash).intersection(set(m1_hash))
-    for file in ancestor_and_current_set: 
-        temp_file_ancestor = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-        temp_file_current = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-        _ancestor_sha = ancestor_hash[file]
-        current_sha = m1_hash[file]
-        fileObject = models.ByteFile(None, None, None)
-        cat_file(_ancestor_sha, fileObject)
-        temp_file_ancestor.write(fileObject.content)
-        temp_file_ancestor.flush()
-        cat_file(current_sha, fileObject)
-        temp_file_current.write(fileObject.content)
-        temp_file_current.flush()
-
-        diff_string = utils.run_diff(temp_file_ancestor.name, temp_file_current.name, file, file)
-        apply_patch(diff_string)
-        print(diff_string)
-
-        temp_file_ancestor.close()
-        temp_file_current.close()
-        m1_hash.pop(file)
-
-    ancestor_and_merge_set = set(ancestor_hash).intersection(set(m2_hash))
-    for file in ancestor_and_merge_set: 
-        temp_file_ancestor = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-        temp_file_merge = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-        _ancestor_sha = ancestor_hash[file]
-        merge_sha = m2_hash[file]
-        fileObject = models.ByteFile(None, None, None)
-        cat_file(_ancestor_sha, fileObject)
-        temp_file_ancestor.write(fileObject.content)
-        temp_file_ancestor.flush()
-        cat_file(merge_sha, fileObject)
-        temp_file_merge.write(fileObject.content)
-        temp_file_merge.flush()
-
-        diff_string = utils.run_diff(temp_file_ancestor.name, temp_file_merge.name, file, file)
-        apply_patch(diff_string)
-
-        temp_file_ancestor.close()
-        temp_file_merge.close()
-        m2_hash.pop(file)
-
-    # files in both current and merge branch but not ancestor 
-    # merge branch -> current branch
-    conflict_file_set = set(m1_hash).intersection(set(m2_hash))
-    for file in conflict_file_set: 
-        temp_file_current = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-        temp_file_merge = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-        current_sha = m1_hash[file]
-        merge_sha = m2_hash[file]
-        fileObject = models.ByteFile(None, None, None)
-        cat_file(current_sha, fileObject)
-        #load the current version before running the patch 
-        os.makedirs(os.path.dirname(file), exist_ok=True)
-        with open(file, "w") as f:
-            f.write(fileObject.content) 
-            f.flush()
-        temp_file_current.write(fileObject.content)
-        temp_file_current.flush()
-        cat_file(merge_sha, fileObject)
-        temp_file_merge.write(fileObject.content)
-        temp_file_merge.flush()
-
-        diff_string = utils.run_diff(temp_file_merge.name, temp_file_current.name, file, file)
-        apply_patch(diff_string)
-
-        temp_file_current.close()
-        temp_file_merge.close()
-        m2_hash.pop(file)
-
-    # files exclusive to current or merge branch
-    for file in m1_hash.keys(): 
-        file_sha = m1_hash[file]
-        write_sha_into_working_tree(file, file_sha)
-
-    for file in m2_hash.keys(): 
-        file_sha = m2_hash[file]
-        write_sha_into_working_tree(file, file_sha)
-
-def apply_merge(fileA: str, fileB_sha: str, fileC_sha: str): 
-    tempB = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-    tempC = tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True)
-    fileObject = models.ByteFile(None, None, None)
+    m1_changes = {x[0]: x[2] for x in diff_trees(ancestor_tree, utils.extract_tree_from_commit(m1_sha))}
+    m2_changes = diff_trees(ancestor_tree, utils.extract_tree_from_commit(m2_sha))
 
-    cat_file(fileB_sha, fileObject)
-    tempB.write(fileObject.content)
-    tempB.flush()
-    tempB_file_path = os.path.join('.', tempB.name)
-    cat_file(fileC_sha, fileObject)
-    tempC.write(fileObject.content)
-    tempC.flush()
-    tempC_file_path = os.path.join('.', tempC.name)
+    cache_handler = cache.CacheHandeler()
+    current_cache = cache_handler.load_cache()
+    expand_sparse_dirs(current_cache, [file for file, __, __ in m2_changes], jobs)
+    conflicts = []
+    removed = []
+    taken = []
+    for file, ancestor_blob, m2_blob in m2_changes: 
+        #only changed on the merged branch
+        if file not in m1_changes: 
+            if m2_blob is None: 
+                removed.append(file)
+            else: 
+                taken.append(cache.CacheEntry("blob", 0, m2_blob, file))
+            continue
 
-    tempB_rel_file_path = utils.get_rel_path(tempB_file_path)
-    tempC_rel_file_path = utils.get_rel_path(tempC_file_path)
-    subprocess.run(f"merge {fileA} {tempB_rel_file_path} {tempC_rel_file_path}", shell=True)
+        m1_blob = m1_changes[file]
+        if m1_blob == m2_blob: 
+            continue
 
-    tempB.close()
-    tempC.close()
+        #deleted on one side and changed on the other
+        if m1_blob is None or m2_blob is None: 
+            write_sha_into_working_tree(file, m1_blob or m2_blob)
+            conflicts.append(file)
+            continue
 
-def write_sha_into_working_tree(file_path: str, file_sha: str): 
+        content, conflict_count = merge_file(ancestor_blob, m1_blob, m2_blob, m1_label, m2_label)
+        os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+        with open(file, "wb") as f: 
+            f.write(content)
+        if conflict_count: 
+            conflicts.append(file)
+            continue
+        stage_file(current_cache, file, write_object("blob", content))
+
+    utils.load_cache_into_working_tree(taken, jobs)
+    cache.merge_entries(current_cache, taken)
+    current_cache.remove_many(removed)
+    utils.delete_files_and_directories(removed)
+    cache_handler.save_cache(current_cache)
+    return conflicts
+
+def merge_file(ancestor_sha: str, m1_sha: str, m2_sha: str, m1_label: str, m2_label: str) -> Tuple[bytes, int]: 
+    #when two of the three blobs are the same the result is known without reading all three
+    if ancestor_sha == m1_sha or m1_sha == m2_sha: 
+        return (read_blob(m2_sha), 0)
+    if ancestor_sha == m2_sha: 
+        return (read_blob(m1_sha), 0)
+
+    ancestor = read_blob(ancestor_sha) if ancestor_sha else b""
+    m1, m2 = read_blob(m1_sha), read_blob(m2_sha)
+    if xdiff.is_binary(ancestor) or xdiff.is_binary(m1) or xdiff.is_binary(m2): 
+        return (m1, 1)
+    return xmerge.merge3(ancestor, m1, m2, m1_label, m2_label)
+
+def read_blob(sha1_hash: str) -> bytes: 
     fileObject = models.ByteFile(None, None, None)
-    cat_file(file_sha, fileObject)
-
+    cat_file(sha1_hash, fileObject)
+    return fileObject.content
+
+def stage_file(current_cache: cache.Cache, file_path: str, sha1_hash: str) -> None: 
+    #records a file just written to the working tree, with its stat data
+    st = os.stat(file_path)
+    entry = cache.CacheEntry("blob", st.st_mode, sha1_hash, file_path)
+    cache.fill_stat(entry, st)
+    current_cache.insert(entry)
+
+def write_sha_into_working_tree(file_path: str, file_sha: str, make_dirs: bool = True) -> os.stat_result: 
+    #returns the stat data of the written file for the index
     dir_path = os.path.dirname(file_path)
-    if dir_path:  # Ensure the directory structure exists only if dir_path is not empty
+    if make_dirs and dir_path:  # Ensure the directory structure exists only if dir_path is not empty
         os.makedirs(dir_path, exist_ok=True)
 
-    with open(file_path, "w") as file: 
-        file.write(fileObject.content)
+    with open_object(file_sha) as stream, open(file_path, "wb") as file: 
+        shutil.copyfileobj(stream, file, SIZE)
+        file.flush()
+        return os.fstat(file.fileno())
 
 def diff(commitA: str, commitB: str): 
     diff_string = ""
     treeA_sha = utils.extract_tree_from_commit(commitA)
     treeB_sha = utils.extract_tree_from_commit(commitB)
 
-    treeA_dict = {} 
-    treeB_dict = {}
-    load_tree_into_hash(treeA_sha, "", treeA_dict)
-    load_tree_into_hash(treeB_sha, "", treeB_dict)
-    common_files = set(treeA_dict.keys()) & set(treeB_dict.keys())
-
-    #compare common files 
-    for file in common_files: 
-        shaA = treeA_dict[file]
-        shaB = treeB_dict[file]
+    #only paths whose blobs differ are read and compared
+    for file, shaA, shaB in diff_trees(treeA_sha, treeB_sha): 
         fileObjectA = models.ByteFile(None, None, None)
         fileObjectB = models.ByteFile(None, None, None)
-        cat_file(shaA, fileObjectA)
-        cat_file(shaB, fileObjectB)
-
-        with tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as tempA, tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as tempB:       
-            tempA.write(fileObjectA.content)
-            tempB.write(fileObjectB.content)
-            tempA.flush()
-            tempB.flush()
-            tempA_file_path = os.path.join('.', tempA.name)
-            tempB_file_path = os.path.join('.', tempB.name)
-            rel_file_path = utils.get_rel_path(file)
-            output = utils.run_diff(tempB_file_path, tempA_file_path, rel_file_path, rel_file_path)
-            #print(output)
-            diff_string += output  
-            diff_string += '\n'
-            
-
-        treeA_dict.pop(file)
-        treeB_dict.pop(file)
-        print()
-        
-
-    #diff unshared files
-    #files in A but not B
-    for file in treeA_dict.keys(): 
-        shaA = treeA_dict[file]
-        fileObjectA = models.ByteFile(None, None, None)
-        cat_file(shaA, fileObjectA)
-
-        with tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as tempA: 
-            tempA.write(fileObjectA.content)
-            tempA.flush()
-            tempA_file_path = os.path.join('.', tempA.name)
-            rel_file_path = utils.get_rel_path(file)
-            output = utils.run_diff(DEV_NULL_FILE, tempA_file_path, DEV_NULL_FILE.lstrip("/"), rel_file_path)
-            #print(output)
-            diff_string += output 
-            diff_string += '\n'
-
-    #files in B but not in A
-    for file in treeB_dict.keys(): 
-        shaB = treeB_dict[file]
-        fileObjectB = models.ByteFile(None, None, None)
-        cat_file(shaB, fileObjectB)
-        with tempfile.NamedTemporaryFile(mode="w+t", dir=".", delete=True) as tempB: 
-            tempB.write(fileObjectB.content)
-            tempB.flush()
-            tempB_file_path = os.path.join('.', tempB.name)
-            rel_file_path = utils.get_rel_path(file)
-            output = utils.run_diff(tempB_file_path, DEV_NULL_FILE, rel_file_path, DEV_NULL_FILE.lstrip("/"))
-            #print(output)
-            diff_string += output 
-            diff_string += '\n'
+        if shaA: 
+            cat_file(shaA, fileObjectA)
+        if shaB: 
+            cat_file(shaB, fileObjectB)
+
+        rel_file_path = utils.get_rel_path(file)
+        if shaA and shaB: 
+            output = xdiff.unified_diff(fileObjectB.content, fileObjectA.content, rel_file_path, rel_file_path)
+        elif shaA: 
+            #files in A but not B
+            output = xdiff.unified_diff(b"", fileObjectA.content, DEV_NULL_FILE.lstrip("/"), rel_file_path)
+        else: 
+            #files in B but not in A
+            output = xdiff.unified_diff(fileObjectB.content, b"", rel_file_path, DEV_NULL_FILE.lstrip("/"))
+        diff_string += output 
+        diff_string += '\n'
 
     return diff_string
 
-
-def load_tree_into_hash(tree_sha: str, dir_path: str, hash: dict): 
+def read_tree(tree_sha: str) -> List[Tuple[str, str, str]]: 
+    #(type, sha1, name) per entry, blob names are relative to the tree and tree names are full paths
     fileObject = models.ByteFile(None, None, None)
     cat_file(tree_sha, fileObject)
+    if not fileObject.content: 
+        return []
 
-    tree = fileObject.content.split(" ")
-    n = len(tree)
-    for i in range(0, n, 3):
-        file_type = tree[i]
-        hash_code = tree[i + 1]
-        file_name = tree[i + 2]
+    tree = fileObject.content.decode("utf-8").split(" ")
+    return [(tree[i], tree[i + 1], tree[i + 2]) for i in range(0, len(tree), 3)]
 
+def load_tree_into_hash(tree_sha: str, dir_path: str, hash: dict): 
+    for file_type, hash_code, file_name in read_tree(tree_sha): 
         if file_type == "blob": 
             hash[dir_path + file_name] = hash_code
 
         if file_type == "tree": 
             load_tree_into_hash(hash_code, file_name + "/", hash)
 
+def diff_trees(treeA_sha: str, treeB_sha: str) -> List[Tuple[str, str, str]]: 
+    #(path, sha1 in A, sha1 in B) for every blob that differs, None where a side lacks it.
+    #subtrees with the same sha1 on both sides are never read
+    changes = []
+    stack = [(treeA_sha, treeB_sha, "")]
+    while stack: 
+        shaA, shaB, dir_path = stack.pop()
+        if shaA == shaB: 
+            continue
 
-def apply_patch(diff_text: str):
-    # Create a temporary file to hold the patch
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False) as tmpfile:
-        tmpfile.write(diff_text)
-        tmpfile.flush()
-        tmpfile_name = tmpfile.name
-
-    try:
-        # Run the 'patch' command to apply the patch
-        subprocess.run(f"patch --batch -p1 < {tmpfile_name} > /dev/null 2>&1", check=True, shell=True)
-        print(f"Patch applied successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred while applying the patch: {e}")
-    finally:
-        # Delete the temporary file
-        os.remove(tmpfile_name)
-
+        entriesA, entriesB = {}, {}
+        if shaA: 
+            for file_type, hash_code, file_name in read_tree(shaA): 
+                entriesA[(file_type, dir_path + file_name if file_type == "blob" else file_name)] = hash_code
+        if shaB: 
+            for file_type, hash_code, file_name in read_tree(shaB): 
+                entriesB[(file_type, dir_path + file_name if file_type == "blob" else file_name)] = hash_code
+
+        for key in entriesA.keys() | entriesB.keys(): 
+            file_type, path = key
+            entryA, entryB = entriesA.get(key), entriesB.get(key)
+            if entryA == entryB: 
+                continue
+            if file_type == "tree": 
+                stack.append((entryA, entryB, path + "/"))
+            else: 
+                changes.append((path, entryA, entryB))
+
+    changes.sort()
+    return changes
 
 #-----------------------------------
 
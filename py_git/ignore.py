@@ -0,0 +1,226 @@
+import os
+import re
+import py_git.cache as cache
+from typing import Iterator, List, Set, Tuple
+
+#what the walker always skipped before ignore files existed: .git and other dot
+#directories, and the py_git package itself
+DEFAULT_PATTERNS = [".*/", "py_git/"]
+IGNORE_FILE = ".gitignore"
+EXCLUDE_FILE = ".git/info/exclude"
+
+def translate(pattern: str) -> str:
+    #gitignore glob to regex, "*" and "?" stay inside one path component
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == n and (i == 0 or pattern[i - 1] == "/"):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            #a "]" straight after "[" or "[!" is part of the class, so the class is never empty
+            first = i + 2 if pattern.startswith("[!", i) or pattern.startswith("[^", i) else i + 1
+            end = pattern.find("]", first + 1)
+            if end == -1:
+                out.append(re.escape("["))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            body = "[" + body.replace("\\", "\\\\").replace("[", "\\[") + "]"
+            try:
+                re.compile(body)
+            except re.error:
+                #a reversed range such as [z-a] matches nothing
+                body = "(?!)"
+            out.append(body)
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+class Rule():
+    """One line of an ignore file, matched against paths below the directory holding it."""
+    def __init__(self, pattern: str, base_dir: str = "") -> None:
+        self.base_dir = base_dir
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        #a slash anywhere but the end ties the pattern to base_dir, otherwise it matches at any depth
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        self.regex = re.compile(("" if anchored else "(?:.*/)?") + translate(pattern) + r"\Z", re.DOTALL)
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base_dir:
+            if not path.startswith(self.base_dir):
+                return False
+            path = path[len(self.base_dir):]
+        return self.regex.match(path) is not None
+
+def parse_lines(lines: List[str]) -> List[str]:
+    patterns = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip("\r")
+        #trailing spaces are dropped unless escaped
+        stripped = line.rstrip(" ")
+        if stripped.endswith("\\") and len(stripped) < len(line):
+            stripped += " "
+        if not stripped or stripped.startswith("#"):
+            continue
+        patterns.append(stripped)
+    return patterns
+
+class IgnoreRules():
+    """Ignore patterns from every source, the last matching pattern decides.
+
+    Rules are kept lowest precedence first: the defaults, .git/info/exclude, then
+    .gitignore files from the top of the tree down."""
+    def __init__(self, patterns: List[str] = DEFAULT_PATTERNS) -> None:
+        self.rules: List[Rule] = [Rule(x) for x in patterns]
+        self.loaded_dirs: Set[str] = set()
+
+    def add_patterns(self, patterns: List[str], base_dir: str = "") -> None:
+        self.rules += [Rule(x, base_dir) for x in patterns]
+
+    def add_file(self, file_path: str, base_dir: str = "") -> None:
+        if not os.path.isfile(file_path):
+            return
+        with open(file_path, "r", encoding="utf-8", errors="replace") as file:
+            self.add_patterns(parse_lines(file.readlines()), base_dir)
+
+    def load_dir(self, dir_path: str) -> None:
+        #reads the .gitignore of dir_path, "" or ending in "/", once
+        if dir_path not in self.loaded_dirs:
+            self.loaded_dirs.add(dir_path)
+            self.add_file(dir_path + IGNORE_FILE, dir_path)
+
+    def is_excluded(self, path: str, is_dir: bool = False) -> bool:
+        #ignored itself or inside an ignored directory, reading the .gitignore files on the way down
+        dir_path = ""
+        for part in path.split("/")[:-1]:
+            self.load_dir(dir_path)
+            dir_path += part
+            if self.is_ignored(dir_path, True):
+                return True
+            dir_path += "/"
+        self.load_dir(dir_path)
+        return self.is_ignored(path, is_dir)
+
+    def is_ignored(self, path: str, is_dir: bool = False) -> bool:
+        for rule in reversed(self.rules):
+            if rule.matches(path, is_dir):
+                return not rule.negate
+        return False
+
+def load_rules() -> IgnoreRules:
+    rules = IgnoreRules()
+    rules.add_file(EXCLUDE_FILE)
+    return rules
+
+def walk_files(rules: IgnoreRules = None, top: str = "") -> Iterator[str]:
+    #paths of files below the directory top, the repository root by default, that are
+    #not ignored, with "/" separators and sorted per directory. ignored directories are
+    #never opened, and each directory's .gitignore is read before its entries are matched
+    rules = rules or load_rules()
+    if top and rules.is_excluded(top, True):
+        return
+    stack = [top + "/" if top else ""]
+    while stack:
+        dir_path = stack.pop()
+        rules.load_dir(dir_path)
+
+        subdirs = []
+        with os.scandir(dir_path or ".") as entries:
+            for entry in sorted(entries, key=lambda x: x.name):
+                path = dir_path + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not rules.is_ignored(path, True):
+                        subdirs.append(path + "/")
+                elif not rules.is_ignored(path):
+                    yield path
+        stack.extend(reversed(subdirs))
+
+def file_stat(path: str) -> Tuple[int, int]:
+    #(mtime_ns, size), zeros when the file does not exist
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+def list_dir(dir_path: str, rules: IgnoreRules) -> Tuple[List[str], List[str]]:
+    #sorted names of the files and of the subdirectories in dir_path that are not ignored
+    files = []
+    dirs = []
+    with os.scandir(dir_path or ".") as entries:
+        for entry in sorted(entries, key=lambda x: x.name):
+            path = dir_path + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not rules.is_ignored(path, True):
+                    dirs.append(entry.name)
+            elif not rules.is_ignored(path):
+                files.append(entry.name)
+    return (files, dirs)
+
+def walk_files_cached(untracked_cache: cache.UntrackedCache, racy_ns: int, rules: IgnoreRules = None) -> Tuple[List[str], int]:
+    #the same files as walk_files, and how many directories had to be listed. a directory
+    #keeps its cached listing while its mtime and its .gitignore are unchanged, unless the
+    #rules of a directory above it changed. a listing of a directory modified at or after
+    #racy_ns may have missed a change in the same timestamp tick and is not trusted
+    rules = rules or load_rules()
+    exclude_stat = file_stat(EXCLUDE_FILE)
+    if untracked_cache.exclude_stat != exclude_stat:
+        untracked_cache.exclude_stat = exclude_stat
+        untracked_cache.dirs = {}
+
+    listings = {}
+    files = []
+    listed = 0
+    stack = [("", False)]
+    while stack:
+        dir_path, rules_changed = stack.pop()
+        try:
+            st = os.stat(dir_path or ".")
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+        listing = untracked_cache.dirs.get(dir_path)
+        ignore_stat = file_stat(dir_path + IGNORE_FILE)
+        if ignore_stat != (0, 0):
+            rules.load_dir(dir_path)
+        rules_changed = rules_changed or listing is None or listing.ignore_stat != ignore_stat
+        if rules_changed or listing.mtime_ns != st.st_mtime_ns or listing.ino != st.st_ino or st.st_mtime_ns >= racy_ns:
+            try:
+                listing = cache.DirListing(st.st_mtime_ns, st.st_ino, ignore_stat, *list_dir(dir_path, rules))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            listed += 1
+
+        listings[dir_path] = listing
+        files += [dir_path + name for name in listing.files]
+        stack.extend((dir_path + name + "/", rules_changed) for name in reversed(listing.dirs))
+
+    #directories that went away drop out with the rest
+    untracked_cache.dirs = listings
+    return (files, listed)
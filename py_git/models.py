@@ -1,4 +1,5 @@
 import hashlib
+import zlib
 from enum import Enum
 
 # class ByteObject(Enum): 
@@ -7,12 +8,78 @@ from enum import Enum
 #     _content = None 
 
 class ByteFile(): 
-    def __init__(self, _type: str, size: int, content: str) -> None:
+    def __init__(self, _type: str, size: int, content: bytes) -> None:
         self.type = _type
         self.size = size
         self.content = content
 
+class InflateReader(): 
+    """File-like reader that inflates a zlib stream only as far as it is read."""
+    def __init__(self, raw, chunk_size: int = 1 << 16) -> None:
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self.decompressor = zlib.decompressobj()
+        self.buffer = b""
+        self.eof = False
+
+    def _inflate(self, max_length: int) -> bytes: 
+        data = self.decompressor.unconsumed_tail
+        if not data: 
+            data = self.raw.read(self.chunk_size)
+            if not data: 
+                self.eof = True
+                return self.decompressor.flush()
+
+        output = self.decompressor.decompress(data, max_length)
+        if self.decompressor.eof: 
+            self.eof = True
+        return output
+
+    def read(self, n: int = -1) -> bytes: 
+        if n is None or n < 0: 
+            parts = [self.buffer]
+            while not self.eof: 
+                parts.append(self._inflate(self.chunk_size))
+            self.buffer = b""
+            return b"".join(parts)
+
+        while len(self.buffer) < n and not self.eof: 
+            self.buffer += self._inflate(max(n - len(self.buffer), 1))
+        output, self.buffer = self.buffer[:n], self.buffer[n:]
+        return output
+
+    def read_until(self, delimiter: bytes, limit: int = 1024) -> bytes: 
+        #inflate in small steps so finding a header never inflates the body
+        while delimiter not in self.buffer and not self.eof and len(self.buffer) < limit: 
+            self.buffer += self._inflate(64)
+        index = self.buffer.find(delimiter)
+        if index == -1: 
+            raise ValueError("delimiter not found in stream")
+        output, self.buffer = self.buffer[:index], self.buffer[index + len(delimiter):]
+        return output
+
+    def close(self) -> None: 
+        self.raw.close()
+
+class ObjectStream(): 
+    """Header of a stored object plus its body as a lazily inflated stream."""
+    def __init__(self, _type: str, size: int, body) -> None:
+        self.type = _type
+        self.size = size
+        self.body = body
+
+    def read(self, n: int = -1) -> bytes: 
+        return self.body.read(n)
+
+    def close(self) -> None: 
+        if hasattr(self.body, "close"): 
+            self.body.close()
+
+    def __enter__(self): 
+        return self
 
+    def __exit__(self, *args) -> None: 
+        self.close()
 
 class Blob:
     """Represents a blob object, which is a SHA-1 hash of file contents."""
@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+class ObjectCache():
+    """Least recently used inflated objects, bounded by the bytes they hold.
+
+    Objects are addressed by their content so entries never need invalidating. A lock
+    keeps the LRU order consistent when objects are read from several threads."""
+    def __init__(self, limit: int = DEFAULT_LIMIT) -> None:
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sha1_hash: str):
+        with self.lock:
+            entry = self.entries.get(sha1_hash)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(sha1_hash)
+            self.hits += 1
+            return entry
+
+    def put(self, sha1_hash: str, _type: str, content: bytes) -> None:
+        #objects bigger than a quarter of the cache would only flush everything else
+        if len(content) > self.limit // 4:
+            return
+        with self.lock:
+            if sha1_hash in self.entries:
+                return
+            self.entries[sha1_hash] = (_type, content)
+            self.size += len(content)
+            while self.size > self.limit:
+                __, (__, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Tuple[int, int, int, int]:
+        return (self.hits, self.misses, len(self.entries), self.size)
+
+    def __str__(self):
+        return f'ObjectCache(hits={self.hits} misses={self.misses} entries={len(self.entries)} bytes={self.size})'
+
+#shared by every reader in the process
+shared = ObjectCache()
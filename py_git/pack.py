@@ -0,0 +1,438 @@
+import os
+import io
+import mmap
+import struct
+import zlib
+import hashlib
+import tempfile
+import threading
+import py_git.models as models
+import py_git.delta as delta
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Tuple
+
+PACK_SIGNATURE = b"PACK"
+INDEX_SIGNATURE = b"\377PIX"
+VERSION = 1
+SIZE = 1 << 16
+
+DEFAULT_WINDOW = 10
+DEFAULT_DEPTH = 50
+#objects above this are streamed into the pack and never deltified
+BIG_FILE_THRESHOLD = 512 * 1024 * 1024
+DELTA_BASE_CACHE_LIMIT = 96 * 1024 * 1024
+#bytes of candidate objects kept in the delta window, their token tables cost a few times more
+WINDOW_MEMORY = 256 * 1024 * 1024
+
+#pack layout: signature, version, object count, then one entry per object
+#(varint type/size header followed by the zlib compressed body) and a trailing sha1.
+#delta entries store the distance back to their base entry before the compressed delta
+#index layout: signature, version, 256 entry fan-out table of cumulative counts,
+#sorted 20 byte shas, 8 byte pack offsets, then the pack sha1 and its own sha1
+PACK_HEADER = struct.Struct(">4sII")
+INDEX_HEADER = struct.Struct(">4sI")
+FANOUT = struct.Struct(">256I")
+OFFSET = struct.Struct(">Q")
+
+TYPE_CODES = {"commit": 1, "tree": 2, "blob": 3}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+OFS_DELTA = 6
+
+def encode_entry_header(type_code: int, size: int) -> bytes:
+    #git style: 3 bit type and low 4 size bits, then 7 size bits per byte
+    byte = (type_code << 4) | (size & 0x0f)
+    size >>= 4
+    header = bytearray()
+    while size:
+        header.append(byte | 0x80)
+        byte = size & 0x7f
+        size >>= 7
+    header.append(byte)
+    return bytes(header)
+
+def decode_entry_header(buffer, offset: int) -> Tuple[int, int, int]:
+    byte = buffer[offset]
+    offset += 1
+    type_code = (byte >> 4) & 0x07
+    size = byte & 0x0f
+    shift = 4
+    while byte & 0x80:
+        byte = buffer[offset]
+        offset += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+    return (type_code, size, offset)
+
+def encode_base_offset(distance: int) -> bytes:
+    out = [distance & 0x7f]
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.append(0x80 | (distance & 0x7f))
+        distance >>= 7
+    return bytes(reversed(out))
+
+def decode_base_offset(buffer, offset: int) -> Tuple[int, int]:
+    byte = buffer[offset]
+    offset += 1
+    distance = byte & 0x7f
+    while byte & 0x80:
+        byte = buffer[offset]
+        offset += 1
+        distance = ((distance + 1) << 7) | (byte & 0x7f)
+    return (distance, offset)
+
+class MemoryReader():
+    """File-like view over a slice of a memory map, nothing is copied until read."""
+    def __init__(self, buffer, offset: int = 0) -> None:
+        self.view = memoryview(buffer)
+        self.position = offset
+
+    def read(self, n: int = -1) -> bytes:
+        end = len(self.view) if n is None or n < 0 else min(self.position + n, len(self.view))
+        data = self.view[self.position:end].tobytes()
+        self.position = end
+        return data
+
+    def close(self) -> None:
+        self.view.release()
+
+class PackIndex():
+    def __init__(self, index_path: str) -> None:
+        self.path = index_path
+        with open(index_path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version = INDEX_HEADER.unpack_from(self.map, 0)
+        if signature != INDEX_SIGNATURE or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{index_path} is not a supported pack index")
+
+        self.fanout = FANOUT.unpack_from(self.map, INDEX_HEADER.size)
+        self.count = self.fanout[255]
+        self.sha_table = INDEX_HEADER.size + FANOUT.size
+        self.offset_table = self.sha_table + 20 * self.count
+
+    def sha_at(self, i: int) -> bytes:
+        start = self.sha_table + 20 * i
+        return self.map[start:start + 20]
+
+    def offset_at(self, i: int) -> int:
+        return OFFSET.unpack_from(self.map, self.offset_table + 8 * i)[0]
+
+    def find(self, binsha: bytes):
+        #the fan-out table narrows the search to shas sharing the first byte
+        first = binsha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.sha_at(mid)
+            if current < binsha:
+                lo = mid + 1
+            elif current > binsha:
+                hi = mid
+            else:
+                return self.offset_at(mid)
+        return None
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield (self.sha_at(i).hex(), self.offset_at(i))
+
+    def close(self) -> None:
+        self.map.close()
+
+class Pack():
+    def __init__(self, pack_path: str) -> None:
+        self.path = pack_path
+        self.index = PackIndex(pack_path[:-len(".pack")] + ".idx")
+        with open(pack_path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, count = PACK_HEADER.unpack_from(self.map, 0)
+        if signature != PACK_SIGNATURE or version != VERSION or count != self.index.count:
+            self.close()
+            raise ValueError(f"{pack_path} is not a supported pack")
+
+        #reconstructed objects by pack offset, so walking a delta chain is never repeated.
+        #the lock guards it when objects are read from several threads
+        self.delta_base_cache: OrderedDict = OrderedDict()
+        self.delta_base_cache_size = 0
+        self.lock = threading.Lock()
+
+    def inflate(self, data_offset: int) -> bytes:
+        return models.InflateReader(MemoryReader(self.map, data_offset), SIZE).read()
+
+    def open_object(self, offset: int) -> models.ObjectStream:
+        type_code, size, data_offset = decode_entry_header(self.map, offset)
+        if type_code == OFS_DELTA:
+            type_name, content = self.read_object(offset)
+            return models.ObjectStream(type_name, len(content), io.BytesIO(content))
+
+        body = models.InflateReader(MemoryReader(self.map, data_offset), SIZE)
+        return models.ObjectStream(TYPE_NAMES[type_code], size, body)
+
+    def read_object(self, offset: int) -> Tuple[str, bytes]:
+        #walk down to the first cached or full object, then apply deltas back up
+        chain = []
+        while True:
+            with self.lock:
+                cached = self.delta_base_cache.get(offset)
+                if cached is not None:
+                    self.delta_base_cache.move_to_end(offset)
+            if cached is not None:
+                type_name, content = cached
+                break
+
+            type_code, size, data_offset = decode_entry_header(self.map, offset)
+            if type_code != OFS_DELTA:
+                type_name, content = TYPE_NAMES[type_code], self.inflate(data_offset)
+                self.cache_base(offset, type_name, content)
+                break
+
+            distance, data_offset = decode_base_offset(self.map, data_offset)
+            chain.append((offset, data_offset))
+            offset -= distance
+
+        for delta_offset, data_offset in reversed(chain):
+            content = delta.apply_delta(content, self.inflate(data_offset))
+            self.cache_base(delta_offset, type_name, content)
+
+        return (type_name, content)
+
+    def cache_base(self, offset: int, type_name: str, content: bytes) -> None:
+        if len(content) > DELTA_BASE_CACHE_LIMIT // 4:
+            return
+        with self.lock:
+            if offset in self.delta_base_cache:
+                return
+            self.delta_base_cache[offset] = (type_name, content)
+            self.delta_base_cache_size += len(content)
+            while self.delta_base_cache_size > DELTA_BASE_CACHE_LIMIT:
+                __, (__, evicted) = self.delta_base_cache.popitem(last=False)
+                self.delta_base_cache_size -= len(evicted)
+
+    def close(self) -> None:
+        self.delta_base_cache.clear()
+        self.index.close()
+        self.map.close()
+
+class PackStore():
+    """All packs in one objects directory, rescanned when an object is not found and a pack
+    was added or removed since the last scan, which changes the directory's mtime."""
+    def __init__(self, pack_dir: str) -> None:
+        self.pack_dir = pack_dir
+        self.packs: Dict[str, Pack] = {}
+        self.lock = threading.Lock()
+        self.mtime_ns = None
+        self.reload()
+
+    def reload(self) -> bool:
+        with self.lock:
+            return self.reload_packs()
+
+    def refresh(self) -> bool:
+        #a miss is common, objects are looked up before every write, so listing the
+        #directory each time would cost one listdir per object
+        with self.lock:
+            if self.dir_mtime_ns() == self.mtime_ns:
+                return False
+            return self.reload_packs()
+
+    def dir_mtime_ns(self):
+        try:
+            return os.stat(self.pack_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload_packs(self) -> bool:
+        #taken before listing, so a pack added meanwhile is picked up by the next refresh
+        self.mtime_ns = self.dir_mtime_ns()
+        names = set()
+        if os.path.isdir(self.pack_dir):
+            for name in os.listdir(self.pack_dir):
+                if name.endswith(".pack") and os.path.exists(os.path.join(self.pack_dir, name[:-5] + ".idx")):
+                    names.add(name)
+
+        changed = False
+        for name in list(self.packs):
+            if name not in names:
+                self.packs.pop(name).close()
+                changed = True
+        for name in sorted(names - set(self.packs)):
+            self.packs[name] = Pack(os.path.join(self.pack_dir, name))
+            changed = True
+        return changed
+
+    def find(self, sha1_hash: str):
+        binsha = bytes.fromhex(sha1_hash)
+        for attempt in range(2):
+            #a copy, another thread may be reloading the packs
+            for pack in list(self.packs.values()):
+                offset = pack.index.find(binsha)
+                if offset is not None:
+                    return (pack, offset)
+            if attempt == 0 and not self.refresh():
+                break
+        return None
+
+    def contains(self, sha1_hash: str) -> bool:
+        return self.find(sha1_hash) is not None
+
+    def open_object(self, sha1_hash: str):
+        found = self.find(sha1_hash)
+        if found is None:
+            return None
+        pack, offset = found
+        return pack.open_object(offset)
+
+    def list_objects(self) -> List[str]:
+        shas = []
+        for pack in self.packs.values():
+            shas.extend(sha1_hash for sha1_hash, __ in pack.index)
+        return shas
+
+    def close(self) -> None:
+        for pack in self.packs.values():
+            pack.close()
+        self.packs = {}
+
+stores: Dict[str, PackStore] = {}
+
+def get_store(pack_dir: str) -> PackStore:
+    #one store per repository, keyed by absolute path since callers use relative paths
+    key = os.path.abspath(pack_dir)
+    if key not in stores:
+        stores[key] = PackStore(key)
+    return stores[key]
+
+class WindowEntry():
+    def __init__(self, type_name: str, offset: int, delta_index: delta.DeltaIndex, depth: int) -> None:
+        self.type = type_name
+        self.offset = offset
+        self.delta_index = delta_index
+        self.depth = depth
+
+def find_delta(window, type_name: str, target: delta.DeltaIndex, depth: int):
+    #tries the most recent candidates first and keeps the smallest delta
+    best = None
+    size = len(target.data)
+    max_size = size // 2 - 20
+    for candidate in reversed(window):
+        if candidate.type != type_name or candidate.depth >= depth:
+            continue
+        if len(candidate.delta_index.data) < size // 32 or max_size <= 0:
+            continue
+        data = delta.create_delta(candidate.delta_index, target, max_size)
+        if data is None:
+            continue
+        best = (candidate, data)
+        max_size = len(data) - 1
+        if len(data) <= size // 32:
+            break
+    return best
+
+def write_pack(pack_dir: str, shas: Iterable[str], open_object, window: int = DEFAULT_WINDOW, depth: int = DEFAULT_DEPTH) -> str:
+    #writes every object into one pack and its index, returns the pack name
+    os.makedirs(pack_dir, exist_ok=True)
+    shas = list(dict.fromkeys(shas))
+    offsets = {}
+
+    #similar objects of one type end up next to each other, largest first as bases
+    headers = {}
+    for sha1_hash in shas:
+        with open_object(sha1_hash) as stream:
+            headers[sha1_hash] = (stream.type, stream.size)
+    ordered = sorted(shas, key=lambda x: (TYPE_CODES[headers[x][0]], -headers[x][1], x))
+
+    fd, temp_pack_path = tempfile.mkstemp(prefix="tmp_pack_", dir=pack_dir)
+    try:
+        checksum = hashlib.sha1()
+        with os.fdopen(fd, "wb") as file:
+            def write(data: bytes) -> None:
+                checksum.update(data)
+                file.write(data)
+
+            write(PACK_HEADER.pack(PACK_SIGNATURE, VERSION, len(shas)))
+            offset = PACK_HEADER.size
+            candidates = deque() if window > 0 else None
+            window_size = 0
+            for sha1_hash in ordered:
+                offsets[sha1_hash] = offset
+                type_name, size = headers[sha1_hash]
+
+                if candidates is None or size > BIG_FILE_THRESHOLD:
+                    with open_object(sha1_hash) as stream:
+                        header = encode_entry_header(TYPE_CODES[stream.type], stream.size)
+                        write(header)
+                        offset += len(header)
+                        compressor = zlib.compressobj()
+                        while True:
+                            chunk = stream.read(SIZE)
+                            if not chunk:
+                                break
+                            compressed = compressor.compress(chunk)
+                            write(compressed)
+                            offset += len(compressed)
+                        compressed = compressor.flush()
+                        write(compressed)
+                        offset += len(compressed)
+                    continue
+
+                with open_object(sha1_hash) as stream:
+                    content = stream.read()
+
+                target = delta.DeltaIndex(content)
+                found = find_delta(candidates, type_name, target, depth)
+                if found is None:
+                    entry = encode_entry_header(TYPE_CODES[type_name], len(content)) + zlib.compress(content)
+                    entry_depth = 0
+                else:
+                    base, data = found
+                    entry = encode_entry_header(OFS_DELTA, len(data)) + encode_base_offset(offset - base.offset) + zlib.compress(data)
+                    entry_depth = base.depth + 1
+
+                if len(candidates) == window:
+                    window_size -= len(candidates.popleft().delta_index.data)
+                candidates.append(WindowEntry(type_name, offset, target, entry_depth))
+                window_size += len(content)
+                while window_size > WINDOW_MEMORY and len(candidates) > 1:
+                    window_size -= len(candidates.popleft().delta_index.data)
+                write(entry)
+                offset += len(entry)
+            pack_checksum = checksum.digest()
+            file.write(pack_checksum)
+
+        name = "pack-" + hashlib.sha1(b"".join(sorted(bytes.fromhex(x) for x in shas))).hexdigest()
+        pack_path = os.path.join(pack_dir, name + ".pack")
+        os.replace(temp_pack_path, pack_path)
+    except BaseException:
+        if os.path.exists(temp_pack_path):
+            os.remove(temp_pack_path)
+        raise
+
+    write_index(os.path.join(pack_dir, name + ".idx"), offsets, pack_checksum)
+    return name
+
+def write_index(index_path: str, offsets: Dict[str, int], pack_checksum: bytes) -> None:
+    entries = sorted((bytes.fromhex(sha1_hash), offset) for sha1_hash, offset in offsets.items())
+
+    fanout = [0] * 256
+    for binsha, __ in entries:
+        fanout[binsha[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    parts = [INDEX_HEADER.pack(INDEX_SIGNATURE, VERSION), FANOUT.pack(*fanout)]
+    parts.extend(binsha for binsha, __ in entries)
+    parts.extend(OFFSET.pack(offset) for __, offset in entries)
+    parts.append(pack_checksum)
+    data = b"".join(parts)
+    data += hashlib.sha1(data).digest()
+
+    #the index is renamed into place last, so a pack is never visible without one
+    fd, temp_index_path = tempfile.mkstemp(prefix="tmp_idx_", dir=os.path.dirname(index_path))
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(temp_index_path, index_path)
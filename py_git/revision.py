@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import py_git.git as git
+import py_git.models as models
+import py_git.utils as utils
+import py_git.commit_graph as commit_graph
+from typing import Iterator, List
+
+#commits missing from the graph sort as if they were newer than anything in it
+GENERATION_INFINITY = 0xffffffff
+
+#flags painted onto commits by merge_bases
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+RESULT = 8
+
+def commit_reader():
+    #(tree sha1, parent sha1s, commit time, generation) for a commit, from the graph when it has it
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+
+    def read(commit_sha: str):
+        found = graph.lookup(commit_sha) if graph else None
+        if found:
+            return (found[0], found[1], found[3], found[2])
+        return utils.parse_commit(commit_sha) + (GENERATION_INFINITY,)
+
+    return read
+
+def walk_commits(tips: List[str], read=None) -> Iterator[str]:
+    #yields every commit reachable from tips once, newest commit time first.
+    #commits are read as they are reached, so stopping early stops the walk
+    read = read or commit_reader()
+    order = itertools.count()
+    queue = []
+    seen = set()
+
+    def push(commit_sha: str) -> None:
+        if commit_sha and commit_sha not in seen:
+            seen.add(commit_sha)
+            tree_sha, parents, commit_time, generation = read(commit_sha)
+            #equal times keep the order commits were reached in, children before parents
+            heapq.heappush(queue, (-commit_time, next(order), commit_sha, parents))
+
+    for tip in tips:
+        push(tip)
+    while queue:
+        __, __, commit_sha, parents = heapq.heappop(queue)
+        yield commit_sha
+        for parent in parents:
+            push(parent)
+
+def oneline(commit_sha: str) -> str:
+    #only the first line of the message is decoded
+    fileObject = models.ByteFile(None, None, None)
+    git.cat_file(commit_sha, fileObject)
+    content = fileObject.content
+    start = content.find(b"\n") + 1
+    end = content.find(b"\n", start)
+    subject = content[start:end if end != -1 else len(content)]
+    return f"{commit_sha[:7]} {subject.decode('utf-8', 'replace')}"
+
+def merge_bases(commit_a: str, commit_b: str, read=None) -> List[str]:
+    #paints commits reachable from each side walking both at once, highest generation
+    #first, and stops once every queued commit is below a common ancestor already found
+    read = read or commit_reader()
+    if commit_a == commit_b:
+        return [commit_a]
+
+    order = itertools.count()
+    flags = {commit_a: PARENT1, commit_b: PARENT2}
+    info = {}
+    queue = []
+
+    def push(commit_sha: str) -> None:
+        if commit_sha not in info:
+            info[commit_sha] = read(commit_sha)
+        __, __, commit_time, generation = info[commit_sha]
+        heapq.heappush(queue, (-generation, -commit_time, next(order), commit_sha))
+
+    push(commit_a)
+    push(commit_b)
+    results = []
+    while any(not flags[x[3]] & STALE for x in queue):
+        commit_sha = heapq.heappop(queue)[3]
+        painted = flags[commit_sha] & (PARENT1 | PARENT2 | STALE)
+        if painted & (PARENT1 | PARENT2) == PARENT1 | PARENT2:
+            if not flags[commit_sha] & RESULT:
+                flags[commit_sha] |= RESULT
+                results.append(commit_sha)
+            painted |= STALE
+        for parent in info[commit_sha][1]:
+            if flags.get(parent, 0) & painted == painted:
+                continue
+            flags[parent] = flags.get(parent, 0) | painted
+            push(parent)
+
+    #a candidate reachable from another candidate is not a best common ancestor
+    return [x for x in results if not any(y != x and is_ancestor(x, y, read) for y in results)]
+
+def is_ancestor(ancestor: str, commit_sha: str, read=None) -> bool:
+    #commits with a generation below the ancestor's cannot reach it, so they are not walked
+    read = read or commit_reader()
+    cutoff = read(ancestor)[3]
+    if cutoff == GENERATION_INFINITY:
+        cutoff = 0
+    seen = {commit_sha}
+    stack = [commit_sha]
+    while stack:
+        current = stack.pop()
+        if current == ancestor:
+            return True
+        for parent in read(current)[1]:
+            if parent not in seen and read(parent)[3] >= cutoff:
+                seen.add(parent)
+                stack.append(parent)
+    return False
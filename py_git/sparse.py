@@ -0,0 +1,49 @@
+import os
+from typing import List
+
+SPARSE_CHECKOUT_FILE = ".git/info/sparse-checkout"
+
+class SparsePatterns():
+    """Directories to check out, one per line of .git/info/sparse-checkout.
+
+    As in git's cone mode, a listed directory is checked out whole, and so are the files
+    directly inside each of its parent directories, the top level included. Every other
+    directory is left out of the working tree and kept in the index as one entry."""
+    def __init__(self, dirs: List[str]) -> None:
+        self.dirs = {x.strip("/") for x in dirs if x.strip("/")}
+        self.parents = {""}
+        for dir_path in self.dirs:
+            parts = dir_path.split("/")
+            self.parents.update("/".join(parts[:i]) for i in range(1, len(parts)))
+
+    def excludes(self, dir_path: str) -> bool:
+        #dir_path is "" or ends in "/"
+        dir_path = dir_path.rstrip("/")
+        if dir_path in self.parents:
+            return False
+        parts = dir_path.split("/")
+        return not any("/".join(parts[:i]) in self.dirs for i in range(1, len(parts) + 1))
+
+def parse_lines(lines: List[str]) -> List[str]:
+    #a file written by git's cone mode reads the same: "/*" and "!/*/" only restate the
+    #top level rule, and a directory followed by "!/dir/*/" is just the parent of another
+    lines = [x.strip() for x in lines]
+    parents_only = {x[1:-len("/*/")].strip("/") for x in lines if x.startswith("!") and x.endswith("/*/")}
+    dirs = [x for x in lines if x and not x.startswith(("#", "!")) and x != "/*"]
+    return [x for x in dirs if x.strip("/") not in parents_only]
+
+def load():
+    #the configured patterns, None when sparse checkout is not enabled
+    if not os.path.exists(SPARSE_CHECKOUT_FILE):
+        return None
+    with open(SPARSE_CHECKOUT_FILE, "r") as file:
+        return SparsePatterns(parse_lines(file.readlines()))
+
+def write(dirs: List[str]) -> None:
+    os.makedirs(os.path.dirname(SPARSE_CHECKOUT_FILE), exist_ok=True)
+    with open(SPARSE_CHECKOUT_FILE, "w") as file:
+        file.write("".join(x.strip("/") + "/\n" for x in dirs))
+
+def disable() -> None:
+    if os.path.exists(SPARSE_CHECKOUT_FILE):
+        os.remove(SPARSE_CHECKOUT_FILE)
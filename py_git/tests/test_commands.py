@@ -1,8 +1,15 @@
 import pytest
+import subprocess
 import sys
+import random
+import pickle
+import time
+import os
+import threading
+import shutil
 from typer.testing import CliRunner
 
-from py_git import git
+from py_git import cli, git, models, pack, delta, object_cache, cache, utils, commit_graph, revision, xdiff, xmerge, ignore, fsmonitor, sparse
 from py_git import SUCCESS, INIT_ERROR
 from pathlib import Path
 
@@ -71,3 +78,890 @@ def test_second_call_git_init(tmp_path):
 
 
 
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch): 
+    monkeypatch.chdir(tmp_path)
+    git.init()
+    return tmp_path
+
+def test_hash_object_matches_canonical_sha(repo): 
+    (repo / "hello.txt").write_bytes(b"hello\n")
+    result, sha1 = git.hash_file("hello.txt")
+
+    assert result == SUCCESS
+    assert sha1 == "ce013625030ba8dba906f756967f9e9ca394464a"
+    assert Path(git.object_path(sha1)).is_file()
+
+def test_hash_object_skips_existing_object(repo): 
+    (repo / "hello.txt").write_bytes(b"hello\n")
+    __, sha1 = git.hash_file("hello.txt")
+    mtime = Path(git.object_path(sha1)).stat().st_mtime_ns
+
+    __, sha1_again = git.hash_file("hello.txt")
+    assert sha1_again == sha1
+    assert Path(git.object_path(sha1)).stat().st_mtime_ns == mtime
+    assert not list((repo / ".git" / "objects" / sha1[:2]).glob("tmp_obj_*"))
+
+def test_cat_file_is_binary_safe(repo): 
+    content = b"\x00\x01binary\x00\xff" * 10000
+    (repo / "data.bin").write_bytes(content)
+    __, sha1 = git.hash_file("data.bin")
+
+    fileObject = models.ByteFile(None, None, None)
+    assert git.cat_file(sha1, fileObject) == SUCCESS
+    assert (fileObject.type, fileObject.size, fileObject.content) == ("blob", len(content), content)
+
+    with git.open_object(sha1) as stream: 
+        assert stream.read(7) == content[:7]
+
+    git.write_sha_into_working_tree("out/data.bin", sha1)
+    assert (repo / "out" / "data.bin").read_bytes() == content
+
+def test_repack_moves_loose_objects_into_pack(repo): 
+    contents = {f"file{i}.txt": f"content {i}\n".encode() * (i + 1) for i in range(50)}
+    shas = {}
+    for name, content in contents.items(): 
+        (repo / name).write_bytes(content)
+        shas[name] = git.hash_file(name)[1]
+
+    count, name = git.repack()
+    assert count == 50
+    assert git.list_loose_objects() == []
+    assert (repo / ".git" / "objects" / "pack" / (name + ".idx")).is_file()
+
+    for file_name, sha1 in shas.items(): 
+        fileObject = models.ByteFile(None, None, None)
+        assert git.cat_file(sha1, fileObject) == SUCCESS
+        assert fileObject.content == contents[file_name]
+    assert not git.object_exists("0" * 40)
+
+    (repo / "extra.txt").write_bytes(b"extra\n")
+    git.hash_file("extra.txt")
+    count, __ = git.repack(all_packs=True)
+    assert count == 51
+    assert len(list((repo / ".git" / "objects" / "pack").glob("*.pack"))) == 1
+
+def test_pack_directory_is_rescanned_only_when_it_changes(repo, monkeypatch): 
+    (repo / "a.txt").write_bytes(b"a\n")
+    git.update_cache("a.txt")
+    git.repack()
+
+    listed = []
+    listdir = os.listdir
+    def spy(path="."): 
+        if str(path).endswith("pack"): 
+            listed.append(path)
+        return listdir(path)
+    monkeypatch.setattr(os, "listdir", spy)
+    names = [f"f{i}.txt" for i in range(30)]
+    for name in names: 
+        (repo / name).write_bytes(name.encode())
+    git.update_cache_bulk(names)
+    assert listed == []
+
+    #a pack written by someone else changes the directory, so the next miss finds it
+    sha1 = git.write_object("blob", b"packed elsewhere\n")
+    pack.write_pack(git.PACK_DIR, [sha1], git.open_object)
+    os.remove(git.object_path(sha1))
+    assert git.object_exists(sha1) and len(listed) == 1
+
+def test_delta_roundtrip(): 
+    rng = random.Random(1)
+    lines = [f"line {i} {rng.random()}\n".encode() for i in range(2000)]
+    base = b"".join(lines)
+    for i in rng.sample(range(2000), 20): 
+        lines[i] = b"edited\n"
+    lines.insert(500, b"x" * 1000)
+    target = b"".join(lines) + b"no trailing newline"
+
+    data = delta.create_delta(delta.DeltaIndex(base), delta.DeltaIndex(target))
+    assert len(data) < len(target) // 10
+    assert delta.apply_delta(base, data) == target
+    assert delta.apply_delta(b"", delta.create_delta(delta.DeltaIndex(b""), delta.DeltaIndex(target))) == target
+
+def test_repack_stores_revisions_as_deltas(repo): 
+    lines = [f"line {i}\n".encode() for i in range(5000)]
+    shas = []
+    for revision in range(12): 
+        lines[revision * 7] = f"revision {revision}\n".encode()
+        (repo / "asset.txt").write_bytes(b"".join(lines))
+        shas.append((git.hash_file("asset.txt")[1], b"".join(lines)))
+
+    git.repack(all_packs=True, depth=4)
+    pack_file, = (repo / ".git" / "objects" / "pack").glob("*.pack")
+    assert pack_file.stat().st_size < 3 * len(shas[0][1])
+
+    for sha1, content in reversed(shas): 
+        fileObject = models.ByteFile(None, None, None)
+        git.cat_file(sha1, fileObject)
+        assert fileObject.content == content
+
+def test_object_cache_serves_repeated_reads(repo): 
+    cache = object_cache.ObjectCache(limit=100)
+    cache.put("a" * 40, "blob", b"x" * 20)
+    cache.put("b" * 40, "blob", b"y" * 20)
+    cache.put("c" * 40, "blob", b"z" * 25)
+    assert cache.get("a" * 40) == ("blob", b"x" * 20)
+    cache.put("d" * 40, "blob", b"w" * 25)
+    cache.put("e" * 40, "blob", b"v" * 25)
+    cache.put("f" * 40, "blob", b"u" * 26)
+    assert cache.get("b" * 40) is None
+    assert cache.size <= 100
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    (repo / "hello.txt").write_bytes(b"hello\n")
+    __, sha1 = git.hash_file("hello.txt")
+    object_cache.shared.clear()
+    for __ in range(3): 
+        fileObject = models.ByteFile(None, None, None)
+        git.cat_file(sha1, fileObject)
+        assert fileObject.content == b"hello\n"
+    assert object_cache.shared.stats()[:2] == (2, 1)
+
+def test_binary_index_roundtrip_and_lookup(repo): 
+    cache_handler = cache.CacheHandeler()
+    current_cache = cache.Cache()
+    for i in range(100): 
+        current_cache.contents.append(cache.CacheEntry("blob", 0o100644, f"{i:040x}", f"dir{i % 7}/file{i:03}.txt", mtime_ns=i, size=i * 10))
+    current_cache.contents.sort(key=lambda entry: entry.file_path)
+    cache_handler.save_cache(current_cache)
+
+    loaded = cache_handler.load_cache()
+    assert loaded.header.numEntries == 100
+    assert [x.file_path for x in loaded.contents] == [x.file_path for x in current_cache.contents]
+
+    entry = cache_handler.lookup("dir3/file010.txt")
+    assert (entry.sha1, entry.mode, entry.mtime_ns, entry.size) == (f"{10:040x}", 0o100644, 10, 100)
+    assert cache_handler.lookup("dir3/missing.txt") is None
+
+def test_pickled_index_is_migrated(repo): 
+    old_cache = cache.Cache()
+    old_entry = cache.CacheEntry.__new__(cache.CacheEntry)
+    old_entry.__dict__.update({"sha1": "ab" * 20, "type": "blob", "mode": 0o100644, "file_path": "a.txt"})
+    old_cache.contents.append(old_entry)
+    old_cache.header.numEntries = 1
+    (repo / ".git" / "index").write_bytes(pickle.dumps(old_cache))
+
+    cache_handler = cache.CacheHandeler()
+    loaded = cache_handler.load_cache()
+    assert [(x.file_path, x.sha1) for x in loaded.contents] == [("a.txt", "ab" * 20)]
+    assert (repo / ".git" / "index").read_bytes().startswith(cache.INDEX_SIGNATURE)
+
+def test_status_skips_files_with_matching_stat_data(repo, monkeypatch, capsys): 
+    compared = []
+    file_sha = git.file_sha
+    monkeypatch.setattr(git, "file_sha", lambda file_path, _type="blob": compared.append(file_path) or file_sha(file_path, _type))
+    def status(): 
+        compared.clear()
+        git.status()
+        return compared[:]
+
+    (repo / "old.txt").write_bytes(b"old\n")
+    long_ago = time.time() - 3600
+    os.utime("old.txt", (long_ago, long_ago))
+    git.update_cache("old.txt")
+    assert status() == []
+
+    #same size, so only the hash can tell
+    (repo / "old.txt").write_bytes(b"new\n")
+    assert status() == ["old.txt"]
+    assert "modified:   old.txt" in capsys.readouterr().out
+
+    #a different size is reported without hashing
+    (repo / "old.txt").write_bytes(b"longer\n")
+    assert status() == []
+
+    #not older than the index, so it is racy and must be compared
+    (repo / "new.txt").write_bytes(b"new\n")
+    os.utime("new.txt", (time.time() + 5, time.time() + 5))
+    (repo / "old.txt").write_bytes(b"old\n")
+    os.utime("old.txt", (long_ago, long_ago))
+    git.update_cache("old.txt")
+    git.update_cache("new.txt")
+    assert status() == ["new.txt"]
+
+    #touching a file without changing it refreshes its stat data in the index
+    os.utime("old.txt", (long_ago + 60, long_ago + 60))
+    assert status() == ["new.txt", "old.txt"]
+    assert status() == ["new.txt"]
+
+def test_status_reports_staged_unstaged_and_untracked(repo, author, capsys): 
+    make_commit(repo, "a.txt", "a\n")
+    make_commit(repo, "sub/b.txt", "b\n")
+    make_commit(repo, "sub/c.txt", "c\n")
+    capsys.readouterr()
+
+    (repo / "a.txt").write_text("staged\n")
+    git.update_cache("a.txt")
+    (repo / "sub/new.txt").write_text("new\n")
+    git.update_cache("sub/new.txt")
+    git.rm("sub/c.txt", False)
+    (repo / "sub/b.txt").write_text("unstaged\n")
+    (repo / "untracked.txt").write_text("?\n")
+
+    git.status(jobs=2)
+    out = capsys.readouterr().out
+    staged, rest = out.split("Changes not staged for commit:")
+    assert "modified:   a.txt" in staged and "new file:   sub/new.txt" in staged and "deleted:    sub/c.txt" in staged
+    unstaged, untracked = rest.split("Untracked files:")
+    assert unstaged.split() == ["modified:", "sub/b.txt"]
+    assert "untracked.txt" in untracked and "sub/c.txt" in untracked
+
+def test_update_cache_bulk_writes_index_once(repo, monkeypatch): 
+    for name in ["b.txt", "a.txt", "dir/c.txt"]: 
+        os.makedirs(os.path.dirname(name) or ".", exist_ok=True)
+        (repo / name).write_bytes(name.encode())
+
+    cache.CacheHandeler().initialize_cache()
+    saves = []
+    save_cache = cache.CacheHandeler.save_cache
+    monkeypatch.setattr(cache.CacheHandeler, "save_cache", lambda self, c: saves.append(1) or save_cache(self, c))
+
+    assert git.update_cache_bulk(["b.txt", "a.txt", "dir/c.txt", "missing.txt"]) == (3, 3, 0)
+    assert len(saves) == 1
+
+    (repo / "a.txt").write_bytes(b"changed")
+    assert git.update_cache_bulk(["a.txt", "b.txt"]) == (2, 0, 1)
+    entries = cache.CacheHandeler().load_cache().contents
+    assert [x.file_path for x in entries] == ["a.txt", "b.txt", "dir/c.txt"]
+
+def test_parallel_update_cache_matches_serial(repo): 
+    file_paths = []
+    for i in range(40): 
+        (repo / f"file{i}.txt").write_bytes(f"content {i}\n".encode() * i)
+        file_paths.append(f"file{i}.txt")
+
+    git.update_cache_bulk(file_paths)
+    serial = [(x.file_path, x.sha1, x.size) for x in cache.CacheHandeler().load_cache().contents]
+    os.remove(".git/index")
+
+    assert git.update_cache_bulk(file_paths, jobs=2, chunk_size=8) == (40, 40, 0)
+    parallel = [(x.file_path, x.sha1, x.size) for x in cache.CacheHandeler().load_cache().contents]
+    assert parallel == serial
+
+def test_sorted_cache_operations(): 
+    current_cache = cache.Cache()
+    for path in ["src/b.txt", "a.txt", "src/sub/c.txt", "src0.txt", "src.txt"]: 
+        assert current_cache.insert(cache.CacheEntry("blob", 0, "0" * 40, path))
+    assert not current_cache.insert(cache.CacheEntry("blob", 0, "1" * 40, "a.txt"))
+
+    assert current_cache.paths == sorted(current_cache.paths)
+    assert current_cache.get("a.txt").sha1 == "1" * 40
+    assert "src/b.txt" in current_cache and "src" not in current_cache
+    assert [x.file_path for x in current_cache.entries_under("src")] == ["src/b.txt", "src/sub/c.txt"]
+
+    assert current_cache.remove_prefix("src/") == 2
+    assert current_cache.remove_many(["a.txt", "missing.txt"]) == 1
+    assert current_cache.remove("src.txt")
+    assert current_cache.paths == ["src0.txt"]
+    assert current_cache.header.numEntries == 1
+
+def test_rm_directory_removes_entries_below_it(repo): 
+    os.makedirs("src/sub")
+    for name in ["a.txt", "src/b.txt", "src/sub/c.txt"]: 
+        (repo / name).write_bytes(name.encode())
+    git.update_cache_bulk(["a.txt", "src/b.txt", "src/sub/c.txt"])
+
+    #an empty path is not the root directory, only rm . removes everything
+    assert git.rm("", False) == 0 and git.rm("/", False) == 0
+    assert len(cache.CacheHandeler().load_cache().paths) == 3
+    assert git.rm("src", False) == 1
+    assert cache.CacheHandeler().load_cache().paths == ["a.txt"]
+    assert git.rm("src", False) == 0
+
+def test_write_tree_builds_nested_trees_in_memory(repo): 
+    names = ["Makefile", "a.txt", "lib.v2/x.py", "src/b.txt", "src/sub/c.txt", "src/sub/deeper/d.txt", "src0.txt"]
+    for name in names: 
+        os.makedirs(os.path.dirname(name) or ".", exist_ok=True)
+        (repo / name).write_bytes(name.encode())
+    git.update_cache_bulk(names)
+
+    tree_sha = git.write_tree()
+    assert not list(repo.glob("tmp*"))
+
+    files = {}
+    git.load_tree_into_hash(tree_sha, "", files)
+    expected = {x.file_path: x.sha1 for x in cache.CacheHandeler().load_cache().contents}
+    assert files == expected
+    assert git.write_tree() == tree_sha
+
+def test_write_tree_reuses_cached_subtrees(repo, monkeypatch): 
+    names = [f"d{i}/s{j}/f{k}.txt" for i in range(4) for j in range(3) for k in range(3)] + ["top.txt"]
+    for name in names: 
+        os.makedirs(os.path.dirname(name) or ".", exist_ok=True)
+        (repo / name).write_bytes(name.encode())
+    git.update_cache_bulk(names)
+    full_tree = git.write_tree()
+
+    written = []
+    write_object = git.write_object
+    monkeypatch.setattr(git, "write_object", lambda _type, data: written.append(_type) or write_object(_type, data))
+
+    assert git.write_tree() == full_tree
+    assert written == []
+
+    (repo / "d2/s1/f0.txt").write_bytes(b"changed")
+    git.update_cache("d2/s1/f0.txt")
+    new_tree = git.write_tree()
+    assert written == ["tree", "tree", "tree"]
+
+    #the reused trees must match a build from scratch
+    current_cache = cache.CacheHandeler().load_cache()
+    current_cache.tree_cache = {}
+    assert git.build_tree(current_cache) == new_tree
+
+    #a checkout primes the cached trees from the tree it reads
+    fresh = cache.Cache()
+    utils.load_tree_into_cache(new_tree, "", fresh)
+    assert fresh.tree_cache["d2/s1"][1] == 3 and fresh.tree_cache[""] == (new_tree, len(names))
+
+def test_rm_directory_drops_cached_subtrees(repo, author, capsys): 
+    make_commit(repo, "top.txt", "top\n")
+    first = make_commit(repo, "d/e/f.txt", "f\n")
+    git.rm("d", False)
+    current_cache = cache.CacheHandeler().load_cache()
+    assert current_cache.paths == ["top.txt"]
+    assert not [x for x in current_cache.tree_cache if x.startswith("d")]
+
+    capsys.readouterr()
+    git.status()
+    assert "deleted:    d/e/f.txt" in capsys.readouterr().out
+
+    git.checkout("", first)
+    current_cache = cache.CacheHandeler().load_cache()
+    assert current_cache.paths == ["d/e/f.txt", "top.txt"]
+    assert git.write_tree() == utils.extract_tree_from_commit(first)
+
+def test_checkout_ignores_cached_trees_with_a_different_entry_count(repo, author): 
+    make_commit(repo, "top.txt", "top\n")
+    first = make_commit(repo, "d/e/f.txt", "f\n")
+    subtree = {x[2]: x[1] for x in git.read_tree(git.read_tree(utils.extract_tree_from_commit(first))[0][1])}["d/e"]
+    git.rm("d", False)
+    #an index written before rm dropped cached subtrees still holds d/e, with no entries under it
+    cache_handler = cache.CacheHandeler()
+    current_cache = cache_handler.load_cache()
+    current_cache.tree_cache["d/e"] = (subtree, 1)
+    cache_handler.save_cache(current_cache)
+
+    git.checkout("", first)
+    current_cache = cache_handler.load_cache()
+    assert current_cache.paths == ["d/e/f.txt", "top.txt"]
+    assert git.staged_changes(current_cache, first) == []
+
+def test_status_reports_every_path_removed_with_a_directory(repo, author, capsys): 
+    names = ["top.txt", "d/a.txt", "d/e/f.txt", "d/e/g/h.txt"]
+    for name in names: 
+        (repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (repo / name).write_text(f"{name}\n")
+    git.update_cache_bulk(names)
+    head = git.commit_tree(git.write_tree(), "base", [])
+    git.rm("d", False)
+    removed = [("deleted", x) for x in ["d/a.txt", "d/e/f.txt", "d/e/g/h.txt"]]
+    assert git.staged_changes(cache.CacheHandeler().load_cache(), head) == removed
+
+    capsys.readouterr()
+    git.status()
+    staged = capsys.readouterr().out.split("Changes to be committed: ")[1].split("\n\n")[0]
+    assert staged.split() == ["deleted:", "d/a.txt", "deleted:", "d/e/f.txt", "deleted:", "d/e/g/h.txt"]
+
+    #a cached tree left for a directory with no entries under it is not trusted
+    current_cache = cache.CacheHandeler().load_cache()
+    current_cache.tree_cache["d"] = (git.read_tree(utils.extract_tree_from_commit(head))[0][1], 3)
+    assert git.staged_changes(current_cache, head) == removed
+
+@pytest.fixture
+def author(tmp_path_factory, monkeypatch): 
+    home = tmp_path_factory.mktemp("home")
+    (home / ".py_git_config").write_text("name = Test\nemail = test@example.com\n")
+    monkeypatch.setenv("HOME", str(home))
+
+def make_commit(repo, name: str, message: str, commit_parents=[]): 
+    (repo / name).parent.mkdir(parents=True, exist_ok=True)
+    (repo / name).write_bytes(message.encode())
+    git.update_cache(name)
+    return git.commit_tree(git.write_tree(), message, commit_parents)
+
+def test_commit_graph_answers_without_reading_commits(repo, author, monkeypatch): 
+    shas = [make_commit(repo, f"f{i}.txt", f"commit {i}") for i in range(3)]
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+    assert graph.count == 3
+
+    expected = [utils.parse_commit(x) for x in shas]
+    assert expected[0][1] == [] and expected[2][1] == [shas[1]] and expected[2][2] > 0
+
+    def fail(sha1): 
+        raise AssertionError("commit object was read")
+    monkeypatch.setattr(utils, "parse_commit", fail)
+
+    for sha1, (tree_sha, parents, commit_time) in zip(shas, expected): 
+        assert graph.lookup(sha1)[0] == tree_sha
+        assert utils.extract_tree_from_commit(sha1) == tree_sha
+        assert utils.extract_parents_from_commit(sha1) == parents
+    assert [graph.lookup(x)[2] for x in shas] == [1, 2, 3]
+
+def test_commit_graph_is_built_for_existing_history(repo, author): 
+    shas = [make_commit(repo, f"f{i}.txt", f"commit {i}") for i in range(4)]
+    spliced = Path(git.COMMIT_GRAPH).read_bytes()
+    os.remove(git.COMMIT_GRAPH)
+
+    assert git.update_commit_graph() == 4
+    assert Path(git.COMMIT_GRAPH).read_bytes() == spliced
+    assert git.update_commit_graph() == 0
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+    assert graph.lookup(shas[-1])[1:3] == ([shas[-2]], 4)
+
+def test_commits_are_appended_to_the_commit_graph_as_layers(repo, author): 
+    shas = [make_commit(repo, f"f{i}.txt", f"commit {i}") for i in range(2)]
+    st = os.stat(git.COMMIT_GRAPH)
+    shas.append(make_commit(repo, "f2.txt", "commit 2"))
+    #the third commit went into a layer, the graph file below it was not rewritten
+    assert (os.stat(git.COMMIT_GRAPH).st_ino, os.stat(git.COMMIT_GRAPH).st_mtime_ns) == (st.st_ino, st.st_mtime_ns)
+    chain = commit_graph.read_chain(git.COMMIT_GRAPH)
+    assert len(chain) == 1
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+    assert graph.count == 3 and [x.local_count for x in graph.layers()] == [2, 1]
+    assert graph.lookup(shas[2])[1:3] == ([shas[1]], 3)
+
+    #layers merge as they grow, so their number stays logarithmic
+    shas += [make_commit(repo, f"f{i}.txt", f"commit {i}") for i in range(3, 40)]
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+    assert graph.count == 40 and len(graph.layers()) <= 6
+    assert [graph.lookup(x)[2] for x in shas] == list(range(1, 41))
+    assert graph.lookup(shas[-1])[1] == [shas[-2]]
+
+    #the commit-graph command writes everything as one file again
+    layer_files = [os.path.join(os.path.dirname(git.COMMIT_GRAPH), x) for x in commit_graph.read_chain(git.COMMIT_GRAPH)]
+    assert git.update_commit_graph() == 0
+    assert commit_graph.read_chain(git.COMMIT_GRAPH) == [] and not any(os.path.exists(x) for x in layer_files)
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+    assert graph.base is None and graph.count == 40
+    assert [graph.lookup(x)[2] for x in shas] == list(range(1, 41))
+
+def test_log_streams_long_history(repo, capsys): 
+    delimiter = '\x1F'
+    tree_sha = git.write_object("tree", b"")
+    head = ""
+    for i in range(1500): 
+        head = git.write_object("commit", f"tree {tree_sha}{delimiter}parent {head}{delimiter}author a <a> {i} +0000{delimiter}commiter a <a> {i} +0000{delimiter}\nsubject {i}\nbody".encode())
+    Path(".git/refs/heads/master").write_text(head)
+
+    assert sum(1 for __ in revision.walk_commits([head])) == 1500
+
+    git.log(max_count=2, skip=1, one_line=True)
+    lines = capsys.readouterr().out.splitlines()
+    assert [x.split(" ", 1)[1] for x in lines] == ["subject 1498", "subject 1497"]
+
+    git.log()
+    assert capsys.readouterr().out.count("subject") == 1500
+
+def test_walk_commits_follows_both_parents(repo, author): 
+    base = make_commit(repo, "a.txt", "base")
+    side = make_commit(repo, "b.txt", "side")
+    Path(".git/refs/heads/master").write_text(base)
+    main = make_commit(repo, "c.txt", "main")
+    merged = make_commit(repo, "d.txt", "merge", [main, side])
+
+    walked = list(revision.walk_commits([merged]))
+    assert walked[0] == merged and walked[-1] == base
+    assert sorted(walked) == sorted([base, side, main, merged])
+
+def test_merge_bases_paint_down(repo): 
+    delimiter = '\x1F'
+    tree_sha = git.write_object("tree", b"")
+    clock = iter(range(100))
+    def commit(*parents): 
+        i = next(clock)
+        return git.write_object("commit", f"tree {tree_sha}{delimiter}parent {' '.join(parents)}{delimiter}author a <a> {i} +0000{delimiter}commiter a <a> {i} +0000{delimiter}\n{i}".encode())
+
+    base = commit()
+    a1 = commit(base)
+    a2 = commit(a1)
+    b1 = commit(base)
+    b2 = commit(b1, a1)
+    c1 = commit(a2, b2)
+    c2 = commit(b2, a2)
+
+    for graph in (False, True): 
+        if graph: 
+            git.update_commit_graph([c1, c2])
+        assert revision.merge_bases(a2, b2) == [a1]
+        assert revision.merge_bases(b1, a2) == [base]
+        assert revision.merge_bases(c1, a1) == [a1]
+        assert sorted(revision.merge_bases(c1, c2)) == sorted([a2, b2])
+        assert revision.is_ancestor(base, c2) and not revision.is_ancestor(c1, c2)
+
+def test_unified_diff_matches_diff_u_layout(): 
+    old = b"".join(f"line {i}\n".encode() for i in range(1, 11))
+    new = old.replace(b"line 2\n", b"line two\n") + b"line 11"
+    expected = "\n".join([
+        "diff --git a/f.txt b/f.txt", "-- a/f.txt", "++ b/f.txt",
+        "@@ -1,5 +1,5 @@", " line 1", "-line 2", "+line two", " line 3", " line 4", " line 5",
+        "@@ -8,3 +8,4 @@", " line 8", " line 9", " line 10", "+line 11", "\\ No newline at end of file",
+    ])
+    assert xdiff.unified_diff(old, new, "f.txt", "f.txt") == expected
+    assert xdiff.unified_diff(b"", b"x\n", "dev/null", "f.txt").endswith("@@ -0,0 +1 @@\n+x")
+    assert xdiff.unified_diff(b"\0a", b"\0b", "f", "f") == "diff --git a/f b/f\n-- a/f\n++ b/f"
+
+    rng = random.Random(0)
+    for __ in range(200): 
+        a = [rng.choice("abc") for __ in range(rng.randrange(12))]
+        b = [rng.choice("abc") for __ in range(rng.randrange(12))]
+        rebuilt, i = [], 0
+        for i0, i1, j0, j1 in xdiff.diff_lines(a, b): 
+            rebuilt += a[i:i0] + b[j0:j1]
+            i = i1
+        assert rebuilt + a[i:] == b
+
+def test_diff_runs_in_process(repo, author, monkeypatch): 
+    first = make_commit(repo, "a.txt", "one\ntwo\n")
+    second = make_commit(repo, "a.txt", "one\n2\n")
+    monkeypatch.setattr(subprocess, "Popen", None)
+
+    output = git.diff(first, second)
+    assert "@@ -1,2 +1,2 @@\n one\n-2\n+two" in output
+
+def test_diff_trees_prunes_identical_subtrees(repo, author, monkeypatch): 
+    names = [f"d{i}/s{j}/f{k}.txt" for i in range(4) for j in range(3) for k in range(3)] + ["top.txt"]
+    for name in names: 
+        os.makedirs(os.path.dirname(name) or ".", exist_ok=True)
+        (repo / name).write_bytes(name.encode())
+    git.update_cache_bulk(names)
+    first = git.commit_tree(git.write_tree(), "first")
+    second = make_commit(repo, "d2/s1/f0.txt", "changed")
+    (repo / "d3/new.txt").write_bytes(b"new\n")
+    git.update_cache("d3/new.txt")
+    git.rm("top.txt", False)
+    third = git.commit_tree(git.write_tree(), "third")
+
+    read = []
+    read_tree = git.read_tree
+    monkeypatch.setattr(git, "read_tree", lambda sha1: read.append(sha1) or read_tree(sha1))
+
+    treeA, treeB = utils.extract_tree_from_commit(first), utils.extract_tree_from_commit(second)
+    changes = git.diff_trees(treeA, treeB)
+    assert [x[0] for x in changes] == ["d2/s1/f0.txt"]
+    #root, d2 and d2/s1 on each side
+    assert len(read) == 6
+
+    changes = git.diff_trees(treeA, utils.extract_tree_from_commit(third))
+    assert [(x[0], x[1] is None, x[2] is None) for x in changes] == [("d2/s1/f0.txt", False, False), ("d3/new.txt", True, False), ("top.txt", False, True)]
+    assert git.diff(first, first) == ""
+
+def test_merge3_merges_and_marks_conflicts(): 
+    base = b"".join(f"line {i}\n".encode() for i in range(10))
+    ours = base.replace(b"line 1\n", b"ours 1\n")
+    theirs = base.replace(b"line 8\n", b"theirs 8\n")
+    assert xmerge.merge3(base, ours, theirs) == (base.replace(b"line 1\n", b"ours 1\n").replace(b"line 8\n", b"theirs 8\n"), 0)
+    assert xmerge.merge3(base, ours, ours) == (ours, 0)
+    assert xmerge.merge3(base, base, theirs) == (theirs, 0)
+
+    both = base.replace(b"line 4\n", b"ours 4\nshared\n")
+    other = base.replace(b"line 4\n", b"theirs 4\nshared\n")
+    merged, conflicts = xmerge.merge3(base, both, other, "master", "topic")
+    assert conflicts == 1
+    assert b"line 3\n<<<<<<< master\nours 4\n=======\ntheirs 4\n>>>>>>> topic\nshared\nline 5\n" in merged
+
+def test_merge_writes_working_tree_and_index(repo, author, monkeypatch, capsys): 
+    make_commit(repo, "a.txt", "".join(f"line {i}\n" for i in range(10)))
+    make_commit(repo, "keep.txt", "keep\n")
+    #branch also switches to the new branch
+    git.branch("topic")
+    make_commit(repo, "a.txt", "".join(f"line {i}\n" for i in range(10)).replace("line 8\n", "topic 8\n"))
+    make_commit(repo, "b.txt", "topic only\n")
+    git.rm("keep.txt", False)
+    os.remove("keep.txt")
+    topic = git.commit_tree(git.write_tree(), "remove keep")
+
+    git.checkout("master")
+    make_commit(repo, "a.txt", "".join(f"line {i}\n" for i in range(10)).replace("line 1\n", "master 1\n"))
+    master = utils.extract_commit_from_head()
+
+    monkeypatch.setattr(subprocess, "Popen", None)
+    assert git.merge("topic") == 1
+    assert (repo / "a.txt").read_text() == "".join(f"line {i}\n" for i in range(10)).replace("line 1\n", "master 1\n").replace("line 8\n", "topic 8\n")
+    assert (repo / "b.txt").read_text() == "topic only\n" and not (repo / "keep.txt").exists()
+
+    head = utils.extract_commit_from_head()
+    assert utils.extract_parents_from_commit(head) == [master, topic]
+    index = {x.file_path: x.sha1 for x in cache.CacheHandeler().load_cache().contents}
+    files = {}
+    git.load_tree_into_hash(utils.extract_tree_from_commit(head), "", files)
+    assert index == files and sorted(files) == ["a.txt", "b.txt"]
+
+def test_ignore_rules(repo): 
+    rules = ignore.IgnoreRules()
+    rules.add_patterns(["*.log", "!keep.log", "/build", "out/", "docs/**/*.tmp"])
+    rules.add_patterns(["*.txt"], "sub/")
+    assert rules.is_ignored("a.log") and rules.is_ignored("deep/b.log")
+    assert not rules.is_ignored("keep.log")
+    assert rules.is_ignored("build") and not rules.is_ignored("src/build")
+    assert rules.is_ignored("src/out", True) and not rules.is_ignored("src/out")
+    assert rules.is_ignored("docs/x.tmp") and rules.is_ignored("docs/a/b/x.tmp")
+    assert rules.is_ignored("sub/a.txt") and not rules.is_ignored("a.txt")
+    assert rules.is_ignored(".git", True) and rules.is_ignored("lib/py_git", True)
+
+    #a "]" opening a class is a member of it, an unclosed "[" is literal and a reversed range matches nothing
+    rules.add_patterns(["[]", "x[]]", "[z-a].bin"])
+    assert rules.is_ignored("[]") and rules.is_ignored("x]") and not rules.is_ignored("a.bin")
+
+def test_update_cache_cli_stages_dotfiles(repo): 
+    (repo / ".gitignore").write_text("*.log\n")
+    (repo / ".env").write_text("KEY=1\n")
+    (repo / "a.log").write_text("log\n")
+    (repo / "sub").mkdir()
+    (repo / "sub/b.txt").write_text("b\n")
+    result = runner.invoke(cli.app, ["update-cache", "."])
+    assert result.exit_code == 0
+    assert cache.CacheHandeler().load_cache().paths == [".env", ".gitignore", "sub/b.txt"]
+
+    (repo / "c.txt").write_text("c\n")
+    assert runner.invoke(cli.app, ["update-cache", "./c.txt"]).exit_code == 0
+    assert "c.txt" in cache.CacheHandeler().load_cache()
+
+def test_walk_prunes_ignored_directories(repo, monkeypatch): 
+    for path in ["a.txt", "a.log", "keep.log", "build/x.txt", "sub/b.txt", "sub/c.tmp", "sub/.gitignore", ".gitignore", ".hidden/d.txt"]: 
+        (repo / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo / path).write_text("x\n")
+    (repo / ".gitignore").write_text("# comment\n*.log\n!keep.log\nbuild/\n")
+    (repo / "sub/.gitignore").write_text("*.tmp\n")
+    opened = []
+    scandir = os.scandir
+    monkeypatch.setattr(ignore.os, "scandir", lambda path: opened.append(path) or scandir(path))
+    assert list(ignore.walk_files()) == [".gitignore", "a.txt", "keep.log", "sub/.gitignore", "sub/b.txt"]
+    assert opened == [".", "sub/"]
+
+    git.update_cache(".gitignore")
+    git.update_cache("a.txt")
+    assert [x for x in utils.get_all_files() if x not in cache.CacheHandeler().load_cache()] == ["keep.log", "sub/.gitignore", "sub/b.txt"]
+
+@pytest.mark.parametrize("poll", [False, True])
+def test_fsmonitor_limits_status_to_reported_paths(repo, author, monkeypatch, capsys, poll): 
+    make_commit(repo, "a.txt", "a\n")
+    make_commit(repo, "sub/b.txt", "b\n")
+    watcher = fsmonitor.make_watcher(poll)
+    assert isinstance(watcher, fsmonitor.PollingWatcher if poll else fsmonitor.InotifyWatcher)
+    daemon = fsmonitor.Daemon(watcher)
+    thread = threading.Thread(target=daemon.serve)
+    thread.start()
+    while not fsmonitor.is_running(): 
+        time.sleep(0.01)
+
+    compared = []
+    unstaged_changes = git.unstaged_changes
+    def spy(current_cache, index_mtime_ns, jobs=0, entries=None): 
+        compared.append(None if entries is None else [x.file_path for x in entries])
+        return unstaged_changes(current_cache, index_mtime_ns, jobs, entries)
+    monkeypatch.setattr(git, "unstaged_changes", spy)
+
+    try: 
+        #no token yet, so everything is scanned once
+        git.status()
+        assert compared.pop() is None and cache.CacheHandeler().load_cache().fsmonitor_token
+        capsys.readouterr()
+
+        (repo / "sub/b.txt").write_text("changed\n")
+        (repo / "new.txt").write_text("new\n")
+        git.status()
+        assert compared.pop() == ["sub/b.txt"]
+        out = capsys.readouterr().out
+        assert "modified:   sub/b.txt" in out and "\tnew.txt" in out
+
+        #nothing changed since, what differed last time is still reported
+        git.status()
+        assert compared.pop() == ["sub/b.txt"]
+        out = capsys.readouterr().out
+        assert "modified:   sub/b.txt" in out and "\tnew.txt" in out
+
+        (repo / "dir/deeper").mkdir(parents=True)
+        (repo / "dir/deeper/c.txt").write_text("c\n")
+        os.remove("a.txt")
+        assert git.working_tree_files() == ["a.txt", "dir/deeper/c.txt", "new.txt", "sub/b.txt"]
+        git.status()
+        assert compared.pop() == ["a.txt", "sub/b.txt"]
+        out = capsys.readouterr().out
+        assert "deleted:    a.txt" in out and "\tdir/deeper/c.txt" in out
+
+        #a token from another daemon means a full scan
+        current_cache = cache.CacheHandeler().load_cache()
+        current_cache.fsmonitor_token = "other:1"
+        cache.CacheHandeler().save_cache(current_cache)
+        git.status()
+        assert compared.pop() is None
+    finally: 
+        fsmonitor.stop()
+        thread.join()
+    assert not os.path.exists(fsmonitor.SOCKET)
+
+def test_untracked_cache_reuses_unchanged_directories(repo, monkeypatch, capsys): 
+    for path in ["a.txt", "sub/u.txt", "sub/deep/v.txt", "ign/w.txt"]: 
+        (repo / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo / path).write_text("x\n")
+    (repo / ".gitignore").write_text("ign/\n")
+    git.update_cache("a.txt")
+    long_ago = time.time() - 3600
+    for path in [".", "sub", "sub/deep", "ign"]: 
+        os.utime(path, (long_ago, long_ago))
+
+    listed = []
+    list_dir = ignore.list_dir
+    monkeypatch.setattr(ignore, "list_dir", lambda dir_path, rules: listed.append(dir_path) or list_dir(dir_path, rules))
+    def untracked(): 
+        listed.clear()
+        git.status()
+        return capsys.readouterr().out.split("Untracked files:")[1].split()
+
+    assert untracked() == [".gitignore", "sub/u.txt", "sub/deep/v.txt"] and listed == ["", "sub/", "sub/deep/"]
+    assert untracked() == [".gitignore", "sub/u.txt", "sub/deep/v.txt"] and listed == []
+    assert sorted(cache.CacheHandeler().load_cache().untracked_cache.dirs) == ["", "sub/", "sub/deep/"]
+
+    #only the directory whose mtime moved is listed again, and index changes need no listing
+    (repo / "sub/new.txt").write_text("x\n")
+    os.utime("sub", (long_ago + 10, long_ago + 10))
+    git.update_cache("sub/u.txt")
+    assert untracked() == [".gitignore", "sub/new.txt", "sub/deep/v.txt"] and listed == ["sub/"]
+
+    #new ignore rules invalidate every listing below them
+    (repo / ".gitignore").write_text("ign/\ndeep/\n")
+    assert untracked() == [".gitignore", "sub/new.txt"] and listed == ["", "sub/"]
+    assert sorted(cache.CacheHandeler().load_cache().untracked_cache.dirs) == ["", "sub/"]
+
+def test_checkout_writes_only_changed_files(repo, author, monkeypatch): 
+    for i in range(20): 
+        (repo / f"dir{i % 4}").mkdir(exist_ok=True)
+        (repo / f"dir{i % 4}/f{i}.txt").write_text(f"{i}\n")
+    git.update_cache_bulk([f"dir{i % 4}/f{i}.txt" for i in range(20)])
+    git.commit_tree(git.write_tree(), "base", [])
+    git.branch("topic")
+    make_commit(repo, "dir0/f0.txt", "changed\n")
+    make_commit(repo, "dir1/new.txt", "new\n")
+    git.rm("dir2/f2.txt", False)
+    git.commit_tree(git.write_tree(), "remove", [])
+    topic_files = {}
+    git.load_tree_into_hash(utils.extract_tree_from_commit(utils.extract_commit_from_head()), "", topic_files)
+
+    written = []
+    write = git.write_sha_into_working_tree
+    monkeypatch.setattr(git, "write_sha_into_working_tree", lambda file_path, *args: written.append(file_path) or write(file_path, *args))
+    git.checkout("master")
+    assert sorted(written) == ["dir0/f0.txt", "dir2/f2.txt"]
+    assert not os.path.exists("dir1/new.txt") and (repo / "dir0/f0.txt").read_text() == "0\n"
+
+    written.clear()
+    git.checkout("topic")
+    assert sorted(written) == ["dir0/f0.txt", "dir1/new.txt"] and not os.path.exists("dir2/f2.txt")
+
+    #the index matches the tree, with stat data and cached trees, so status has nothing to report
+    current_cache = cache.CacheHandeler().load_cache()
+    assert {x.file_path: x.sha1 for x in current_cache.contents} == topic_files
+    assert all(x.mtime_ns for x in current_cache.contents)
+    assert current_cache.tree_cache[""][0] == utils.extract_tree_from_commit(utils.extract_commit_from_head())
+    assert git.staged_changes(current_cache, utils.extract_commit_from_head()) == []
+    assert git.unstaged_changes(current_cache, cache.CacheHandeler().index_mtime_ns())[0] == []
+
+def test_checkout_writes_packed_blobs_on_a_thread_pool(repo, author, monkeypatch): 
+    names = [f"d{i % 7}/e{i % 3}/f{i}.txt" for i in range(utils.PARALLEL_CHECKOUT_THRESHOLD + 50)]
+    for i, name in enumerate(names): 
+        (repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (repo / name).write_text(f"{i}\n" * (i % 50 + 1))
+    git.update_cache_bulk(names)
+    git.commit_tree(git.write_tree(), "full", [])
+    git.branch("empty")
+    git.rm("", True)
+    git.commit_tree(git.write_tree(), "empty", [])
+    for i in range(7): 
+        shutil.rmtree(f"d{i}")
+    git.repack(True)
+    object_cache.shared.clear()
+
+    pools = []
+    class Executor(utils.ThreadPoolExecutor): 
+        def __init__(self, max_workers): 
+            pools.append(max_workers)
+            super().__init__(max_workers)
+    monkeypatch.setattr(utils, "ThreadPoolExecutor", Executor)
+    git.checkout("master", "", 4)
+    assert pools == [4]
+    for i, name in enumerate(names): 
+        assert (repo / name).read_text() == f"{i}\n" * (i % 50 + 1)
+    current_cache = cache.CacheHandeler().load_cache()
+    assert sorted(current_cache.paths) == sorted(names)
+    assert git.unstaged_changes(current_cache, cache.CacheHandeler().index_mtime_ns())[0] == []
+
+def test_sparse_checkout_keeps_excluded_directories_as_one_entry(repo, author, capsys): 
+    names = ["top.txt", "keep/a.txt", "keep/deep/b.txt", "drop/c.txt", "drop/deep/d.txt", "other/e.txt"]
+    for name in names: 
+        (repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (repo / name).write_text(f"{name}\n")
+    git.update_cache_bulk(names)
+    full_tree = git.write_tree()
+    git.commit_tree(full_tree, "base", [])
+
+    git.sparse_checkout(["keep"])
+    assert sorted(ignore.walk_files()) == ["keep/a.txt", "keep/deep/b.txt", "top.txt"]
+    assert not os.path.exists("drop") and not os.path.exists("other")
+    current_cache = cache.CacheHandeler().load_cache()
+    sparse_entries = [(x.type, x.file_path) for x in current_cache.contents if x.flags & cache.SKIP_WORKTREE]
+    assert sparse_entries == [("tree", "drop/"), ("tree", "other/")]
+    assert git.write_tree() == full_tree
+
+    #a file made inside a left out directory is not reported or staged
+    (repo / "drop").mkdir()
+    (repo / "drop/stray.txt").write_text("stray\n")
+    capsys.readouterr()
+    git.status()
+    out = capsys.readouterr().out
+    assert "stray" not in out and "deleted" not in out
+    assert sorted(git.working_tree_files()) == ["keep/a.txt", "keep/deep/b.txt", "top.txt"]
+
+    #reading the tree with the same patterns stops at the left out directories
+    fresh = cache.Cache()
+    utils.load_tree_into_cache(full_tree, "", fresh, sparse.load())
+    assert sorted(fresh.paths) == sorted([x[1] for x in sparse_entries] + ["keep/a.txt", "keep/deep/b.txt", "top.txt"])
+
+    os.remove("drop/stray.txt")
+    git.sparse_checkout(None)
+    assert sorted(ignore.walk_files()) == sorted(names)
+    assert not any(x.flags & cache.SKIP_WORKTREE for x in cache.CacheHandeler().load_cache().contents)
+    assert git.write_tree() == full_tree
+
+def test_update_cache_under_a_sparse_directory_expands_it(repo, author): 
+    names = ["top.txt", "keep/a.txt", "drop/c.txt", "drop/deep/d.txt"]
+    for name in names: 
+        (repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (repo / name).write_text(f"{name}\n")
+    git.update_cache_bulk(names)
+    git.commit_tree(git.write_tree(), "base", [])
+    git.sparse_checkout(["keep"])
+
+    (repo / "drop").mkdir()
+    (repo / "drop/x.txt").write_text("new\n")
+    git.update_cache("drop/x.txt")
+    current_cache = cache.CacheHandeler().load_cache()
+    assert current_cache.paths == ["drop/c.txt", "drop/deep/d.txt", "drop/x.txt", "keep/a.txt", "top.txt"]
+    assert (repo / "drop/deep/d.txt").read_text() == "drop/deep/d.txt\n"
+    assert [x[2] for x in git.read_tree(git.write_tree())] == ["drop", "keep", "top.txt"]
+    assert git.unstaged_changes(current_cache, cache.CacheHandeler().index_mtime_ns())[0] == []
+
+def test_merge_into_a_sparse_directory(repo, author, monkeypatch): 
+    for name in ["top.txt", "keep/a.txt", "drop/c.txt", "drop/d.txt"]: 
+        make_commit(repo, name, f"{name}\n")
+    git.branch("topic")
+    make_commit(repo, "drop/c.txt", "topic\n")
+    git.checkout("master")
+    make_commit(repo, "keep/a.txt", "master\n")
+    git.sparse_checkout(["keep"])
+    assert not os.path.exists("drop")
+
+    monkeypatch.setattr(subprocess, "Popen", None)
+    assert git.merge("topic") == 1
+    head_tree = utils.extract_tree_from_commit(utils.extract_commit_from_head())
+    assert [x[2] for x in git.read_tree(head_tree)] == ["drop", "keep", "top.txt"]
+    files = {}
+    git.load_tree_into_hash(head_tree, "", files)
+    assert {x.file_path: x.sha1 for x in cache.CacheHandeler().load_cache().contents} == files
+    assert (repo / "drop/c.txt").read_text() == "topic\n" and (repo / "drop/d.txt").read_text() == "drop/d.txt\n"
+
+    #reapplying the patterns leaves the directory out again
+    git.sparse_checkout(["keep"])
+    assert not os.path.exists("drop") and git.write_tree() == head_tree
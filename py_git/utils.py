@@ -1,18 +1,17 @@
-import subprocess
 import os
 import py_git.git as git
 import py_git.models as models
+import py_git.commit_graph as commit_graph
+import py_git.ignore as ignore
 from typing import List
-from py_git.cache import Cache, CacheHandeler
+from concurrent.futures import ThreadPoolExecutor
+from py_git.cache import Cache, CacheEntry, fill_stat, SKIP_WORKTREE
 
-def get_all_files():
-    files = []
-    for root, dirs, filenames in os.walk(os.getcwd()):
-        # Remove directories that start with a dot or are named 'py_git'
-        dirs[:] = [d for d in dirs if not d.startswith('.') and d != 'py_git']
-        for filename in filenames:
-            files.append(os.path.join(root, filename))
-    return files
+PARALLEL_CHECKOUT_THRESHOLD = 100
+
+def get_all_files() -> List[str]: 
+    #working tree files relative to the repository root, leaving out ignored paths
+    return list(ignore.walk_files())
 
 def get_rel_path(path: str): 
     cwd = os.getcwd()
@@ -58,32 +57,62 @@ def extract_commit_from_head(file_path: str = ".git/HEAD"):
 
     return current_commit_sha
 
-def extract_tree_from_commit(commit_sha: str): 
+def resolve_commit(name: str): 
+    #a branch name or a commit sha1
+    branch_file_path = ".git/refs/heads/" + name
+    if os.path.isfile(branch_file_path): 
+        with open(branch_file_path, 'r') as file: 
+            return file.read().strip()
+
+    return name
+
+def parse_commit(commit_sha: str): 
+    #(tree sha1, parent sha1s, commit time) read from the commit object itself
     delimiter = '\x1F'
     fileObject = models.ByteFile(None, None, None)
     git.cat_file(commit_sha, fileObject)
+    raw_commit_data = fileObject.content.decode("utf-8").split(delimiter)
+
+    tree_sha = raw_commit_data[0].split(" ")[1]
+    parents = [x.rstrip("\n") for x in raw_commit_data[1].split(" ")[1:] if x.rstrip("\n")]
+
+    #commits made before timestamps were recorded count as time 0
+    commit_time = 0
+    commiter_fields = raw_commit_data[3].rsplit(" ", 2)
+    if len(commiter_fields) == 3 and commiter_fields[1].isdigit(): 
+        commit_time = int(commiter_fields[1])
+
+    return (tree_sha, parents, commit_time)
+
+def lookup_commit(commit_sha: str): 
+    #the commit graph answers without inflating the commit object
+    graph = commit_graph.get_graph(git.COMMIT_GRAPH)
+    if graph: 
+        found = graph.lookup(commit_sha)
+        if found: 
+            return (found[0], found[1], found[3])
+
+    return parse_commit(commit_sha)
+
+def extract_tree_from_commit(commit_sha: str): 
+    return lookup_commit(commit_sha)[0]
 
-    raw_commit_data = fileObject.content.split(delimiter)
-    treeLine = raw_commit_data[0]
-    tree_sha = treeLine.split(" ")[1]
-    return tree_sha
+def extract_parents_from_commit(commit_sha: str): 
+    return lookup_commit(commit_sha)[1]
 
 def extract_commit_from_commit(commit_sha: str): 
     prevCommit = None
-    delimiter = '\x1F'
-    fileObject = models.ByteFile(None, None, None)
-    git.cat_file(commit_sha, fileObject)
-    raw_commit_data = fileObject.content.split(delimiter)
-    parent_commit_data = raw_commit_data[1].split(" ")
-    if len(parent_commit_data) == 2: 
-        prevCommit = parent_commit_data[1].rstrip("\n")
+    parents = extract_parents_from_commit(commit_sha)
+    if len(parents) == 1: 
+        prevCommit = parents[0]
 
     return prevCommit
 
-def load_tree_into_cache(tree_sha: str, dir_path: str, cache: CacheHandeler): 
+def load_tree_into_cache(tree_sha: str, dir_path: str, cache: Cache, patterns=None): 
+    #with sparse patterns a directory they leave out is not read, it becomes one skip-worktree entry
     fileObject = models.ByteFile(None, None, None)
     git.cat_file(tree_sha, fileObject) 
-    tree = fileObject.content.split(" ")
+    tree = fileObject.content.decode("utf-8").split(" ")
 
     n = len(tree)
     for i in range(0, n, 3):
@@ -92,30 +121,38 @@ def load_tree_into_cache(tree_sha: str, dir_path: str, cache: CacheHandeler):
         file_name = tree[i + 2]
 
         if file_type == "blob": 
-            cache.insert_cache(file_type, 0000, hash_code, dir_path + file_name)
+            cache.insert(CacheEntry(file_type, 0000, hash_code, dir_path + file_name))
 
         if file_type == "tree": 
-            load_tree_into_cache(hash_code, file_name + "/", cache)
-
-def load_cache_into_working_tree(current_cache: Cache): 
-    cache_array = current_cache.contents
-
-    for entry in cache_array: 
-        fileObject = models.ByteFile(None, None, None)   
-        git.cat_file(entry.sha1, fileObject)
-
-        directory = os.path.dirname(entry.file_path)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory)
-
-        with open(entry.file_path, "w") as file: 
-            file.write(fileObject.content)
-        
-def clear_working_tree(current_cache: Cache): 
-    cache_array = current_cache.contents
-
-    file_paths = [x.file_path for x in cache_array]
-    delete_files_and_directories(file_paths)
+            if patterns and patterns.excludes(file_name + "/"): 
+                cache.insert(CacheEntry(file_type, 0, hash_code, file_name + "/", flags=SKIP_WORKTREE))
+                cache.tree_cache[file_name] = (hash_code, 1)
+                continue
+            load_tree_into_cache(hash_code, file_name + "/", cache, patterns)
+
+    #the tree just read is by definition what write_tree would produce for it
+    lo, hi = cache.prefix_range(dir_path)
+    cache.tree_cache[dir_path.rstrip("/")] = (tree_sha, hi - lo)
+
+def load_cache_into_working_tree(entries: List[CacheEntry], jobs: int = 0): 
+    #every directory is made once up front, then the blobs are inflated and written by
+    #jobs threads, zlib and file io let go of the GIL. 0 means one thread per core, and
+    #few files are written in order since the pool would cost more than it saves.
+    #stat data is collected as files are written so the caller can save it in the index
+    for dir_path in sorted({os.path.dirname(entry.file_path) for entry in entries} - {""}): 
+        os.makedirs(dir_path, exist_ok=True)
+
+    def write(part: List[CacheEntry]) -> None: 
+        for entry in part: 
+            fill_stat(entry, git.write_sha_into_working_tree(entry.file_path, entry.sha1, False))
+
+    workers = min(jobs or os.cpu_count() or 1, len(entries))
+    if workers <= 1 or len(entries) < PARALLEL_CHECKOUT_THRESHOLD: 
+        write(entries)
+        return
+    #one slice per thread rather than a task per file
+    with ThreadPoolExecutor(max_workers=workers) as executor: 
+        list(executor.map(write, [entries[i::workers] for i in range(workers)]))
 
 def delete_files_and_directories(file_paths: List[str]):
     # Delete files first
@@ -124,8 +161,13 @@ def delete_files_and_directories(file_paths: List[str]):
             os.remove(file_path)
             
     # Identify directories and sort them in reverse order
-    # so that nested directories get deleted first
-    directories = set(os.path.dirname(file_path) for file_path in file_paths)
+    # so that nested directories get deleted first, parents left empty go too
+    directories = set()
+    for file_path in file_paths: 
+        directory = os.path.dirname(file_path)
+        while directory and directory not in directories: 
+            directories.add(directory)
+            directory = os.path.dirname(directory)
     sorted_directories = sorted(directories, key=len, reverse=True)
     
     # Delete directories
@@ -135,40 +177,3 @@ def delete_files_and_directories(file_paths: List[str]):
                 os.rmdir(directory)  # Remove empty directories
             except OSError:
                 continue
-
-def run_diff_with_diffstat(file1: str, file2: str):
-    try:
-        # Run the 'diff' command and pipe its output to 'diffstat'
-        process_diff = subprocess.Popen(["diff", "-u", file1, file2], stdout=subprocess.PIPE, text=True)
-        process_diffstat = subprocess.Popen(["diffstat"], stdin=process_diff.stdout, stdout=subprocess.PIPE, text=True)
-        
-        # Allow process_diff to receive a SIGPIPE if process_diffstat exits
-        process_diff.stdout.close()
-        
-        # Capture the output of 'diffstat'
-        output = process_diffstat.communicate()[0]
-        
-        return output.rstrip('\n')
-    except subprocess.CalledProcessError as e:
-        return e.stdout
-
-def run_diff(file1: str, file2: str, filename1: str, filename2: str):
-    try:
-        # Run the 'diff' command
-        process_diff = subprocess.Popen(["diff", "-u", file1, file2], stdout=subprocess.PIPE, text=True)
-
-        # Capture the output of 'diff'
-        output, _ = process_diff.communicate()
-
-        # Remove first two lines and add custom lines 
-        lines = output.splitlines()
-        base = f"diff --git a/{filename1} b/{filename2}\n"
-        from_file = f"-- a/{filename1}\n"
-        to_file = f"++ b/{filename2}\n"
-        git_line = (base + from_file + to_file)  
-        modified_output = git_line + '\n'.join(lines[2:])
-
-        return modified_output.rstrip('\n')
-    except subprocess.CalledProcessError as e:
-        return e.stdout
-
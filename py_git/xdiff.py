@@ -0,0 +1,287 @@
+from typing import List, Tuple
+
+CONTEXT = 3
+#like diff, a NUL byte this early marks the content as binary
+BINARY_CHECK_SIZE = 8000
+
+def split_lines(data: bytes) -> List[bytes]:
+    #lines keep their newline, only b"\n" ends a line
+    lines = data.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+        return [x + b"\n" for x in lines]
+    return [x + b"\n" for x in lines[:-1]] + [lines[-1]]
+
+def is_binary(data: bytes) -> bool:
+    return b"\0" in data[:BINARY_CHECK_SIZE]
+
+def bisect(a: list, alo: int, ahi: int, b: list, blo: int, bhi: int):
+    #myers' middle snake search from both ends at once in linear space.
+    #returns a point on a shortest edit path, or None when nothing matches
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    forward = [-1] * size
+    backward = [-1] * size
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    #with an odd delta the paths meet while stepping forward, otherwise backward
+    front = delta & 1
+    k1start = k1end = k2start = k2end = 0
+
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < size and backward[k2_offset] != -1 and x1 >= n - backward[k2_offset]:
+                    return (alo + x1, blo + y1)
+
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and backward[k2_offset - 1] < backward[k2_offset + 1]):
+                x2 = backward[k2_offset + 1]
+            else:
+                x2 = backward[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            backward[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < size and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return (alo + x1, blo + y1)
+    return None
+
+def mark_changes(a: list, b: list) -> Tuple[List[bool], List[bool]]:
+    #flags every line of a that is deleted and every line of b that is inserted.
+    #a line with no equal in the other file is always a change, so only the rest
+    #go through the search, which keeps typical edits close to linear
+    in_a, in_b = set(a), set(b)
+    changed_a = [x not in in_b for x in a]
+    changed_b = [x not in in_a for x in b]
+    keep_a = [i for i, changed in enumerate(changed_a) if not changed]
+    keep_b = [j for j, changed in enumerate(changed_b) if not changed]
+    search_a, search_b = search([a[i] for i in keep_a], [b[j] for j in keep_b])
+    for k, changed in enumerate(search_a):
+        if changed:
+            changed_a[keep_a[k]] = True
+    for k, changed in enumerate(search_b):
+        if changed:
+            changed_b[keep_b[k]] = True
+    return (changed_a, changed_b)
+
+def search(a: list, b: list) -> Tuple[List[bool], List[bool]]:
+    changed_a = [False] * len(a)
+    changed_b = [False] * len(b)
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+
+        split = bisect(a, alo, ahi, b, blo, bhi) if alo < ahi and blo < bhi else None
+        if split is None:
+            changed_a[alo:ahi] = [True] * (ahi - alo)
+            changed_b[blo:bhi] = [True] * (bhi - blo)
+            continue
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+    return (changed_a, changed_b)
+
+class Group():
+    """A run of changed lines, possibly empty, between two unchanged lines.
+
+    Unchanged lines pair up in order across both files, so the nth group of
+    one file always corresponds to the nth group of the other."""
+    def __init__(self, changed: List[bool]) -> None:
+        self.changed = changed
+        self.start = 0
+        self.end = 0
+        while self.end < len(changed) and changed[self.end]:
+            self.end += 1
+
+    def next(self) -> bool:
+        if self.end == len(self.changed):
+            return False
+        self.start = self.end + 1
+        self.end = self.start
+        while self.end < len(self.changed) and self.changed[self.end]:
+            self.end += 1
+        return True
+
+    def previous(self) -> bool:
+        if self.start == 0:
+            return False
+        self.end = self.start - 1
+        self.start = self.end
+        while self.start > 0 and self.changed[self.start - 1]:
+            self.start -= 1
+        return True
+
+    def skip_unchanged(self, count: int) -> None:
+        #moves an empty group past count unchanged lines, the same as count calls to next
+        self.start = self.end = self.end + count
+        while self.end < len(self.changed) and self.changed[self.end]:
+            self.end += 1
+
+    def unchanged_ahead(self) -> int:
+        #unchanged lines left before the next change
+        try:
+            return self.changed.index(True, self.end) - self.end
+        except ValueError:
+            return len(self.changed) - self.end
+
+    def slide_down(self, lines: list) -> bool:
+        if self.end == len(lines) or lines[self.start] != lines[self.end]:
+            return False
+        self.changed[self.start] = False
+        self.changed[self.end] = True
+        self.start += 1
+        self.end += 1
+        while self.end < len(self.changed) and self.changed[self.end]:
+            self.end += 1
+        return True
+
+    def slide_up(self, lines: list) -> bool:
+        if self.start == 0 or lines[self.start - 1] != lines[self.end - 1]:
+            return False
+        self.start -= 1
+        self.end -= 1
+        self.changed[self.start] = True
+        self.changed[self.end] = False
+        while self.start > 0 and self.changed[self.start - 1]:
+            self.start -= 1
+        return True
+
+def compact(lines: list, changed: List[bool], other_changed: List[bool]) -> None:
+    #an ambiguous run of changes, like one of several equal lines removed, is moved as
+    #far down as it goes unless it can line up with a change in the other file
+    group = Group(changed)
+    other = Group(other_changed)
+    while True:
+        if group.end == group.start and other.end == other.start:
+            count = min(group.unchanged_ahead(), other.unchanged_ahead())
+            group.skip_unchanged(count)
+            other.skip_unchanged(count)
+
+        if group.end != group.start:
+            while True:
+                size = group.end - group.start
+                end_matching_other = -1
+                while group.slide_up(lines):
+                    other.previous()
+                earliest_end = group.end
+                if other.end > other.start:
+                    end_matching_other = group.end
+                while group.slide_down(lines):
+                    other.next()
+                    if other.end > other.start:
+                        end_matching_other = group.end
+                if size == group.end - group.start:
+                    break
+
+            if group.end != earliest_end and end_matching_other != -1:
+                while other.end == other.start:
+                    group.slide_up(lines)
+                    other.previous()
+
+        if not group.next():
+            break
+        other.next()
+
+def diff_lines(a: list, b: list) -> List[Tuple[int, int, int, int]]:
+    #changed regions as (a start, a end, b start, b end), in order
+    changed_a, changed_b = mark_changes(a, b)
+    compact(a, changed_a, changed_b)
+    compact(b, changed_b, changed_a)
+
+    changes = []
+    group = Group(changed_a)
+    other = Group(changed_b)
+    while True:
+        if group.end == group.start and other.end == other.start:
+            count = min(group.unchanged_ahead(), other.unchanged_ahead())
+            group.skip_unchanged(count)
+            other.skip_unchanged(count)
+        if group.end != group.start or other.end != other.start:
+            changes.append((group.start, group.end, other.start, other.end))
+        if not group.next():
+            break
+        other.next()
+    return changes
+
+def hunk_range(start: int, count: int) -> str:
+    #an empty range is named by the line before it
+    if count == 0:
+        return f"{start},0"
+    if count == 1:
+        return f"{start + 1}"
+    return f"{start + 1},{count}"
+
+def unified_hunks(a: List[bytes], b: List[bytes], context: int = CONTEXT) -> List[str]:
+    changes = diff_lines(a, b)
+    output = []
+    k = 0
+    while k < len(changes):
+        #changes closer than two contexts apart share a hunk
+        last = k
+        while last + 1 < len(changes) and changes[last + 1][0] - changes[last][1] <= 2 * context:
+            last += 1
+
+        a_start = max(0, changes[k][0] - context)
+        b_start = changes[k][2] - (changes[k][0] - a_start)
+        a_end = min(len(a), changes[last][1] + context)
+        b_end = changes[last][3] + (a_end - changes[last][1])
+        output.append(f"@@ -{hunk_range(a_start, a_end - a_start)} +{hunk_range(b_start, b_end - b_start)} @@")
+
+        i = a_start
+        for i0, i1, j0, j1 in changes[k:last + 1]:
+            output += [" " + line_text(x) for x in a[i:i0]]
+            output += ["-" + line_text(x) for x in a[i0:i1]]
+            output += ["+" + line_text(x) for x in b[j0:j1]]
+            i = i1
+        output += [" " + line_text(x) for x in a[i:a_end]]
+        k = last + 1
+    return output
+
+def line_text(line: bytes) -> str:
+    text = line.decode("utf-8", "replace")
+    if text.endswith("\n"):
+        return text[:-1]
+    return text + "\n\\ No newline at end of file"
+
+def unified_diff(a: bytes, b: bytes, filename1: str, filename2: str, context: int = CONTEXT) -> str:
+    #the git style header followed by diff -u hunks, binary content only gets the header
+    header = f"diff --git a/{filename1} b/{filename2}\n-- a/{filename1}\n++ b/{filename2}"
+    if a == b or is_binary(a) or is_binary(b):
+        return header
+    return "\n".join([header] + unified_hunks(split_lines(a), split_lines(b), context))
@@ -0,0 +1,90 @@
+import py_git.xdiff as xdiff
+from typing import List, Tuple
+
+MARKER_SIZE = 7
+
+def changed_regions(base: List[bytes], ours: List[bytes], theirs: List[bytes]):
+    #groups the changes of both sides that overlap or touch in the base, yielding
+    #(base start, base end, ours start, ours end, theirs start, theirs end, sides changed)
+    changes = [(i0, i1, j0, j1, 0) for i0, i1, j0, j1 in xdiff.diff_lines(base, ours)]
+    changes += [(i0, i1, j0, j1, 1) for i0, i1, j0, j1 in xdiff.diff_lines(base, theirs)]
+    changes.sort()
+
+    k = 0
+    while k < len(changes):
+        first = {}
+        last = {}
+        start, end = changes[k][0], changes[k][1]
+        while k < len(changes) and changes[k][0] <= end:
+            i0, i1, j0, j1, side = changes[k]
+            first.setdefault(side, changes[k])
+            last[side] = changes[k]
+            end = max(end, i1)
+            k += 1
+
+        ranges = []
+        for side in (0, 1):
+            if side not in first:
+                #this side kept the base lines, which sit at the same offset from its last change
+                ranges.append(None)
+                continue
+            ranges.append((first[side][2] - (first[side][0] - start), last[side][3] + (end - last[side][1])))
+        yield (start, end, ranges[0], ranges[1])
+
+def conflict_lines(lines: List[bytes]) -> List[bytes]:
+    #a marker must start on a line of its own
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+def merge3(base: bytes, ours: bytes, theirs: bytes, ours_label: str = "ours", theirs_label: str = "theirs") -> Tuple[bytes, int]:
+    #diff3 style merge of two descendants of base, returns the merged content and
+    #the number of conflicts, each written between standard conflict markers
+    if ours == theirs or base == theirs:
+        return (ours, 0)
+    if base == ours:
+        return (theirs, 0)
+
+    base_lines = xdiff.split_lines(base)
+    our_lines = xdiff.split_lines(ours)
+    their_lines = xdiff.split_lines(theirs)
+
+    output = []
+    conflicts = 0
+    position = 0
+    for start, end, our_range, their_range in changed_regions(base_lines, our_lines, their_lines):
+        output += base_lines[position:start]
+        position = end
+
+        if their_range is None:
+            output += our_lines[our_range[0]:our_range[1]]
+            continue
+        if our_range is None:
+            output += their_lines[their_range[0]:their_range[1]]
+            continue
+
+        ours_part = our_lines[our_range[0]:our_range[1]]
+        theirs_part = their_lines[their_range[0]:their_range[1]]
+        if ours_part == theirs_part:
+            output += ours_part
+            continue
+
+        #lines both sides agree on at either end stay outside the markers
+        head = 0
+        while head < min(len(ours_part), len(theirs_part)) and ours_part[head] == theirs_part[head]:
+            head += 1
+        tail = 0
+        while tail < min(len(ours_part), len(theirs_part)) - head and ours_part[-1 - tail] == theirs_part[-1 - tail]:
+            tail += 1
+
+        conflicts += 1
+        output += ours_part[:head]
+        output.append(b"<" * MARKER_SIZE + f" {ours_label}\n".encode())
+        output += conflict_lines(ours_part[head:len(ours_part) - tail])
+        output.append(b"=" * MARKER_SIZE + b"\n")
+        output += conflict_lines(theirs_part[head:len(theirs_part) - tail])
+        output.append(b">" * MARKER_SIZE + f" {theirs_label}\n".encode())
+        output += ours_part[len(ours_part) - tail:]
+
+    output += base_lines[position:]
+    return (b"".join(output), conflicts)